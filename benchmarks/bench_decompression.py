@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark decode and FASTQ parsing throughput of gzip, zstd, bzip2 and xz compressed reads.
+
+Reads are simulated (see `bio_hansel.simulate`) from a genome of realistic size, compressed with each format's
+command line tool at its default level and read back with the external decompression command (as files are by
+`bio_hansel.parsers.parse_fastq`) and with the in-process Python decoder (as standard input and named pipes are).
+Formats whose compression command is not installed are skipped. Throughput is in MB of uncompressed FASTQ per second.
+
+Usage:
+    python benchmarks/bench_decompression.py --reads 300000 --repeats 3
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Tuple
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT_DIR)
+
+# format, filename extension and compression command
+COMPRESSORS = [('gzip', 'gz', ['gzip', '-c']),
+               ('zstd', 'zst', ['zstd', '-q', '-c']),
+               ('bzip2', 'bz2', ['bzip2', '-c']),
+               ('xz', 'xz', ['xz', '-c']), ]
+
+COLUMNS = ['format', 'decoder', 'compressed_mb', 'ratio', 'decode_seconds', 'decode_mb_per_s', 'parse_seconds',
+           'reads_per_s']
+
+
+def simulate_fastq(args: argparse.Namespace, path: str) -> int:
+    from bio_hansel.parsers import parse_fasta
+    from bio_hansel.simulate import simulate_genome, simulate_reads, write_fastqs
+    from bio_hansel.utils import get_scheme_fasta
+
+    genome = simulate_genome(list(parse_fasta(get_scheme_fasta(args.scheme))), args.subtype,
+                             genome_size=args.genome_size, seed=args.seed)
+    write_fastqs([path], simulate_reads(genome, args.reads * args.read_length / len(genome),
+                                        read_length=args.read_length,
+                                        error_rate=args.error_rate,
+                                        seed=args.seed))
+    return os.path.getsize(path)
+
+
+def time_decode(path: str, decoder: str, repeats: int) -> float:
+    from bio_hansel.parsers import _decompress, _text_decoder, compression_format, MAGIC_BYTES_LENGTH
+
+    with open(path, 'rb') as f:
+        compression = compression_format(f.read(MAGIC_BYTES_LENGTH))
+    start = time.perf_counter()
+    for _ in range(repeats):
+        if decoder == 'command':
+            with _decompress(path, compression) as f:
+                while f.read(1 << 20):
+                    pass
+        else:
+            with open(path, 'rb') as fbin, _text_decoder(fbin, compression) as f:
+                while f.read(1 << 20):
+                    pass
+    return (time.perf_counter() - start) / repeats
+
+
+def time_parse(path: str, repeats: int) -> Tuple[float, int]:
+    from bio_hansel.parsers import parse_fastq
+
+    n_reads = 0
+    start = time.perf_counter()
+    for _ in range(repeats):
+        n_reads = sum(1 for _ in parse_fastq(path))
+    return (time.perf_counter() - start) / repeats, n_reads
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-s', '--scheme', default='heidelberg', help='Built-in scheme name or scheme FASTA path')
+    parser.add_argument('--subtype', default='2.2.1.1.1', help='Subtype to simulate (default=2.2.1.1.1)')
+    parser.add_argument('--reads', type=int, default=300000, help='Simulated reads (default=300000)')
+    parser.add_argument('--read-length', type=int, default=150)
+    parser.add_argument('--error-rate', type=float, default=0.005)
+    parser.add_argument('--genome-size', type=int, default=5000000, help='Simulated genome size (default=5000000)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeats', type=int, default=3, help='Repeats of each benchmark (default=3)')
+    parser.add_argument('--formats', nargs='+', choices=[x for x, _, _ in COMPRESSORS],
+                        help='Compression formats to benchmark (default: all)')
+    parser.add_argument('--outdir', help='Directory for compressed inputs (default: temporary directory)')
+    args = parser.parse_args()
+    print('\t'.join(COLUMNS))
+    with tempfile.TemporaryDirectory(dir=args.outdir) as outdir:
+        fastq = os.path.join(outdir, 'reads.fastq')
+        size = simulate_fastq(args, fastq)
+        parse_seconds, n_reads = time_parse(fastq, args.repeats)
+        row = ['none', '', f'{size / 1e6:.1f}', '1.00', '', '', f'{parse_seconds:.3f}',
+               f'{n_reads / parse_seconds:.0f}']
+        print('\t'.join(row), flush=True)
+        for name, ext, command in COMPRESSORS:
+            if args.formats and name not in args.formats:
+                continue
+            if shutil.which(command[0]) is None:
+                print(f'Skipping {name}; "{command[0]}" is not installed', file=sys.stderr)
+                continue
+            path = f'{fastq}.{ext}'
+            with open(fastq, 'rb') as fin, open(path, 'wb') as fout:
+                subprocess.run(command, stdin=fin, stdout=fout, check=True)
+            compressed_size = os.path.getsize(path)
+            for decoder in ['command', 'python']:
+                try:
+                    decode_seconds = time_decode(path, decoder, args.repeats)
+                except OSError as ex:
+                    print(f'Skipping {name} {decoder} decoder: {ex}', file=sys.stderr)
+                    continue
+                parse = ['', '']
+                # files are parsed as decompressed by the external command
+                if decoder == 'command':
+                    parse_seconds, n_reads = time_parse(path, args.repeats)
+                    parse = [f'{parse_seconds:.3f}', f'{n_reads / parse_seconds:.0f}']
+                row = [name, decoder, f'{compressed_size / 1e6:.1f}', f'{size / compressed_size:.2f}',
+                       f'{decode_seconds:.3f}', f'{size / 1e6 / decode_seconds:.1f}'] + parse
+                print('\t'.join(row), flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark size and write time of the k-mer results output in TSV/JSON vs Parquet and Arrow IPC formats.
+
+The k-mer results of the test reads and contigs are replicated under different sample names to simulate large batches
+so compressed columnar output sizes are smaller than they would be for real batches.
+
+Usage:
+    python benchmarks/bench_output_formats.py --samples 1000 2000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from bio_hansel.output import KmerResultsWriter, prepare_kmer_results
+from bio_hansel.subtyper import subtype_reads, subtype_contigs
+
+TEST_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests', 'data')
+
+
+def sample_kmer_results(n_samples: int):
+    _, df_reads = subtype_reads(reads=os.path.join(TEST_DATA_DIR, 'SRR5646583_SMALL.fastq'),
+                                genome_name='reads',
+                                scheme='heidelberg')
+    _, df_contigs = subtype_contigs(fasta_path=os.path.join(TEST_DATA_DIR, 'SRR1002850_SMALL.fasta.gz'),
+                                    genome_name='contigs',
+                                    scheme='heidelberg')
+    for i in range(n_samples):
+        df = (df_reads if i % 2 == 0 else df_contigs).copy()
+        df['sample'] = f'sample-{i}'
+        yield df
+
+
+def bench_tsv(dfs, outdir: str, write_json: bool):
+    path = os.path.join(outdir, 'kmer-results.tsv')
+    start = time.perf_counter()
+    dfall = pd.concat([prepare_kmer_results(df) for df in dfs], sort=False)
+    dfall.to_csv(path, sep='\t', index=None, float_format='%.3f')
+    paths = [path]
+    if write_json:
+        json_path = path + '.json'
+        dfall.to_json(json_path, orient='records')
+        paths.append(json_path)
+    return time.perf_counter() - start, paths
+
+
+def bench_columnar(dfs, outdir: str, output_format: str, row_group_samples: int):
+    path = os.path.join(outdir, f'kmer-results.{output_format}')
+    start = time.perf_counter()
+    with KmerResultsWriter(path, output_format, row_group_samples) as writer:
+        for df in dfs:
+            writer.add({}, df)
+    return time.perf_counter() - start, [path]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--samples', type=int, nargs='+', default=[100, 1000])
+    parser.add_argument('--row-group-samples', type=int, default=100)
+    parser.add_argument('--outdir', help='Output directory (default: temporary directory)')
+    args = parser.parse_args()
+    print('samples\tformat\twrite_seconds\tsize_mb')
+    for n_samples in args.samples:
+        dfs = list(sample_kmer_results(n_samples))
+        with tempfile.TemporaryDirectory(dir=args.outdir) as outdir:
+            runs = [('tsv', lambda: bench_tsv(dfs, outdir, False)),
+                    ('tsv+json', lambda: bench_tsv(dfs, outdir, True)),
+                    ('parquet', lambda: bench_columnar(dfs, outdir, 'parquet', args.row_group_samples)),
+                    ('arrow', lambda: bench_columnar(dfs, outdir, 'arrow', args.row_group_samples)), ]
+            for name, run in runs:
+                seconds, paths = run()
+                size_mb = sum(os.path.getsize(p) for p in paths) / 1e6
+                print(f'{n_samples}\t{name}\t{seconds:.3f}\t{size_mb:.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark FASTQ parsing, k-mer matching, result processing, QC, output and end-to-end subtyping throughput on
+simulated reads and assemblies (see `bio_hansel.simulate`) at several scales.
+
+Each benchmark runs in a fresh process so that its peak RSS (including any worker processes) is measured on its own.
+For each scale (number of reads per sample), reads are simulated for a subtype of the scheme, and for end-to-end
+subtyping the simulated inputs are subtyped under several sample names. By default the simulated genome only contains
+the scheme k-mers and short spacers so read coverage increases with scale; use `--genome-size` to simulate a genome
+of realistic size instead.
+
+Usage:
+    python benchmarks/bench_pipeline.py --scheme heidelberg --subtype 2.2.1.1.1 --reads 10000 100000 --samples 8
+"""
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Any, Callable, Dict, Tuple
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT_DIR)
+
+COLUMNS = ['reads', 'benchmark', 'n', 'seconds', 'reads_per_s', 'samples_per_s', 'peak_rss_mb']
+
+
+def peak_rss_mb() -> float:
+    """Peak RSS of this process and its largest child process in MB
+
+    The high water mark in /proc/self/status is used where available since `ru_maxrss` is carried over from the
+    parent process that the benchmark process was started from.
+    """
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    try:
+        with open('/proc/self/status') as f:
+            rss_kb = next(int(x.split()[1]) for x in f if x.startswith('VmHWM:'))
+    except (OSError, StopIteration):
+        pass
+    # ru_maxrss is in KiB on Linux
+    return max(rss_kb, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 1024
+
+
+def bench_parse(inputs: Dict[str, Any], repeats: int) -> Tuple[int, int]:
+    from bio_hansel.parsers import parse_fastq
+
+    n_reads = 0
+    for _ in range(repeats):
+        for fastq in inputs['reads']:
+            n_reads += sum(1 for _ in parse_fastq(fastq))
+    return n_reads, repeats
+
+
+def bench_match(inputs: Dict[str, Any], repeats: int) -> Tuple[int, int, float]:
+    from bio_hansel.aho_corasick import find_in_fastqs
+    from bio_hansel.bundle import load_scheme
+
+    automaton = load_scheme(inputs['scheme']).automaton
+    start = time.perf_counter()
+    for _ in range(repeats):
+        find_in_fastqs(automaton, *inputs['reads'])
+    # exclude automaton building from the timed part
+    return inputs['n_reads'] * repeats, repeats, time.perf_counter() - start
+
+
+def _subtyper_and_matches(inputs: Dict[str, Any]):
+    from bio_hansel.aho_corasick import find_in_fastqs
+    from bio_hansel.subtyper import Subtyper
+
+    subtyper = Subtyper(inputs['scheme'])
+    return subtyper, find_in_fastqs(subtyper.automaton, *inputs['reads'])
+
+
+def bench_results(inputs: Dict[str, Any], repeats: int) -> Tuple[int, int, float]:
+    from bio_hansel.subtyper import reads_subtyping_results
+
+    subtyper, df = _subtyper_and_matches(inputs)
+    start = time.perf_counter()
+    for i in range(repeats):
+        reads_subtyping_results(subtyper._subtype(f'sample-{i}', inputs['reads']), df.copy(),
+                                subtyper.subtyping_params)
+    return 0, repeats, time.perf_counter() - start
+
+
+def bench_qc(inputs: Dict[str, Any], repeats: int) -> Tuple[int, int, float]:
+    from bio_hansel.qc import perform_quality_check
+    from bio_hansel.subtyper import reads_subtyping_results
+
+    subtyper, df = _subtyper_and_matches(inputs)
+    st, df = reads_subtyping_results(subtyper._subtype('sample', inputs['reads']), df, subtyper.subtyping_params)
+    df = df[df.is_kmer_freq_okay & df.is_kmer_fraction_okay]
+    start = time.perf_counter()
+    for _ in range(repeats):
+        perform_quality_check(st, df, subtyper.subtyping_params)
+    return 0, repeats, time.perf_counter() - start
+
+
+def bench_output(inputs: Dict[str, Any], repeats: int) -> Tuple[int, int, float]:
+    import pandas as pd
+    from bio_hansel.output import summary_record, prepare_kmer_results
+
+    subtyper = _subtyper_and_matches(inputs)[0]
+    st, df = subtyper.subtype_reads(inputs['reads'], 'sample')
+    start = time.perf_counter()
+    summaries = []
+    dfs = []
+    for i in range(repeats):
+        st.sample = f'sample-{i}'
+        summaries.append(summary_record(st))
+        df_sample = df.copy()
+        df_sample['sample'] = st.sample
+        dfs.append(prepare_kmer_results(df_sample))
+    with tempfile.TemporaryDirectory() as outdir:
+        pd.DataFrame(summaries).to_csv(os.path.join(outdir, 'summary.tsv'), sep='\t', index=None)
+        pd.concat(dfs).to_csv(os.path.join(outdir, 'kmer-results.tsv'), sep='\t', index=None, float_format='%.3f')
+    return 0, repeats, time.perf_counter() - start
+
+
+def bench_subtype_reads(inputs: Dict[str, Any], repeats: int) -> Tuple[int, int, float]:
+    from bio_hansel.subtyper import Subtyper
+
+    subtyper = Subtyper(inputs['scheme'])
+    reads = [(inputs['reads'], f'sample-{i}') for i in range(inputs['samples'])]
+    start = time.perf_counter()
+    for _ in range(repeats):
+        subtyper.subtype_samples(reads=reads, n_threads=inputs['threads'])
+    n = inputs['samples'] * repeats
+    return inputs['n_reads'] * n, n, time.perf_counter() - start
+
+
+def bench_subtype_contigs(inputs: Dict[str, Any], repeats: int) -> Tuple[int, int, float]:
+    from bio_hansel.subtyper import Subtyper
+
+    subtyper = Subtyper(inputs['scheme'])
+    genomes = [(inputs['contigs'], f'sample-{i}') for i in range(inputs['samples'])]
+    start = time.perf_counter()
+    for _ in range(repeats):
+        subtyper.subtype_samples(input_genomes=genomes, n_threads=inputs['threads'])
+    n = inputs['samples'] * repeats
+    return 0, n, time.perf_counter() - start
+
+
+# name, function returning the number of reads (0 for per-sample stages) and samples processed and optionally the
+# timed seconds
+BENCHMARKS = [('parse_fastq', bench_parse),
+              ('find_in_fastqs', bench_match),
+              ('reads_subtyping_results', bench_results),
+              ('perform_quality_check', bench_qc),
+              ('output', bench_output),
+              ('subtype_reads', bench_subtype_reads),
+              ('subtype_contigs', bench_subtype_contigs), ]
+
+
+def run_benchmark(func: Callable, inputs: Dict[str, Any], repeats: int) -> Tuple[int, int, float, float]:
+    start = time.perf_counter()
+    out = func(inputs, repeats)
+    seconds = out[2] if len(out) > 2 else time.perf_counter() - start
+    return out[0], out[1], seconds, peak_rss_mb()
+
+
+def simulate_inputs(args: argparse.Namespace, n_reads: int, outdir: str) -> Dict[str, Any]:
+    from bio_hansel.parsers import parse_fasta
+    from bio_hansel.simulate import simulate_genome, simulate_reads, simulate_contigs, write_fastqs, write_fasta
+    from bio_hansel.utils import get_scheme_fasta
+
+    genome = simulate_genome(list(parse_fasta(get_scheme_fasta(args.scheme))), args.subtype,
+                             genome_size=args.genome_size, seed=args.seed)
+    n_files = 2 if args.paired else 1
+    coverage = n_reads * args.read_length / len(genome)
+    ext = '.gz' if args.gzip else ''
+    reads = [os.path.join(outdir, f'reads-{n_reads}_{i}.fastq{ext}') for i in range(1, n_files + 1)]
+    n_written = write_fastqs(reads, simulate_reads(genome, coverage,
+                                                   read_length=args.read_length,
+                                                   error_rate=args.error_rate,
+                                                   paired=args.paired,
+                                                   seed=args.seed))
+    contigs = os.path.join(outdir, f'contigs.fasta{ext}')
+    if not os.path.exists(contigs):
+        write_fasta(contigs, simulate_contigs(genome, args.contigs, seed=args.seed))
+    return dict(scheme=args.scheme,
+                reads=reads,
+                contigs=contigs,
+                n_reads=n_written * n_files,
+                samples=args.samples,
+                threads=args.threads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-s', '--scheme', default='heidelberg', help='Built-in scheme name or scheme FASTA path')
+    parser.add_argument('--subtype', default='2.2.1.1.1', help='Subtype to simulate (default=2.2.1.1.1)')
+    parser.add_argument('--reads', type=int, nargs='+', default=[10000, 100000], help='Reads per sample scales')
+    parser.add_argument('--samples', type=int, default=8, help='Samples for end-to-end benchmarks (default=8)')
+    parser.add_argument('-t', '--threads', type=int, default=1, help='Subtyping processes (default=1)')
+    parser.add_argument('--repeats', type=int, default=3, help='Repeats of each benchmark (default=3)')
+    parser.add_argument('--read-length', type=int, default=150)
+    parser.add_argument('--error-rate', type=float, default=0.005)
+    parser.add_argument('--paired', action='store_true')
+    parser.add_argument('--gzip', action='store_true', help='Benchmark gzipped inputs')
+    parser.add_argument('--genome-size',
+                        type=int,
+                        help='Simulated genome size (default: scheme k-mers with 100 bp spacers so that k-mer coverage '
+                             'is realistic at the default scales)')
+    parser.add_argument('--contigs', type=int, default=50, help='Simulated assembly contigs (default=50)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--benchmarks', nargs='+', choices=[x for x, _ in BENCHMARKS],
+                        help='Benchmarks to run (default: all)')
+    parser.add_argument('--outdir', help='Directory for simulated inputs (default: temporary directory)')
+    args = parser.parse_args()
+    benchmarks = [(x, f) for x, f in BENCHMARKS if not args.benchmarks or x in args.benchmarks]
+    print('\t'.join(COLUMNS))
+    with tempfile.TemporaryDirectory(dir=args.outdir) as outdir:
+        for n_reads in args.reads:
+            inputs = simulate_inputs(args, n_reads, outdir)
+            for name, func in benchmarks:
+                with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+                    reads, samples, seconds, rss = executor.submit(run_benchmark, func, inputs, args.repeats).result()
+                row = [n_reads, name, samples, f'{seconds:.4f}',
+                       f'{reads / seconds:.0f}' if reads else '',
+                       f'{samples / seconds:.2f}', f'{rss:.1f}']
+                print('\t'.join(str(x) for x in row), flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark import and CLI startup times and check them against time budgets.
+
+Each command is run in a fresh interpreter several times and the fastest run, less the startup time of a bare
+interpreter, is compared with its budget. Exits with status 1 if any budget is exceeded.
+
+Usage:
+    python benchmarks/bench_startup.py --repeats 10 --budget-scale 2.0
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# name, Python code run in a fresh interpreter, time budget in milliseconds over bare interpreter startup
+STARTUP_BUDGETS = [('import bio_hansel', 'import bio_hansel', 20),
+                   ('import bio_hansel.subtyper', 'import bio_hansel.subtyper', 1000),
+                   ('import bio_hansel.main', 'import bio_hansel.main', 150),
+                   ('hansel --version', 'import sys; sys.argv = ["hansel", "--version"]; '
+                                        'from bio_hansel.main import main; main()', 150), ]
+
+
+def min_run_seconds(code: str, repeats: int) -> float:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT_DIR, os.environ.get('PYTHONPATH', '')]))
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], env=env, check=False, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--budget-scale',
+                        type=float,
+                        default=1.0,
+                        help='Multiply time budgets by this factor, e.g. for slow machines (default=1.0)')
+    args = parser.parse_args()
+    baseline = min_run_seconds('pass', args.repeats)
+    print(f'# bare interpreter startup: {baseline * 1000:.1f} ms')
+    print('command\tms\tbudget_ms\tok')
+    failed = []
+    for name, code, budget_ms in STARTUP_BUDGETS:
+        ms = (min_run_seconds(code, args.repeats) - baseline) * 1000
+        budget_ms *= args.budget_scale
+        ok = ms <= budget_ms
+        if not ok:
+            failed.append(name)
+        print(f'{name}\t{ms:.1f}\t{budget_ms:.0f}\t{ok}')
+    if failed:
+        print(f'Startup time budgets exceeded: {", ".join(failed)}', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
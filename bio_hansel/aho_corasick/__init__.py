@@ -1,11 +1,15 @@
 # -*- coding: utf-8 -*-
 
 from collections import defaultdict
+from typing import Dict, Iterable, Iterator, Tuple
 
 import pandas as pd
 from ahocorasick import Automaton
 
 from ..parsers import parse_fasta, parse_fastq
+from ..profiling import count, stage, timed_iter
+from ..pipeline import pipelined, prefetch_files
+from ..progress import progress_iter
 from ..utils import revcomp, expand_degenerate_bases
 
 
@@ -15,15 +19,51 @@ def init_automaton(scheme_fasta):
     Args:
         scheme_fasta: SNV scheme fasta file path
 
+    Returns:
+         Aho-Corasick Automaton with kmers loaded
+    """
+    return init_automaton_from_kmers(parse_fasta(scheme_fasta))
+
+
+def init_automaton_from_kmers(kmers: Iterable[Tuple[str, str]]) -> Automaton:
+    """Initialize Aho-Corasick Automaton with scheme kmers
+
+    Args:
+        kmers: Scheme kmer headers and sequences
+
+    Returns:
+         Aho-Corasick Automaton with kmers loaded
+    """
+    return init_automaton_from_expanded_kmers(expanded_kmers(kmers))
+
+
+def expanded_kmers(kmers: Iterable[Tuple[str, str]]) -> Iterator[Tuple[str, str]]:
+    """Expand degenerate bases in scheme kmers
+
+    Args:
+        kmers: Scheme kmer headers and sequences
+
+    Yields:
+        Scheme kmer header and each non-degenerate kmer sequence
+    """
+    for header, sequence in kmers:
+        for seq in expand_degenerate_bases(sequence):
+            yield header, seq
+
+
+def init_automaton_from_expanded_kmers(kmers: Iterable[Tuple[str, str]]) -> Automaton:
+    """Initialize Aho-Corasick Automaton with non-degenerate scheme kmers and their reverse complements
+
+    Args:
+        kmers: Scheme kmer headers and non-degenerate kmer sequences (see `expanded_kmers`)
+
     Returns:
          Aho-Corasick Automaton with kmers loaded
     """
     A = Automaton()
-    for header, sequence in parse_fasta(scheme_fasta):
-        kmer_list = expand_degenerate_bases(sequence)
-        for seq in kmer_list:
-            A.add_word(seq, (header, seq, False))
-            A.add_word(revcomp(seq), (header, seq, True))
+    for header, seq in kmers:
+        A.add_word(seq, (header, seq, False))
+        A.add_word(revcomp(seq), (header, seq, True))
     A.make_automaton()
     return A
 
@@ -39,11 +79,23 @@ def find_in_fasta(automaton: Automaton, fasta: str) -> pd.DataFrame:
         Dataframe with any matches found in input fasta file
     """
     res = []
-    for contig_header, sequence in parse_fasta(fasta):
-        for idx, (kmername, kmer_seq, is_revcomp) in automaton.iter(sequence):
-            res.append((kmername, kmer_seq, is_revcomp, contig_header, idx))
-    columns = ['kmername', 'seq', 'is_revcomp', 'contig_id', 'match_index']
-    return pd.DataFrame(res, columns=columns)
+    n_contigs = 0
+    with stage('match'):
+        contigs = timed_iter(progress_iter(pipelined(parse_fasta(fasta))), 'parse')
+        for n_contigs, (contig_header, sequence) in enumerate(contigs, start=1):
+            for idx, (kmername, kmer_seq, is_revcomp) in automaton.iter(sequence):
+                res.append((kmername, kmer_seq, is_revcomp, contig_header, idx))
+        count('sequences', n_contigs)
+        count('kmer_hits', len(res))
+        columns = ['kmername', 'seq', 'is_revcomp', 'contig_id', 'match_index']
+        return pd.DataFrame(res, columns=columns)
+
+
+def _iter_fastqs_reads(fastqs: Tuple[str, ...]) -> Iterator[Tuple[str, str]]:
+    for i, fastq in enumerate(fastqs):
+        # start reading the next file (e.g. reverse reads) into the page cache while this one is matched
+        prefetch_files(fastqs[i + 1:i + 2])
+        yield from parse_fastq(fastq)
 
 
 def find_in_fastqs(automaton: Automaton, *fastqs):
@@ -57,10 +109,28 @@ def find_in_fastqs(automaton: Automaton, *fastqs):
         Dataframe with any matches found in input fastq files
     """
     kmer_seq_counts = defaultdict(int)
-    for fastq in fastqs:
-        for _, sequence in parse_fastq(fastq):
+    with stage('match'):
+        n_reads = 0
+        # reads of all files (e.g. forward and reverse reads of each lane) are counted in one pass
+        reads = timed_iter(progress_iter(pipelined(_iter_fastqs_reads(fastqs))), 'parse')
+        for n_reads, (_, sequence) in enumerate(reads, start=1):
             for idx, (_, kmer_seq, _) in automaton.iter(sequence):
                 kmer_seq_counts[kmer_seq] += 1
+        count('sequences', n_reads)
+        count('kmer_hits', sum(kmer_seq_counts.values()))
+        return kmer_counts_table(automaton, kmer_seq_counts)
+
+
+def kmer_counts_table(automaton: Automaton, kmer_seq_counts: Dict[str, int]) -> pd.DataFrame:
+    """Get a table of scheme kmer frequencies from counts of matched kmer sequences
+
+    Args:
+        automaton: Aho-Corasick Automaton with scheme SNV target kmers loaded
+        kmer_seq_counts: Matched kmer sequence to number of matches
+
+    Returns:
+        Dataframe with the kmer name, sequence and frequency of each matched kmer sequence
+    """
     res = []
     for kmer_seq, freq in kmer_seq_counts.items():
         kmername, sequence, _ = automaton.get(kmer_seq)
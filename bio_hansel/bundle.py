@@ -0,0 +1,403 @@
+# -*- coding: utf-8 -*-
+"""
+Precompiled binary scheme bundles.
+
+A scheme bundle holds everything needed to subtype with a scheme in one file so that the scheme FASTA does not need to
+be parsed (once each for the subtype counts, the degenerate k-mer check and the k-mer automaton) for every run or
+sample:
+
+- the scheme k-mers and the expanded, non-degenerate k-mer index used to build the Aho-Corasick automaton
+- integer lookup tables of the reference position, subtype and positive/negative status of each k-mer
+- `SubtypeCounts` for each subtype and the subtype hierarchy
+- optional subtype metadata table
+
+File layout (little-endian)::
+
+    magic (8 bytes) | format version (uint32) | header length (uint32) | JSON header | sections
+
+Each section starts on an 8-byte boundary and its offset and length are listed in the JSON header. Integer lookup tables
+are read with `numpy.frombuffer` from a read-only memory map of the bundle so that worker processes share their pages.
+Only these numpy tables are shared: the k-mer text sections are decoded into Python lists and the subtype counts,
+hierarchy and metadata are parsed by each process that loads the bundle.
+
+The Aho-Corasick automaton itself is rebuilt from the stored k-mer index on load rather than stored pickled since
+unpickling executes arbitrary code from the bundle and pickled automatons are tied to the pyahocorasick build, so a
+bundle saves parsing and expanding the scheme FASTA but not building the automaton.
+"""
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import attr
+import numpy as np
+
+from . import __version__
+from .aho_corasick import init_automaton_from_expanded_kmers, expanded_kmers
+from .const import SCHEME_FASTAS
+from .parsers import parse_fasta
+from .subtype_stats import SubtypeCounts, subtype_counts_from_kmers, kmer_set_digest_from_kmers
+from .utils import get_scheme_fasta, get_scheme_version
+
+BUNDLE_MAGIC = b'BHSCHEME'
+BUNDLE_FORMAT_VERSION = 1
+BUNDLE_FILENAME = 'scheme.bundle'
+_PREAMBLE = struct.Struct('<8sII')
+_ALIGNMENT = 8
+# integer lookup table sections and their dtypes
+ARRAY_SECTIONS = {'kmer_refposition': '<i8',
+                  'kmer_subtype': '<i4',
+                  'kmer_is_positive': 'u1',
+                  'expanded_kmer_index': '<i4', }
+
+
+class BundleError(ValueError):
+    """Invalid or incompatible scheme bundle"""
+
+
+@attr.s
+class SchemeBundle(object):
+    """Compiled subtyping scheme"""
+    # scheme k-mer headers and sequences in scheme FASTA order
+    kmers = attr.ib()  # type: List[Tuple[str, str]]
+    kmer_set = attr.ib()  # type: str
+    subtype_counts = attr.ib()  # type: Dict[str, SubtypeCounts]
+    # subtype to parent subtype
+    hierarchy = attr.ib()  # type: Dict[str, Optional[str]]
+    # all subtypes of scheme k-mers, indexed by `kmer_subtype`
+    subtypes = attr.ib()  # type: List[str]
+    kmer_refposition = attr.ib()  # type: np.ndarray
+    kmer_subtype = attr.ib()  # type: np.ndarray
+    kmer_is_positive = attr.ib()  # type: np.ndarray
+    # non-degenerate k-mer sequences and the index of the scheme k-mer each was expanded from
+    expanded_kmers = attr.ib()  # type: List[str]
+    expanded_kmer_index = attr.ib()  # type: np.ndarray
+    scheme_version = attr.ib(default=None)  # type: Optional[str]
+    # tab-delimited subtype metadata table
+    metadata = attr.ib(default=None)  # type: Optional[str]
+    # SHA-256 hex digest of the scheme FASTA the bundle was compiled from
+    source_sha256 = attr.ib(default=None)  # type: Optional[str]
+    path = attr.ib(default=None)  # type: Optional[str]
+    _automaton = attr.ib(default=None, repr=False)
+
+    @property
+    def n_expanded_kmers(self) -> int:
+        return len(self.expanded_kmers)
+
+    @property
+    def automaton(self):
+        """Aho-Corasick automaton of the scheme k-mers, built on first use"""
+        if self._automaton is None:
+            headers = [header for header, _ in self.kmers]
+            self._automaton = init_automaton_from_expanded_kmers(
+                (headers[i], seq) for i, seq in zip(self.expanded_kmer_index.tolist(), self.expanded_kmers))
+        return self._automaton
+
+    def metadata_table(self):
+        """Get the subtype metadata table as a DataFrame or None if the bundle has no metadata"""
+        if not self.metadata:
+            return None
+        from .metadata import parse_metadata_table
+        return parse_metadata_table(self.metadata, self.path or 'scheme bundle')
+
+
+def file_sha256(path: str) -> str:
+    stat = os.stat(path)
+    return _file_sha256(path, stat.st_mtime_ns, stat.st_size)
+
+
+# checksums of scheme FASTAs checked against their bundle on each load are cached until the file changes
+@lru_cache(maxsize=64)
+def _file_sha256(path: str, mtime_ns: int, size: int) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def subtype_parent(subtype: str) -> Optional[str]:
+    return subtype.rsplit('.', 1)[0] if '.' in subtype else None
+
+
+def compile_scheme(kmers: List[Tuple[str, str]],
+                   scheme: str = 'scheme',
+                   scheme_version: Optional[str] = None,
+                   metadata: Optional[str] = None,
+                   source_sha256: Optional[str] = None) -> SchemeBundle:
+    """Compile scheme k-mers into a scheme bundle
+
+    Args:
+        kmers: Scheme k-mer headers and sequences
+        scheme: Scheme name or path for log messages
+        scheme_version: Scheme version
+        metadata: Tab-delimited subtype metadata table
+        source_sha256: SHA-256 hex digest of the scheme FASTA
+
+    Returns:
+        SchemeBundle
+    """
+    counts = subtype_counts_from_kmers(kmers, scheme)
+    refpositions = []
+    kmer_subtypes = []
+    is_positive = []
+    for header, _ in kmers:
+        refposition, subtype = header.split('-')
+        is_positive.append('negative' not in refposition)
+        refpositions.append(int(refposition.replace('negative', '')))
+        kmer_subtypes.append(subtype)
+    subtypes = sorted(set(kmer_subtypes) | set(counts.keys()))
+    subtype_index = {subtype: i for i, subtype in enumerate(subtypes)}
+    header_index = {header: i for i, (header, _) in enumerate(kmers)}
+    expanded = list(expanded_kmers(kmers))
+    return SchemeBundle(kmers=list(kmers),
+                        kmer_set=kmer_set_digest_from_kmers(kmers),
+                        subtype_counts=counts,
+                        hierarchy={subtype: subtype_parent(subtype) for subtype in subtypes},
+                        subtypes=subtypes,
+                        kmer_refposition=np.array(refpositions, dtype=ARRAY_SECTIONS['kmer_refposition']),
+                        kmer_subtype=np.array([subtype_index[x] for x in kmer_subtypes],
+                                              dtype=ARRAY_SECTIONS['kmer_subtype']),
+                        kmer_is_positive=np.array(is_positive, dtype=ARRAY_SECTIONS['kmer_is_positive']),
+                        expanded_kmers=[seq for _, seq in expanded],
+                        expanded_kmer_index=np.array([header_index[header] for header, _ in expanded],
+                                                     dtype=ARRAY_SECTIONS['expanded_kmer_index']),
+                        scheme_version=scheme_version,
+                        metadata=metadata,
+                        source_sha256=source_sha256)
+
+
+def compile_scheme_fasta(scheme_fasta: str,
+                         scheme_version: Optional[str] = None,
+                         metadata_path: Optional[str] = None) -> SchemeBundle:
+    """Compile a scheme FASTA into a scheme bundle
+
+    Args:
+        scheme_fasta: Scheme FASTA path
+        scheme_version: Scheme version
+        metadata_path: Subtype metadata table path (see `bio_hansel.metadata.read_metadata_table`)
+
+    Returns:
+        SchemeBundle
+    """
+    metadata = None
+    if metadata_path:
+        if metadata_path.lower().endswith(('.tsv', '.tab')):
+            with open(metadata_path) as f:
+                metadata = f.read()
+        else:
+            from .metadata import read_metadata_table
+            df_md = read_metadata_table(metadata_path)
+            if df_md is not None:
+                metadata = df_md.to_csv(sep='\t', index=False)
+    return compile_scheme(list(parse_fasta(scheme_fasta)),
+                          scheme=scheme_fasta,
+                          scheme_version=scheme_version,
+                          metadata=metadata,
+                          source_sha256=file_sha256(scheme_fasta))
+
+
+def _json_section(obj: Any) -> bytes:
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+
+def write_bundle(bundle: SchemeBundle, path: str) -> None:
+    """Write a scheme bundle file
+
+    Args:
+        bundle: Compiled scheme
+        path: Output bundle file path
+    """
+    counts = [dict(attr.asdict(x), refpositions=sorted(x.refpositions or [])) for x in bundle.subtype_counts.values()]
+    sections = [('kmers', '\n'.join(f'{header}\t{seq}' for header, seq in bundle.kmers).encode()),
+                ('expanded_kmers', '\n'.join(bundle.expanded_kmers).encode()),
+                ('subtype_counts', _json_section(counts)),
+                ('hierarchy', _json_section(bundle.hierarchy)),
+                ('subtypes', _json_section(bundle.subtypes))]
+    sections += [(name, np.ascontiguousarray(getattr(bundle, name), dtype=dtype).tobytes())
+                 for name, dtype in ARRAY_SECTIONS.items()]
+    if bundle.metadata:
+        sections.append(('metadata', bundle.metadata.encode()))
+    header = dict(format_version=BUNDLE_FORMAT_VERSION,
+                  bio_hansel_version=__version__,
+                  scheme_version=bundle.scheme_version,
+                  kmer_set=bundle.kmer_set,
+                  source_sha256=bundle.source_sha256,
+                  n_kmers=len(bundle.kmers),
+                  n_expanded_kmers=bundle.n_expanded_kmers,
+                  sections={})
+    # section offsets depend on the header length so lay out sections relative to the end of the header
+    relative_offset = 0
+    for name, data in sections:
+        header['sections'][name] = [relative_offset, len(data)]
+        relative_offset += len(data) + (-len(data) % _ALIGNMENT)
+    header_bytes = json.dumps(header).encode()
+    # reserve room for the absolute offsets which may lengthen the header
+    header_len = len(header_bytes) + 32 * len(sections)
+    data_start = _PREAMBLE.size + header_len
+    data_start += -data_start % _ALIGNMENT
+    for name in header['sections']:
+        header['sections'][name][0] += data_start
+    header_bytes = json.dumps(header).encode()
+    assert len(header_bytes) <= header_len
+    with open(path, 'wb') as f:
+        f.write(_PREAMBLE.pack(BUNDLE_MAGIC, BUNDLE_FORMAT_VERSION, header_len))
+        f.write(header_bytes.ljust(header_len))
+        f.write(b'\0' * (data_start - _PREAMBLE.size - header_len))
+        for _, data in sections:
+            f.write(data)
+            f.write(b'\0' * (-len(data) % _ALIGNMENT))
+    logging.info('Wrote scheme bundle with %s k-mers and %s subtypes to "%s"',
+                 len(bundle.kmers),
+                 len(bundle.subtype_counts),
+                 path)
+
+
+def is_bundle(path: str) -> bool:
+    """Is the file a scheme bundle?"""
+    if not os.path.isfile(path):
+        return False
+    with open(path, 'rb') as f:
+        return f.read(len(BUNDLE_MAGIC)) == BUNDLE_MAGIC
+
+
+def read_bundle_header(path: str) -> Dict[str, Any]:
+    """Read the JSON header of a scheme bundle
+
+    Raises:
+        BundleError: if the file is not a scheme bundle or its format version is not supported
+    """
+    with open(path, 'rb') as f:
+        preamble = f.read(_PREAMBLE.size)
+        if len(preamble) < _PREAMBLE.size:
+            raise BundleError(f'"{path}" is not a bio_hansel scheme bundle')
+        magic, format_version, header_len = _PREAMBLE.unpack(preamble)
+        if magic != BUNDLE_MAGIC:
+            raise BundleError(f'"{path}" is not a bio_hansel scheme bundle')
+        if format_version != BUNDLE_FORMAT_VERSION:
+            raise BundleError(f'Scheme bundle "{path}" has format version {format_version} but this version of '
+                              f'bio_hansel ({__version__}) reads format version {BUNDLE_FORMAT_VERSION}. '
+                              f'Recompile it from its scheme FASTA with "hansel-scheme compile".')
+        return json.loads(f.read(header_len))
+
+
+def read_bundle(path: str) -> SchemeBundle:
+    """Read a scheme bundle file
+
+    Args:
+        path: Scheme bundle file path
+
+    Returns:
+        SchemeBundle with integer lookup tables backed by a read-only memory map of the file
+
+    Raises:
+        BundleError: if the file is not a scheme bundle or its format version is not supported
+    """
+    header = read_bundle_header(path)
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def section(name: str) -> memoryview:
+        offset, length = header['sections'][name]
+        return memoryview(mm)[offset:offset + length]
+
+    def text_lines(name: str) -> List[str]:
+        text = section(name).tobytes().decode()
+        return text.split('\n') if text else []
+
+    arrays = {name: np.frombuffer(mm, dtype=dtype, count=header['sections'][name][1] // np.dtype(dtype).itemsize,
+                                  offset=header['sections'][name][0])
+              for name, dtype in ARRAY_SECTIONS.items()}
+    counts = {}
+    for x in json.loads(section('subtype_counts').tobytes()):
+        x['refpositions'] = set(x['refpositions'])
+        counts[x['subtype']] = SubtypeCounts(**x)
+    kmers = [tuple(line.split('\t')) for line in text_lines('kmers')]
+    metadata = section('metadata').tobytes().decode() if 'metadata' in header['sections'] else None
+    return SchemeBundle(kmers=kmers,
+                        kmer_set=header['kmer_set'],
+                        subtype_counts=counts,
+                        hierarchy=json.loads(section('hierarchy').tobytes()),
+                        subtypes=json.loads(section('subtypes').tobytes()),
+                        expanded_kmers=text_lines('expanded_kmers'),
+                        scheme_version=header['scheme_version'],
+                        metadata=metadata,
+                        source_sha256=header['source_sha256'],
+                        path=path,
+                        **arrays)
+
+
+def builtin_bundle_path(scheme: str) -> str:
+    return os.path.join(os.path.dirname(SCHEME_FASTAS[scheme]['file']), BUNDLE_FILENAME)
+
+
+def builtin_metadata_path(scheme: str) -> Optional[str]:
+    md_path = os.path.join(os.path.dirname(SCHEME_FASTAS[scheme]['file']), 'metadata.tsv')
+    return md_path if os.path.exists(md_path) else None
+
+
+def compile_builtin_scheme(scheme: str) -> SchemeBundle:
+    return compile_scheme_fasta(SCHEME_FASTAS[scheme]['file'],
+                                scheme_version=SCHEME_FASTAS[scheme]['version'],
+                                metadata_path=builtin_metadata_path(scheme))
+
+
+def _load_builtin_scheme(scheme: str) -> SchemeBundle:
+    bundle_path = builtin_bundle_path(scheme)
+    if os.path.exists(bundle_path):
+        try:
+            header = read_bundle_header(bundle_path)
+            if (header['source_sha256'] == file_sha256(SCHEME_FASTAS[scheme]['file'])
+                    and header['scheme_version'] == SCHEME_FASTAS[scheme]['version']):
+                return read_bundle(bundle_path)
+            logging.warning('Scheme bundle "%s" is out of date with its scheme FASTA; compiling scheme "%s"',
+                            bundle_path, scheme)
+        except BundleError as ex:
+            logging.warning('%s; compiling scheme "%s"', ex, scheme)
+    return compile_builtin_scheme(scheme)
+
+
+def read_scheme(scheme: str) -> SchemeBundle:
+    """Load a scheme for subtyping without caching it (see `load_scheme`)
+
+    For processes that manage the lifetime of their loaded schemes themselves (e.g. `hansel-server`).
+
+    Args:
+        scheme: Built-in scheme name, scheme bundle path or scheme FASTA path
+
+    Returns:
+        SchemeBundle
+    """
+    if scheme in SCHEME_FASTAS:
+        return _load_builtin_scheme(scheme)
+    path = get_scheme_fasta(scheme)
+    if is_bundle(path):
+        return read_bundle(path)
+    return compile_scheme_fasta(path, scheme_version=get_scheme_version(scheme))
+
+
+# bounded so that a long-running process cycling through custom schemes does not keep them all loaded
+@lru_cache(maxsize=16)
+def _load_scheme(scheme: str, path: str, mtime_ns: int) -> SchemeBundle:
+    return read_scheme(scheme)
+
+
+def load_scheme(scheme: str) -> SchemeBundle:
+    """Load a scheme for subtyping
+
+    Built-in schemes are loaded from their precompiled bundles if these are up to date with the scheme FASTA.
+    Custom schemes may be a scheme bundle or a scheme FASTA which is compiled in memory. Loaded schemes are cached
+    per process until the scheme file changes.
+
+    Args:
+        scheme: Built-in scheme name, scheme bundle path or scheme FASTA path
+
+    Returns:
+        SchemeBundle
+    """
+    path = get_scheme_fasta(scheme)
+    return _load_scheme(scheme, os.path.abspath(path), os.stat(path).st_mtime_ns)
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Durable per-sample checkpointing of subtyping results.
+
+Each completed sample is appended to a JSON Lines journal and flushed to disk so that an interrupted batch run can be
+resumed without re-subtyping completed samples. The first line of a journal is a header identifying the scheme the
+samples were subtyped with (see `JOURNAL_HEADER_FIELDS`) so that a run is only resumed with the same scheme.
+"""
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from .output import summary_record, kmer_records
+from .subtype import Subtype
+
+# header fields that must match for a run to be resumed from a journal
+JOURNAL_HEADER_FIELDS = ['scheme', 'scheme_version', 'kmer_set']
+
+
+class Journal(object):
+    """Append-only journal of per-sample subtyping results
+
+    Each line is a JSON object with the sample name, the subtyping summary record and optionally the detailed k-mer
+    subtyping results for the sample. A new journal starts with a header line with the `header` fields and whether
+    k-mer results are included.
+
+    Args:
+        path: Journal file path
+        include_kmers: Record the detailed k-mer subtyping results of each sample?
+        header: Fields identifying the scheme of the run (see `JOURNAL_HEADER_FIELDS`)
+    """
+
+    def __init__(self, path: str, include_kmers: bool = True, header: Optional[Dict[str, Any]] = None):
+        self.path = path
+        self.include_kmers = include_kmers
+        self.header = header
+        self._handle = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def open(self):
+        # a sample record may have been partially written when the previous run was killed
+        needs_newline = False
+        is_new = True
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            is_new = False
+            with open(self.path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b'\n'
+        self._handle = open(self.path, 'a')
+        if needs_newline:
+            self._handle.write('\n')
+        if is_new and self.header is not None:
+            self._write(dict(header=dict(self.header, include_kmers=self.include_kmers)))
+
+    def close(self):
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    def record(self, st: Subtype, df: Optional[pd.DataFrame]) -> None:
+        """Durably record the results for a sample
+
+        Args:
+            st: Subtype result
+            df: Detailed subtyping results
+        """
+        entry = dict(sample=st.sample, summary=summary_record(st))
+        if self.include_kmers and df is not None:
+            entry['kmers'] = kmer_records(df)
+        self._write(entry)
+
+    def _write(self, entry: Dict[str, Any]) -> None:
+        self._handle.write(json.dumps(entry, default=str) + '\n')
+        self._handle.flush()
+        os.fsync(self._handle.fileno())
+
+
+def read_journal_header(path: str) -> Optional[Dict[str, Any]]:
+    """Read the header of a journal
+
+    Args:
+        path: Journal file path
+
+    Returns:
+        Header fields or None if the journal does not exist or has no header
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        for line in f:
+            if line.strip() == '':
+                continue
+            try:
+                return json.loads(line).get('header')
+            except json.JSONDecodeError:
+                return None
+    return None
+
+
+def journal_header_mismatches(header: Dict[str, Any], expected: Dict[str, Any]) -> List[str]:
+    """Get descriptions of the `JOURNAL_HEADER_FIELDS` of a journal header that differ from those of the current run
+
+    Args:
+        header: Journal header (see `read_journal_header`)
+        expected: Header fields of the current run
+
+    Returns:
+        Description of each mismatched field
+    """
+    return [f'{x} "{header.get(x)}" != "{expected.get(x)}"' for x in JOURNAL_HEADER_FIELDS
+            if header.get(x) != expected.get(x)]
+
+
+def read_journal(path: str) -> Dict[str, Tuple[Dict[str, Any], Optional[pd.DataFrame]]]:
+    """Read completed sample results from a journal
+
+    Incomplete trailing records from an interrupted run are skipped.
+
+    Args:
+        path: Journal file path
+
+    Returns:
+        Dict of sample name to tuple of summary record and detailed subtyping results (if journaled)
+    """
+    out = {}
+    if not os.path.exists(path):
+        return out
+    with open(path) as f:
+        for i, line in enumerate(f):
+            if line.strip() == '':
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                logging.warning('Skipping incomplete record on line %s of journal "%s"', i + 1, path)
+                continue
+            if 'header' in entry:
+                continue
+            df = pd.DataFrame(entry['kmers']) if 'kmers' in entry else None
+            out[entry['sample']] = (entry['summary'], df)
+    logging.info('Read %s completed samples from journal "%s"', len(out), path)
+    return out
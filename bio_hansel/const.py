@@ -1,25 +1,26 @@
 # -*- coding: utf-8 -*-
 
+import os
 import re
 
-from pkg_resources import resource_filename
-
-from bio_hansel import program_name
 from bio_hansel.subtyping_params import SubtypingParams
 
-SCHEME_FASTAS = {'heidelberg': {'file': resource_filename(program_name, 'data/heidelberg/kmers.fasta'),
+# built-in scheme data files are installed with the package (see "package_data" in setup.py)
+SCHEME_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+SCHEME_FASTAS = {'heidelberg': {'file': os.path.join(SCHEME_DATA_DIR, 'heidelberg', 'kmers.fasta'),
                                 'version': '0.5.0',
                                 'subtyping_params': SubtypingParams(low_coverage_depth_freq=20)},
-                 'enteritidis': {'file': resource_filename(program_name, 'data/enteritidis/kmers.fasta'),
+                 'enteritidis': {'file': os.path.join(SCHEME_DATA_DIR, 'enteritidis', 'kmers.fasta'),
                                  'version': '1.0.7',
                                  'subtyping_params': SubtypingParams(low_coverage_depth_freq=20)},
-                 'typhi': {'file': resource_filename(program_name, 'data/typhi/kmers.fasta'),
+                 'typhi': {'file': os.path.join(SCHEME_DATA_DIR, 'typhi', 'kmers.fasta'),
                            'version': '1.3.0',
                            'subtyping_params': SubtypingParams(low_coverage_depth_freq=20)},
-                 'tb_lineage': {'file': resource_filename(program_name, 'data/tb_lineage/kmers.fasta'),
+                 'tb_lineage': {'file': os.path.join(SCHEME_DATA_DIR, 'tb_lineage', 'kmers.fasta'),
                                 'version': '1.0.5',
                                 'subtyping_params': SubtypingParams(low_coverage_depth_freq=20)},
-                 'typhimurium': {'file': resource_filename(program_name, 'data/typhimurium/kmers.fasta'),
+                 'typhimurium': {'file': os.path.join(SCHEME_DATA_DIR, 'typhimurium', 'kmers.fasta'),
                                  'version': '0.5.5',
                                  'subtyping_params': SubtypingParams(low_coverage_depth_freq=20)}}
 
@@ -76,13 +77,34 @@ SUBTYPE_SUMMARY_COLS = ['sample',
                         'qc_status',
                         'qc_message', ]
 
+# optional per-sample resource usage summary columns (see `bio_hansel.profiling.resource_record`)
+RESOURCE_SUMMARY_COLS = ['input_bytes',
+                         'n_sequences',
+                         'n_kmer_hits',
+                         'elapsed_seconds',
+                         'peak_rss_mb', ]
+
 SIMPLE_SUMMARY_COLS = ['sample',
                        'subtype',
                        'coverage',
                        'qc_status',
                        'qc_message', ]
 
-REGEX_FASTQ = re.compile(r'^(.+)\.(fastq|fq|fastqsanger)(\.gz)?$')
-REGEX_FASTA = re.compile(r'^.+\.(fasta|fa|fna|fas)(\.gz)?$')
+REGEX_FASTQ = re.compile(r'^(.+)\.(fastq|fq|fastqsanger)(\.(gz|zst|bz2|xz))?$')
+REGEX_FASTA = re.compile(r'^.+\.(fasta|fa|fna|fas)(\.(gz|zst|bz2|xz))?$')
+REGEX_INPUT = re.compile(f'{REGEX_FASTQ.pattern}|{REGEX_FASTA.pattern}')
+# Illumina FASTQ base filename, e.g. "sample_S1_L001_R1_001": sample name, optional sample number, optional lane,
+# read (R1/R2) or index read (I1/I2) and optional file chunk number
+REGEX_ILLUMINA_FASTQ = re.compile(r'^(?P<sample>.+?)(_S\d+)?(_L\d{3})?_(?P<read>[RI][12])(_\d{3})?$')
+
+# input path for reading sequences from standard input
+STDIN_PATH = '-'
+# formats of inputs with no filename extension to infer their format from (e.g. stdin or named pipes)
+STREAM_FORMATS = ['fasta', 'fastq']
 
 JSON_EXT_TMPL = '{}.json'
+JOURNAL_EXT_TMPL = '{}.journal.jsonl'
+
+OUTPUT_FORMATS = ['tsv', 'parquet', 'arrow']
+
+PROGRESS_MODES = ['bar', 'log']
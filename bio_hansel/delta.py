@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental re-subtyping of samples when a subtyping scheme changes version.
+
+Most k-mers are unchanged between versions of a scheme, so k-mer matches stored from a previous run (the `-O` k-mer
+results output tagged with the `kmer_set` they were counted against) are reused for unchanged k-mers and only k-mers
+added or changed in the new scheme version are searched for in the input.
+"""
+import logging
+from typing import Dict, List, Optional, Tuple, Union
+
+import attr
+import pandas as pd
+
+from .aho_corasick import init_automaton_from_kmers, find_in_fasta, find_in_fastqs
+from .bundle import load_scheme
+from .subtype import Subtype
+from .subtype_stats import SubtypeCounts
+from .subtyper import SubtypingTask, subtyping_tasks, contigs_subtyping_results, reads_subtyping_results
+from .subtyping_params import SubtypingParams
+from .utils import get_scheme_version, init_subtyping_params
+
+READS_MATCH_COLUMNS = ['kmername', 'seq', 'freq']
+CONTIGS_MATCH_COLUMNS = ['kmername', 'seq', 'is_revcomp', 'contig_id', 'match_index']
+
+
+@attr.s
+class SchemeDelta(object):
+    """Differences in k-mers between two versions of a scheme"""
+    old_kmer_set = attr.ib(validator=attr.validators.instance_of(str))
+    new_kmer_set = attr.ib(validator=attr.validators.instance_of(str))
+    # k-mer headers to sequences for k-mers added or changed in the new scheme
+    changed_kmers = attr.ib(factory=dict)  # type: Dict[str, str]
+    # k-mer headers in the old scheme that were removed or changed in the new scheme
+    stale_kmers = attr.ib(factory=set)  # type: Set[str]
+
+
+def scheme_delta(old_scheme: str, new_scheme: str) -> SchemeDelta:
+    """Find the k-mers that differ between two versions of a scheme
+
+    Args:
+        old_scheme: Previous scheme version; built-in scheme name, scheme bundle path or scheme FASTA path
+        new_scheme: New scheme version; built-in scheme name, scheme bundle path or scheme FASTA path
+
+    Returns:
+        SchemeDelta with the added or changed and removed or changed k-mers
+    """
+    old_bundle = load_scheme(old_scheme)
+    new_bundle = load_scheme(new_scheme)
+    old_kmers = dict(old_bundle.kmers)
+    new_kmers = dict(new_bundle.kmers)
+    delta = SchemeDelta(old_kmer_set=old_bundle.kmer_set,
+                        new_kmer_set=new_bundle.kmer_set,
+                        changed_kmers={h: s for h, s in new_kmers.items() if old_kmers.get(h) != s},
+                        stale_kmers={h for h, s in old_kmers.items() if new_kmers.get(h) != s})
+    logging.info('Scheme "%s" has %s added or changed k-mers and %s removed or changed k-mers relative to "%s"',
+                 new_scheme,
+                 len(delta.changed_kmers),
+                 len(delta.stale_kmers),
+                 old_scheme)
+    return delta
+
+
+def read_kmer_results(path: str, kmer_set: str) -> Dict[str, pd.DataFrame]:
+    """Read stored k-mer matches from a bio_hansel k-mer results table
+
+    Only k-mer matches tagged as being counted against the `kmer_set` are returned. Samples with no k-mer matches are
+    not returned since it cannot be determined which k-mer set they were subtyped with.
+
+    Args:
+        path: Tab-delimited k-mer results file path (`-O` output)
+        kmer_set: Digest of the k-mer set the matches must have been counted against
+
+    Returns:
+        Dict of sample name to DataFrame of k-mer matches
+    """
+    df = pd.read_csv(path, sep='\t', dtype={'sample': str, 'contig_id': str})
+    if 'kmer_set' not in df.columns:
+        logging.warning('K-mer results in "%s" are not tagged with the k-mer set they were counted against. '
+                        'All samples will be fully re-subtyped.', path)
+        return {}
+    df = df[(df['kmer_set'] == kmer_set) & ~df['kmername'].isnull()]
+    out = {sample: dfg for sample, dfg in df.groupby('sample')}
+    logging.info('Read stored k-mer matches for %s samples from "%s"', len(out), path)
+    return out
+
+
+def has_stored_matches(df: Optional[pd.DataFrame], columns: List[str]) -> bool:
+    """Are there stored k-mer matches with all the `columns` needed to reuse them?"""
+    if df is None or not all(c in df.columns for c in columns):
+        return False
+    return bool(df[columns].notnull().all().all())
+
+
+def merge_kmer_matches(df_previous: pd.DataFrame, df_delta: pd.DataFrame, delta: SchemeDelta) -> pd.DataFrame:
+    """Merge stored k-mer matches for unchanged k-mers with new matches for added or changed k-mers
+
+    Args:
+        df_previous: Stored k-mer matches counted against the old scheme
+        df_delta: K-mer matches for the added or changed k-mers of the new scheme
+        delta: Scheme k-mer differences
+
+    Returns:
+        K-mer matches for the new scheme
+    """
+    df_kept = df_previous[~df_previous['kmername'].isin(delta.stale_kmers)]
+    if df_delta is None or df_delta.shape[0] == 0:
+        return df_kept.reset_index(drop=True)
+    return pd.concat([df_kept, df_delta], ignore_index=True, sort=False)
+
+
+def delta_subtype_contigs(fasta_path: str,
+                          genome_name: str,
+                          scheme: str,
+                          delta: SchemeDelta,
+                          df_previous: pd.DataFrame,
+                          subtyping_params: Optional[SubtypingParams] = None,
+                          scheme_name: Optional[str] = None,
+                          scheme_subtype_counts: Optional[Dict[str, SubtypeCounts]] = None) \
+        -> Tuple[Subtype, pd.DataFrame]:
+    """Subtype input contigs with a new scheme version reusing stored k-mer matches for unchanged k-mers
+
+    Args:
+        fasta_path: Input FASTA file path
+        genome_name: Input genome name
+        scheme: New scheme version; built-in scheme name, scheme bundle path or scheme FASTA path
+        delta: Scheme k-mer differences between old and new scheme versions
+        df_previous: Stored k-mer matches counted against the old scheme version
+        subtyping_params: scheme specific subtyping parameters
+        scheme_name: optional scheme name
+        scheme_subtype_counts: summary information about scheme
+
+    Returns:
+        - Subtype result
+        - pd.DataFrame of detailed subtyping results
+    """
+    bundle = load_scheme(scheme)
+    if scheme_subtype_counts is None:
+        scheme_subtype_counts = bundle.subtype_counts
+    if subtyping_params is None:
+        subtyping_params = init_subtyping_params(scheme=scheme)
+    st = Subtype(sample=genome_name,
+                 file_path=fasta_path,
+                 scheme=scheme_name or scheme,
+                 scheme_version=get_scheme_version(scheme) or bundle.scheme_version,
+                 kmer_set=delta.new_kmer_set,
+                 scheme_subtype_counts=scheme_subtype_counts,
+                 input_format='fasta')
+    if delta.changed_kmers:
+        automaton = init_automaton_from_kmers(delta.changed_kmers.items())
+        df_delta = find_in_fasta(automaton, fasta_path)
+    else:
+        df_delta = pd.DataFrame(columns=CONTIGS_MATCH_COLUMNS)
+    df = merge_kmer_matches(df_previous[CONTIGS_MATCH_COLUMNS], df_delta, delta)
+    return contigs_subtyping_results(st, df, subtyping_params)
+
+
+def delta_subtype_reads(reads: Union[str, List[str]],
+                        genome_name: str,
+                        scheme: str,
+                        delta: SchemeDelta,
+                        df_previous: pd.DataFrame,
+                        scheme_name: Optional[str] = None,
+                        subtyping_params: Optional[SubtypingParams] = None,
+                        scheme_subtype_counts: Optional[Dict[str, SubtypeCounts]] = None) \
+        -> Tuple[Subtype, pd.DataFrame]:
+    """Subtype input reads with a new scheme version reusing stored k-mer frequencies for unchanged k-mers
+
+    Args:
+        reads: Input FASTQ file path(s)
+        genome_name: Input genome name
+        scheme: New scheme version; built-in scheme name, scheme bundle path or scheme FASTA path
+        delta: Scheme k-mer differences between old and new scheme versions
+        df_previous: Stored k-mer frequencies counted against the old scheme version
+        scheme_name: optional scheme name
+        subtyping_params: scheme specific subtyping parameters
+        scheme_subtype_counts: summary information about scheme
+
+    Returns:
+        - Subtype result
+        - pd.DataFrame of detailed subtyping results
+    """
+    bundle = load_scheme(scheme)
+    if scheme_subtype_counts is None:
+        scheme_subtype_counts = bundle.subtype_counts
+    if subtyping_params is None:
+        subtyping_params = init_subtyping_params(scheme=scheme)
+    st = Subtype(sample=genome_name,
+                 file_path=reads,
+                 scheme=scheme_name or scheme,
+                 scheme_version=get_scheme_version(scheme) or bundle.scheme_version,
+                 kmer_set=delta.new_kmer_set,
+                 scheme_subtype_counts=scheme_subtype_counts,
+                 input_format='fastq')
+    if delta.changed_kmers:
+        automaton = init_automaton_from_kmers(delta.changed_kmers.items())
+        if isinstance(reads, str):
+            df_delta = find_in_fastqs(automaton, reads)
+        else:
+            df_delta = find_in_fastqs(automaton, *reads)
+    else:
+        df_delta = pd.DataFrame(columns=READS_MATCH_COLUMNS)
+    df = merge_kmer_matches(df_previous[READS_MATCH_COLUMNS], df_delta, delta)
+    return reads_subtyping_results(st, df, subtyping_params)
+
+
+def delta_subtyping_tasks(input_genomes: List[Tuple[str, str]],
+                          reads: List[Tuple[List[str], str]],
+                          scheme: str,
+                          delta: SchemeDelta,
+                          previous_results: Dict[str, pd.DataFrame],
+                          scheme_name: Optional[str] = None,
+                          subtyping_params: Optional[SubtypingParams] = None,
+                          scheme_subtype_counts: Optional[Dict[str, SubtypeCounts]] = None) -> List[SubtypingTask]:
+    """Get the subtyping function and arguments to incrementally subtype each input sample with a new scheme version
+
+    Samples with stored k-mer matches counted against the old scheme version are only searched for added or changed
+    k-mers. All other samples are fully subtyped.
+
+    Args:
+        input_genomes: input genomes; tuple of FASTA file path and genome name
+        reads: input genomes; tuple of list of FASTQ file paths and genome name
+        scheme: New scheme version; built-in scheme name, scheme bundle path or scheme FASTA path
+        delta: Scheme k-mer differences between old and new scheme versions
+        previous_results: Stored k-mer matches for each sample counted against the old scheme version
+        scheme_name: optional scheme name
+        subtyping_params: scheme specific subtyping parameters
+        scheme_subtype_counts: summary information about scheme
+
+    Returns:
+        List of tuples of subtyping function and arguments
+    """
+    tasks = []
+    n_delta = 0
+    for fasta_path, genome_name in input_genomes:
+        df_previous = previous_results.get(genome_name)
+        if has_stored_matches(df_previous, CONTIGS_MATCH_COLUMNS):
+            n_delta += 1
+            tasks.append((delta_subtype_contigs, (fasta_path, genome_name, scheme, delta, df_previous,
+                                                  subtyping_params, scheme_name, scheme_subtype_counts)))
+        else:
+            tasks += subtyping_tasks([(fasta_path, genome_name)], [], scheme, scheme_name, subtyping_params,
+                                     scheme_subtype_counts)
+    for fastqs, genome_name in reads:
+        df_previous = previous_results.get(genome_name)
+        if has_stored_matches(df_previous, READS_MATCH_COLUMNS):
+            n_delta += 1
+            tasks.append((delta_subtype_reads, (fastqs, genome_name, scheme, delta, df_previous, scheme_name,
+                                                subtyping_params, scheme_subtype_counts)))
+        else:
+            tasks += subtyping_tasks([], [(fastqs, genome_name)], scheme, scheme_name, subtyping_params,
+                                     scheme_subtype_counts)
+    logging.info('Incrementally subtyping %s of %s samples; fully subtyping %s samples without stored k-mer matches',
+                 n_delta,
+                 len(tasks),
+                 len(tasks) - n_delta)
+    return tasks
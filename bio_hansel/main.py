@@ -6,30 +6,21 @@ import logging
 import os
 import re
 import sys
-from typing import Optional, List, Any, Tuple
-
-import attr
-import pandas as pd
-from pkg_resources import resource_filename
-from rich.logging import RichHandler
-
-from bio_hansel import program_desc, __version__, program_name
-from bio_hansel.const import SUBTYPE_SUMMARY_COLS, REGEX_FASTQ, REGEX_FASTA, JSON_EXT_TMPL
-from bio_hansel.metadata import read_metadata_table, merge_results_with_metadata
-from bio_hansel.subtype import Subtype
-from bio_hansel.subtype_stats import subtype_counts
-from bio_hansel.subtyper import \
-    subtype_contigs_samples, \
-    subtype_reads_samples
-import bio_hansel.utils
+from typing import Optional, List, Any, Tuple, Dict
+
+from bio_hansel import program_desc, __version__
+from bio_hansel.const import SUBTYPE_SUMMARY_COLS, REGEX_FASTQ, REGEX_FASTA, JSON_EXT_TMPL, JOURNAL_EXT_TMPL, \
+    OUTPUT_FORMATS, RESOURCE_SUMMARY_COLS, PROGRESS_MODES, STDIN_PATH, STREAM_FORMATS
+from bio_hansel.manifest import parse_shard
 
 SCRIPT_NAME = 'hansel'
 
 
 def init_console_logger(logging_verbosity=3):
-    from rich.traceback import install
+    from rich.console import Console
+    from rich.logging import RichHandler
 
-    install(show_locals=True, width=120, word_wrap=True)
+    install_rich_traceback_on_error()
 
     logging_levels = [logging.ERROR, logging.WARN, logging.INFO, logging.DEBUG]
     if logging_verbosity > (len(logging_levels) - 1):
@@ -39,10 +30,24 @@ def init_console_logger(logging_verbosity=3):
     logging.basicConfig(format='%(message)s',
                         datefmt='[%Y-%m-%d %X]',
                         level=lvl,
-                        handlers=[RichHandler(rich_tracebacks=True,
+                        # log to stderr so that results written to stdout (e.g. JSON Lines) can be piped
+                        handlers=[RichHandler(console=Console(stderr=True),
+                                              rich_tracebacks=True,
                                               tracebacks_show_locals=True)])
 
 
+def install_rich_traceback_on_error():
+    """Show uncaught exceptions with rich tracebacks without importing rich.traceback unless an error occurs"""
+
+    def excepthook(*exc_info):
+        from rich.traceback import install
+
+        install(show_locals=True, width=120, word_wrap=True)
+        sys.excepthook(*exc_info)
+
+    sys.excepthook = excepthook
+
+
 def init_parser():
     parser = argparse.ArgumentParser(prog=SCRIPT_NAME,
                                      formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -50,7 +55,7 @@ def init_parser():
     parser.add_argument('files',
                         metavar='F',
                         nargs='*',
-                        help='Input genome FASTA/FASTQ files (can be Gzipped)')
+                        help='Input genome FASTA/FASTQ files (can be gzip, zstd, bzip2 or xz compressed)')
     parser.add_argument('-s', '--scheme',
                         default='heidelberg',
                         help='Scheme to use for subtyping (built-in: '
@@ -74,19 +79,83 @@ def init_parser():
                         metavar=('fasta_path', 'genome_name'),
                         action='append',
                         help='input fasta file path AND genome name')
+    parser.add_argument('--stream-input',
+                        nargs=3,
+                        metavar=('path', 'format', 'genome_name'),
+                        action='append',
+                        help='Read a sample from standard input ("-") or a named pipe in "fasta" or "fastq" format '
+                             'with no intermediate files (e.g. "zcat reads.fastq.gz | hansel --stream-input - fastq '
+                             'SRR123 ..."); FASTQ streams with the same genome name (e.g. named pipes of forward and '
+                             'reverse reads) are subtyped as one sample')
     parser.add_argument('-D', '--input-directory',
                         help='directory of input fasta files (.fasta|.fa|.fna) or FASTQ files (paired FASTQ should '
-                             'have same basename with "_\\d\\.(fastq|fq)" postfix to be automatically paired) '
-                             '(files can be Gzipped)')
+                             'have same basename with "_\\d\\.(fastq|fq)" postfix to be automatically paired; '
+                             'Illumina FASTQ of all lanes of a sample, e.g. "sample_S1_L001_R1_001.fastq.gz", are '
+                             'grouped as one sample) (files can be Gzipped)')
+    parser.add_argument('--recursive',
+                        action='store_true',
+                        help='Also search subdirectories of "-D/--input-directory" (e.g. a sequencer output tree)')
+    parser.add_argument('--include',
+                        metavar='PATTERN',
+                        action='append',
+                        help='Only collect files in "-D/--input-directory" matching this glob pattern (matched against '
+                             'filenames and paths relative to the input directory, e.g. "*_R?_001.fastq.gz" or '
+                             '"run1/*"); can be repeated')
+    parser.add_argument('--exclude',
+                        metavar='PATTERN',
+                        action='append',
+                        help='Skip files and subdirectories in "-D/--input-directory" matching this glob pattern (e.g. '
+                             '"Undetermined*"); can be repeated')
+    parser.add_argument('--scan-threads',
+                        type=int,
+                        default=1,
+                        help='Number of directories of "-D/--input-directory" to list in parallel (e.g. 16 for large '
+                             'trees on network filesystems) (default=1)')
+    parser.add_argument('--manifest',
+                        help='Tab-delimited manifest of sample names and their FASTA or FASTQ file paths (one sample '
+                             'per line; relative paths are relative to the manifest directory)')
+    parser.add_argument('--shard',
+                        type=parse_shard,
+                        metavar='i/N',
+                        help='Only subtype the i-th of N shards of the input samples (e.g. "2/8"). Samples are '
+                             'deterministically assigned to shards balanced by input file size so that a batch can be '
+                             'split over several nodes; combine the outputs of each shard with "hansel-merge"')
     parser.add_argument('-o', '--output-summary',
                         help='Subtyping summary output path (tab-delimited)')
     parser.add_argument('-O', '--output-kmer-results',
                         help='Subtyping kmer matching output path (tab-delimited)')
     parser.add_argument('-S', '--output-simple-summary',
                         help='Subtyping simple summary output path')
+    parser.add_argument('--output-summary-jsonl',
+                        help='Subtyping summary JSON Lines output path ("-" for stdout); a record is written for each '
+                             'sample as soon as its results are available')
+    parser.add_argument('--output-kmer-results-jsonl',
+                        help='Subtyping kmer matching JSON Lines output path ("-" for stdout); a record is written for '
+                             'each kmer result of each sample as soon as its results are available')
+    parser.add_argument('--results-db',
+                        help='SQLite results database path to upsert the subtyping summary and kmer hits of each '
+                             'sample into as results arrive (created if it does not exist)')
+    parser.add_argument('--output-format',
+                        choices=OUTPUT_FORMATS,
+                        default='tsv',
+                        help='Output format for the summary, kmer results and simple summary output files; '
+                             '"parquet" and "arrow" (Arrow IPC file) require the "pyarrow" package (default="tsv")')
+    parser.add_argument('--row-group-samples',
+                        type=int,
+                        default=100,
+                        help='Number of samples per row group (Parquet) or record batch (Arrow) written to the kmer '
+                             'results output and per "--results-db" transaction as results arrive (default=100)')
     parser.add_argument('--force',
                         action='store_true',
                         help='Force existing output files to be overwritten')
+    parser.add_argument('--checkpoint',
+                        action='store_true',
+                        help='Durably record the results of each completed sample in a journal alongside the output '
+                             'summary ("<output summary>.journal.jsonl") so that an interrupted run can be resumed')
+    parser.add_argument('--resume',
+                        action='store_true',
+                        help='Resume an interrupted run skipping samples already completed in the "--checkpoint" '
+                             'journal; outputs are written with the results of previously completed and new samples')
     parser.add_argument('--json',
                         action='store_true',
                         help='Output JSON representation of output files')
@@ -122,6 +191,54 @@ def init_parser():
                         type=int,
                         help='Maximum number of scheme k-mers allowed before '
                              'quitting with a usage warning. Default is 100000')
+    parser.add_argument('--delta-scheme',
+                        help='Previous version of the scheme (built-in name or FASTA path) that the k-mer results in '
+                             '"--delta-kmer-results" were counted against. Only k-mers added or changed in the '
+                             'scheme specified by "-s/--scheme" are searched for in samples with stored k-mer results')
+    parser.add_argument('--delta-kmer-results',
+                        help='Subtyping kmer matching output (tab-delimited "-O" output) from a previous run with '
+                             'the scheme specified by "--delta-scheme"')
+    parser.add_argument('--resource-columns',
+                        action='store_true',
+                        help='Add columns for the resources used to subtype each sample to the summary outputs: input '
+                             'file bytes, reads/contigs processed, k-mer hits, elapsed seconds and peak RSS (MB) of '
+                             'the worker process')
+    parser.add_argument('--profile',
+                        metavar='PATH',
+                        help='Record the wall and CPU time of each subtyping stage of each sample (in worker '
+                             'processes) and of the run, write them to a JSON report at PATH and print a summary of '
+                             'the hottest stages to stderr')
+    parser.add_argument('--trace',
+                        metavar='PATH',
+                        help='Write a Chrome trace (Trace Event Format JSON viewable with chrome://tracing or '
+                             'https://ui.perfetto.dev) of the samples and subtyping stages run by each worker process '
+                             'to PATH')
+    parser.add_argument('--progress',
+                        choices=PROGRESS_MODES,
+                        help='Show the number of samples subtyped, reads and bases parsed per second, ETA and the '
+                             'sample each worker process is subtyping as a live progress display ("bar") or as '
+                             'periodic log lines for non-interactive batch jobs ("log")')
+    parser.add_argument('--progress-interval',
+                        type=float,
+                        default=30.0,
+                        help='Seconds between progress log lines with "--progress log" (default=30)')
+    parser.add_argument('--sample-timeout',
+                        type=float,
+                        metavar='SECONDS',
+                        help='Maximum seconds to subtype each sample; samples that take longer are retried (see '
+                             '"--retries") or reported with a "FAIL" QC status')
+    parser.add_argument('--retries',
+                        type=int,
+                        default=0,
+                        help='Number of times to retry subtyping a sample that fails or times out (default=0)')
+    parser.add_argument('--max-tasks-per-worker',
+                        type=int,
+                        help='Replace each worker process after it has subtyped this many samples to bound memory '
+                             'growth over long runs (default: never)')
+    parser.add_argument('--fail-fast',
+                        action='store_true',
+                        help='Stop the run at the first sample that cannot be subtyped (e.g. missing or corrupt input '
+                             'file) instead of reporting it with a "FAIL" QC status and the error in the summary')
     parser.add_argument('-t', '--threads',
                         type=int,
                         default=1,
@@ -136,7 +253,49 @@ def init_parser():
     return parser
 
 
-def collect_inputs(args: Any) -> Tuple[List[Tuple[str, str]], List[Tuple[List[str], str]]]:
+def stream_inputs(streams: Optional[List[List[str]]]) \
+        -> Tuple[List[Tuple[str, str]], List[Tuple[List[str], str]]]:
+    """Get the contigs and reads samples read from standard input or named pipes
+
+    Args:
+        streams: List of [path, format, genome name] of each "--stream-input"
+
+    Returns:
+        List of (contig stream path, sample name)
+        List of ([reads stream paths], sample name)
+
+    Raises:
+        ValueError: if a format is not "fasta" or "fastq", standard input is read more than once, a named pipe does
+            not exist or a sample has more than one FASTA stream or both FASTA and FASTQ streams
+    """
+    input_genomes = []
+    reads: Dict[str, List[str]] = {}
+    formats: Dict[str, str] = {}
+    n_stdin = 0
+    for path, input_format, genome_name in streams or []:
+        if input_format not in STREAM_FORMATS:
+            raise ValueError(f'Format "{input_format}" of stream input "{path}" must be one of {STREAM_FORMATS}')
+        if path == STDIN_PATH:
+            n_stdin += 1
+            if n_stdin > 1:
+                raise ValueError('Standard input ("-") can only be read by one "--stream-input"')
+        else:
+            path = os.path.abspath(path)
+            if not os.path.exists(path):
+                raise ValueError(f'Stream input "{path}" does not exist!')
+        if genome_name in formats and 'fasta' in [input_format, formats[genome_name]]:
+            raise ValueError(f'Sample "{genome_name}" can only have one FASTA stream input or one or more FASTQ '
+                             f'stream inputs')
+        formats[genome_name] = input_format
+        if input_format == 'fasta':
+            input_genomes.append((path, genome_name))
+        else:
+            reads.setdefault(genome_name, []).append(path)
+    return input_genomes, [(paths, genome_name) for genome_name, paths in reads.items()]
+
+
+def collect_inputs(args: Any, file_sizes: Optional[Dict[str, int]] = None) \
+        -> Tuple[List[Tuple[str, str]], List[Tuple[List[str], str]]]:
     """Collect all input files for analysis
 
     Sample names are derived from the base filename with no extensions.
@@ -145,11 +304,15 @@ def collect_inputs(args: Any) -> Tuple[List[Tuple[str, str]], List[Tuple[List[st
 
     Args:
         args: ArgumentParser.parse_args() output
+        file_sizes: Optional dict updated with the sizes of input files found in the input directory
 
     Returns:
         List of (contig filename, sample name)
         List of ([reads filepaths], sample name)
     """
+    import bio_hansel.utils
+    from bio_hansel.manifest import read_manifest
+
     input_genomes = []
     reads = []
     if args.files:
@@ -174,11 +337,30 @@ def collect_inputs(args: Any) -> Tuple[List[Tuple[str, str]], List[Tuple[List[st
     if args.input_fasta_genome_name:
         for fasta_path, genome_name in args.input_fasta_genome_name:
             input_genomes.append((os.path.abspath(fasta_path), genome_name))
+    if args.manifest:
+        manifest_genomes, manifest_reads = read_manifest(args.manifest)
+        input_genomes += manifest_genomes
+        reads += manifest_reads
+    if args.stream_input:
+        stream_genomes, stream_reads = stream_inputs(args.stream_input)
+        logging.info('Reading %s contigs and %s reads samples from standard input or named pipes',
+                     len(stream_genomes),
+                     len(stream_reads))
+        input_genomes += stream_genomes
+        reads += stream_reads
     if args.input_directory:
-        logging.info('Searching dir "%s" for FASTA files', args.input_directory)
-        input_genomes += bio_hansel.utils.collect_fasta_from_dir(args.input_directory)
-        logging.info('Searching dir "%s" for FASTQ files', args.input_directory)
-        reads += bio_hansel.utils.collect_fastq_from_dir(args.input_directory)
+        logging.info('Searching dir "%s"%s for FASTA and FASTQ files',
+                     args.input_directory,
+                     ' and its subdirectories' if args.recursive else '')
+        dir_genomes, dir_reads, dir_file_sizes = bio_hansel.utils.collect_inputs_from_dir(args.input_directory,
+                                                                                          recursive=args.recursive,
+                                                                                          include=args.include,
+                                                                                          exclude=args.exclude,
+                                                                                          n_threads=args.scan_threads)
+        input_genomes += dir_genomes
+        reads += dir_reads
+        if file_sizes is not None:
+            file_sizes.update(dir_file_sizes)
     if args.paired_reads:
         for x in args.paired_reads:
             if not isinstance(x, (list, tuple)):
@@ -199,28 +381,112 @@ def main():
         parser.print_help()
         parser.exit()
     args = parser.parse_args()
+    if bool(args.delta_scheme) != bool(args.delta_kmer_results):
+        parser.error('"--delta-scheme" and "--delta-kmer-results" must be specified together')
+    if (args.checkpoint or args.resume) and not args.output_summary:
+        parser.error('"--checkpoint" and "--resume" require an output summary path ("-o")')
+    if args.output_format != 'tsv':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            parser.error(f'The "pyarrow" package is required for "--output-format {args.output_format}". '
+                         f'Install it with "pip install pyarrow"')
+    if args.row_group_samples < 1:
+        parser.error('"--row-group-samples" must be at least 1')
+    if args.retries < 0:
+        parser.error('"--retries" must be at least 0')
+    if args.max_tasks_per_worker is not None and args.max_tasks_per_worker < 1:
+        parser.error('"--max-tasks-per-worker" must be at least 1')
+    if args.scan_threads < 1:
+        parser.error('"--scan-threads" must be at least 1')
+    try:
+        stream_inputs(args.stream_input)
+    except ValueError as ex:
+        parser.error(str(ex))
+    from bio_hansel.profiling import Profile
+    run_profile = Profile('run', spans=[] if args.trace else None)
+    # pandas and the subtyping modules are only imported once arguments are parsed so that "--help", "--version" and
+    # invalid arguments do not pay for importing them
+    import pandas as pd
+    import bio_hansel.utils
+    from bio_hansel.checkpoint import Journal, read_journal, read_journal_header, journal_header_mismatches
+    from bio_hansel.delta import scheme_delta, read_kmer_results, delta_subtyping_tasks
+    from bio_hansel.metadata import read_metadata_table, merge_results_with_metadata
+    from bio_hansel.output import summary_record, prepare_kmer_results, write_table, metadata_lookup, \
+        KmerResultsWriter, SummaryJsonLinesWriter, KmerResultsJsonLinesWriter
+    from bio_hansel.results_db import ResultsDatabase
+    from bio_hansel.bundle import load_scheme
+    from bio_hansel.profiling import resource_record, input_bytes
+    from bio_hansel.progress import ProgressMonitor
+    from bio_hansel.manifest import shard_inputs
+    from bio_hansel.subtyper import subtyping_tasks, iter_subtyping_results, iter_profiled_subtyping_results, \
+        task_sample, is_failed_sample
+
+    run_profile.lap('imports')
     init_console_logger(args.verbose)
     output_summary_path = args.output_summary
     output_kmer_results = args.output_kmer_results
     output_simple_summary_path = args.output_simple_summary
-    bio_hansel.utils.does_file_exist(output_simple_summary_path, args.force)
-    bio_hansel.utils.does_file_exist(output_summary_path, args.force)
-    bio_hansel.utils.does_file_exist(output_kmer_results, args.force)
+    if not args.resume:
+        bio_hansel.utils.does_file_exist(output_simple_summary_path, args.force)
+        bio_hansel.utils.does_file_exist(output_summary_path, args.force)
+        bio_hansel.utils.does_file_exist(output_kmer_results, args.force)
+        bio_hansel.utils.does_file_exist(args.profile, args.force)
+        bio_hansel.utils.does_file_exist(args.trace, args.force)
+        for jsonl_path in [args.output_summary_jsonl, args.output_kmer_results_jsonl]:
+            if jsonl_path != '-':
+                bio_hansel.utils.does_file_exist(jsonl_path, args.force)
+    journal_path = None
+    completed = {}
+    if args.checkpoint or args.resume:
+        journal_path = JOURNAL_EXT_TMPL.format(output_summary_path)
+        if args.resume:
+            completed = read_journal(journal_path)
+        else:
+            bio_hansel.utils.does_file_exist(journal_path, args.force)
+            if os.path.exists(journal_path):
+                os.remove(journal_path)
     scheme: str = args.scheme
     scheme_name: Optional[str] = args.scheme_name
-    scheme_fasta = bio_hansel.utils.get_scheme_fasta(scheme)
-    scheme_subtype_counts = subtype_counts(scheme_fasta)
+    scheme_bundle = load_scheme(scheme)
+    scheme_subtype_counts = scheme_bundle.subtype_counts
     logging.debug(args)
     subtyping_params = bio_hansel.utils.init_subtyping_params(args, scheme)
-    bio_hansel.utils.check_total_kmers(scheme_fasta, subtyping_params.max_degenerate_kmers)
-    input_contigs, input_reads = collect_inputs(args)
+    bio_hansel.utils.check_expanded_kmers(scheme_bundle.n_expanded_kmers, subtyping_params.max_degenerate_kmers)
+    needs_kmer_results = bool(output_kmer_results or args.output_kmer_results_jsonl or args.results_db)
+    journal_header = dict(scheme=scheme,
+                          scheme_version=bio_hansel.utils.get_scheme_version(scheme) or scheme_bundle.scheme_version,
+                          kmer_set=scheme_bundle.kmer_set)
+    if completed:
+        previous_header = read_journal_header(journal_path)
+        if previous_header is None:
+            parser.error(f'Journal "{journal_path}" has no header identifying the scheme of the run being resumed; '
+                         f'rerun without "--resume"')
+        mismatches = journal_header_mismatches(previous_header, journal_header)
+        if mismatches:
+            parser.error(f'Cannot resume from journal "{journal_path}" of a run with a different scheme: '
+                         f'{"; ".join(mismatches)}')
+        if needs_kmer_results:
+            # k-mer results are needed for the outputs of this run but were not journaled
+            without_kmers = [x for x, (_, df) in completed.items() if df is None]
+            if without_kmers:
+                logging.warning('Re-subtyping %s completed samples since their k-mer results were not journaled',
+                                len(without_kmers))
+                for x in without_kmers:
+                    del completed[x]
+    run_profile.lap('load_scheme')
+    # sizes of input files found by directory scans so that they are not stat'ed again for sharding and progress
+    file_sizes: Dict[str, int] = {}
+    input_contigs, input_reads = collect_inputs(args, file_sizes)
+    run_profile.lap('collect_inputs')
     if len(input_contigs) == 0 and len(input_reads) == 0:
         raise Exception('No input files specified!')
+    if args.shard:
+        input_contigs, input_reads = shard_inputs(input_contigs, input_reads, *args.shard, file_sizes=file_sizes)
+        if len(input_contigs) == 0 and len(input_reads) == 0:
+            raise Exception('No samples in shard {}/{}; use fewer shards than samples'.format(*args.shard))
 
-    df_md = None
-    md_path = resource_filename(program_name, f'data/{scheme}/metadata.tsv')
-    if os.path.exists(md_path):
-        df_md = read_metadata_table(md_path)
+    df_md = scheme_bundle.metadata_table()
 
     if args.scheme_metadata:
         if df_md is None:
@@ -231,30 +497,123 @@ def main():
 
     n_threads = args.threads
 
-    subtype_results: List[Tuple[Subtype, pd.DataFrame]] = []
-    if len(input_contigs) > 0:
-        contigs_results = subtype_contigs_samples(input_genomes=input_contigs,
-                                                  scheme=scheme,
-                                                  scheme_name=scheme_name,
-                                                  subtyping_params=subtyping_params,
-                                                  scheme_subtype_counts=scheme_subtype_counts,
-                                                  n_threads=n_threads)
-        logging.info('Generated %s subtyping results from %s contigs samples', len(contigs_results), len(input_contigs))
-        subtype_results += contigs_results
-    if len(input_reads) > 0:
-        reads_results = subtype_reads_samples(reads=input_reads,
-                                              scheme=scheme,
-                                              scheme_name=scheme_name,
-                                              subtyping_params=subtyping_params,
-                                              scheme_subtype_counts=scheme_subtype_counts,
-                                              n_threads=n_threads)
-        logging.info('Generated %s subtyping results from %s contigs samples', len(reads_results), len(input_reads))
-        subtype_results += reads_results
-
-    dfs: List[pd.DataFrame] = [df for st, df in subtype_results]
-    dfsummary = pd.DataFrame([attr.asdict(st) for st, df in subtype_results])
-
-    dfsummary = dfsummary[SUBTYPE_SUMMARY_COLS]
+    sample_order = {}
+    for _, genome_name in input_contigs + input_reads:
+        sample_order.setdefault(genome_name, len(sample_order))
+    if completed:
+        input_contigs = [(x, genome_name) for x, genome_name in input_contigs if genome_name not in completed]
+        input_reads = [(x, genome_name) for x, genome_name in input_reads if genome_name not in completed]
+        logging.info('Resuming run from journal "%s"; %s samples already completed, %s samples remaining',
+                     journal_path,
+                     len(completed),
+                     len(input_contigs) + len(input_reads))
+
+    if args.delta_kmer_results:
+        delta = scheme_delta(args.delta_scheme, scheme)
+        tasks = delta_subtyping_tasks(input_genomes=input_contigs,
+                                      reads=input_reads,
+                                      scheme=scheme,
+                                      delta=delta,
+                                      previous_results=read_kmer_results(args.delta_kmer_results,
+                                                                         delta.old_kmer_set),
+                                      scheme_name=scheme_name,
+                                      subtyping_params=subtyping_params,
+                                      scheme_subtype_counts=scheme_subtype_counts)
+    else:
+        tasks = subtyping_tasks(input_genomes=input_contigs,
+                                reads=input_reads,
+                                scheme=scheme,
+                                scheme_name=scheme_name,
+                                subtyping_params=subtyping_params,
+                                scheme_subtype_counts=scheme_subtype_counts)
+
+    # writers of results for each sample as results arrive
+    results_writers = []
+    kmer_results_writer = None
+    if output_kmer_results and args.output_format != 'tsv':
+        kmer_results_writer = KmerResultsWriter(output_kmer_results, args.output_format, args.row_group_samples)
+        results_writers.append(kmer_results_writer)
+    if args.output_summary_jsonl:
+        results_writers.append(SummaryJsonLinesWriter(args.output_summary_jsonl, metadata_lookup(df_md)))
+    if args.output_kmer_results_jsonl:
+        results_writers.append(KmerResultsJsonLinesWriter(args.output_kmer_results_jsonl))
+    if args.results_db:
+        results_writers.append(ResultsDatabase(args.results_db, samples_per_transaction=args.row_group_samples))
+    # detailed k-mer results only need to be kept in memory if they are not written as results arrive
+    keep_kmer_results = bool(output_kmer_results) and (kmer_results_writer is None or args.json)
+
+    subtype_results: List[Tuple[Dict[str, Any], Optional[pd.DataFrame]]] = []
+    sample_profiles: List[Profile] = []
+    failed_samples: List[str] = []
+    journal = Journal(journal_path, include_kmers=needs_kmer_results, header=journal_header) if journal_path else None
+    progress = None
+    if args.progress:
+        progress = ProgressMonitor(len(tasks),
+                                   mode=args.progress,
+                                   interval=args.progress_interval,
+                                   sample_bytes={task_sample(x)[1]: input_bytes(task_sample(x)[0], file_sizes)
+                                                 for x in tasks})
+    run_profile.lap('prepare_tasks')
+    try:
+        for summary, df in sorted(completed.values(),
+                                  key=lambda x: sample_order.get(x[0]['sample'], len(sample_order))):
+            for writer in results_writers:
+                writer.add(summary, df)
+            subtype_results.append((summary, df if keep_kmer_results else None))
+        if journal:
+            journal.open()
+        progress_queue = None
+        if progress:
+            progress.start()
+            progress_queue = progress.queue
+        task_options = dict(progress_queue=progress_queue,
+                            timeout=args.sample_timeout,
+                            retries=args.retries,
+                            isolate_errors=not args.fail_fast,
+                            max_tasks_per_worker=args.max_tasks_per_worker)
+        if args.profile or args.resource_columns or args.trace:
+            results = iter_profiled_subtyping_results(tasks, n_threads,
+                                                      time_stages=bool(args.profile or args.trace),
+                                                      record_spans=bool(args.trace),
+                                                      **task_options)
+        else:
+            results = ((st, df, None) for st, df in iter_subtyping_results(tasks, n_threads, **task_options))
+        for st, df, profile in results:
+            if profile:
+                sample_profiles.append(profile)
+            if is_failed_sample(st):
+                failed_samples.append(st.sample)
+            elif journal:
+                # samples that could not be subtyped are not journaled so that they are retried when resuming
+                journal.record(st, df)
+            summary = summary_record(st)
+            if args.resource_columns:
+                summary.update(resource_record(profile))
+            for writer in results_writers:
+                writer.add(summary, df)
+            subtype_results.append((summary, df if keep_kmer_results else None))
+    finally:
+        if progress:
+            progress.stop()
+        if journal:
+            journal.close()
+        for writer in results_writers:
+            writer.close()
+    run_profile.lap('subtyping')
+    logging.info('Generated %s subtyping results from %s samples', len(subtype_results), len(sample_order))
+    if failed_samples:
+        logging.error('%s samples could not be subtyped and are reported with a "FAIL" QC status: %s',
+                      len(failed_samples), ', '.join(failed_samples))
+    subtype_results.sort(key=lambda x: sample_order.get(x[0]['sample'], len(sample_order)))
+
+    dfs: List[pd.DataFrame] = [df for _, df in subtype_results if df is not None]
+    dfsummary = pd.DataFrame([summary for summary, _ in subtype_results])
+
+    if args.resource_columns:
+        # resource columns are missing for samples completed in a previous run when resuming
+        dfsummary = dfsummary.reindex(columns=SUBTYPE_SUMMARY_COLS + RESOURCE_SUMMARY_COLS)
+    else:
+        dfsummary = dfsummary[SUBTYPE_SUMMARY_COLS]
 
     if dfsummary['avg_kmer_coverage'].isnull().all():
         dfsummary = dfsummary.drop(labels='avg_kmer_coverage', axis=1)
@@ -264,31 +623,33 @@ def main():
     if df_md is not None:
         dfsummary = merge_results_with_metadata(dfsummary, df_md)
 
-    kwargs_for_pd_to_table = dict(sep='\t', index=None, float_format='%.3f')
     kwargs_for_pd_to_json = dict(orient='records')
 
     if output_summary_path:
-        dfsummary.to_csv(output_summary_path, **kwargs_for_pd_to_table)
+        write_table(dfsummary, output_summary_path, args.output_format)
         if args.json:
             dfsummary.to_json(JSON_EXT_TMPL.format(output_summary_path), **kwargs_for_pd_to_json)
         logging.info('Wrote subtyping output summary to %s', output_summary_path)
-    else:
+    elif '-' not in [args.output_summary_jsonl, args.output_kmer_results_jsonl]:
         # if no output path specified for the summary results, then print to stdout
         print(dfsummary.to_csv(sep='\t', index=False))
 
     if output_kmer_results:
+        if kmer_results_writer and kmer_results_writer.writer.n_rows > 0:
+            logging.info('Kmer results for %s samples written to "%s" in %s format.',
+                         kmer_results_writer.n_samples,
+                         output_kmer_results,
+                         args.output_format)
         if dfs:
-            dfall: pd.DataFrame = pd.concat([df.sort_values('is_pos_kmer', ascending=False) for df in dfs], sort=False)
-            # Error message is redundant accross each of the k-mers
-            dfall = dfall.drop(columns=['qc_message'])
-            dfall = bio_hansel.utils.df_field_fillna(dfall)
-            dfall.to_csv(output_kmer_results, **kwargs_for_pd_to_table)
-            logging.info('Kmer results written to "{}".'.format(output_kmer_results))
+            dfall: pd.DataFrame = pd.concat([prepare_kmer_results(df) for df in dfs], sort=False)
+            if kmer_results_writer is None:
+                write_table(dfall, output_kmer_results)
+                logging.info('Kmer results written to "{}".'.format(output_kmer_results))
             if args.json:
                 dfall.to_json(JSON_EXT_TMPL.format(output_kmer_results), **kwargs_for_pd_to_json)
                 logging.info(
                     'Kmer results written to "{}" in JSON format.'.format(JSON_EXT_TMPL.format(output_kmer_results)))
-        else:
+        elif kmer_results_writer is None or kmer_results_writer.writer.n_rows == 0:
             logging.error(
                 'No kmer results generated. No kmer results file written to "{}".'.format(output_kmer_results))
 
@@ -301,10 +662,23 @@ def main():
         if df_md is not None:
             df_simple_summary = merge_results_with_metadata(df_simple_summary, df_md)
 
-        df_simple_summary.to_csv(output_simple_summary_path, **kwargs_for_pd_to_table)
+        write_table(df_simple_summary, output_simple_summary_path, args.output_format)
         if args.json:
             df_simple_summary.to_json(JSON_EXT_TMPL.format(output_simple_summary_path), **kwargs_for_pd_to_json)
 
+    run_profile.lap('write_outputs')
+    run_profile.finish()
+    if args.trace:
+        from bio_hansel.profiling import chrome_trace, write_chrome_trace
+        write_chrome_trace(args.trace, chrome_trace(run_profile, sample_profiles))
+        logging.info('Wrote Chrome trace to "%s"', args.trace)
+    if args.profile:
+        from bio_hansel.profiling import profile_report, write_profile_report, profile_summary
+        report = profile_report(run_profile, sample_profiles)
+        write_profile_report(args.profile, report)
+        print(profile_summary(report), file=sys.stderr)
+        logging.info('Wrote profile report to "%s"', args.profile)
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Manifest input and deterministic sharding of samples for splitting large batches over several nodes.
+
+A manifest is a tab-delimited file with a sample name followed by the path of its FASTA file or its FASTQ file(s) on
+each line, e.g.::
+
+    sample	files
+    SRR123	reads/SRR123_1.fastq.gz	reads/SRR123_2.fastq.gz
+    genome1	assemblies/genome1.fasta
+
+Relative paths are relative to the directory of the manifest. A header line starting with "sample", blank lines and
+lines starting with "#" are ignored.
+
+Samples are assigned to shards so that the total input file size of each shard is balanced. The assignment only
+depends on the sample names and input file sizes so each node of a batch can independently select its own shard
+(e.g. ``hansel --manifest samples.tsv --shard 2/8 ...``) and the per-shard outputs can be combined with
+``hansel-merge``.
+"""
+import argparse
+import heapq
+import logging
+import os
+import re
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .const import REGEX_FASTA, REGEX_FASTQ
+from .profiling import input_bytes
+
+REGEX_SHARD = re.compile(r'^(\d+)/(\d+)$')
+
+
+def _iter_manifest(path: str) -> Iterator[Tuple[int, str, List[str]]]:
+    samples = set()
+    basedir = os.path.dirname(os.path.abspath(path))
+    with open(path) as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.rstrip('\r\n')
+            if not line.strip() or line.startswith('#'):
+                continue
+            sample, *paths = [x.strip() for x in line.split('\t')]
+            if line_number == 1 and sample.lower() == 'sample':
+                continue
+            paths = [os.path.join(basedir, x) for x in paths if x]
+            if not paths:
+                raise ValueError(f'No input files for sample "{sample}" on line {line_number} of manifest "{path}"')
+            if sample in samples:
+                raise ValueError(f'Sample "{sample}" on line {line_number} of manifest "{path}" is repeated')
+            samples.add(sample)
+            yield line_number, sample, paths
+
+
+def _is_fasta(line_number: int, sample: str, paths: List[str], path: str) -> bool:
+    filenames = [os.path.basename(x) for x in paths]
+    if all(REGEX_FASTQ.match(x) for x in filenames):
+        return False
+    if len(paths) == 1 and REGEX_FASTA.match(filenames[0]):
+        return True
+    raise ValueError(f'Input files of sample "{sample}" on line {line_number} of manifest "{path}" must be one FASTA '
+                     f'file or one or more FASTQ files: {filenames}')
+
+
+def manifest_samples(path: str) -> List[str]:
+    """Get the sample names of a manifest in the order they are output by `hansel` (contigs then reads samples)"""
+    contigs_samples = []
+    reads_samples = []
+    for line_number, sample, paths in _iter_manifest(path):
+        if _is_fasta(line_number, sample, paths, path):
+            contigs_samples.append(sample)
+        else:
+            reads_samples.append(sample)
+    return contigs_samples + reads_samples
+
+
+def read_manifest(path: str) -> Tuple[List[Tuple[str, str]], List[Tuple[List[str], str]]]:
+    """Read the input files of samples from a manifest
+
+    Samples with input files that do not exist are skipped with an error message.
+
+    Args:
+        path: Manifest file path
+
+    Returns:
+        List of (contig filename, sample name)
+        List of ([reads filepaths], sample name)
+
+    Raises:
+        ValueError: if a line has no file paths, mixes FASTA and FASTQ paths, has more than one FASTA path or has
+            paths that are neither FASTA nor FASTQ, or if a sample name is repeated
+    """
+    input_genomes = []
+    reads = []
+    for line_number, sample, paths in _iter_manifest(path):
+        is_fasta = _is_fasta(line_number, sample, paths, path)
+        missing = [x for x in paths if not os.path.exists(x)]
+        if missing:
+            logging.error('Input file(s) %s of sample "%s" in manifest "%s" do not exist!', missing, sample, path)
+        elif is_fasta:
+            input_genomes.append((paths[0], sample))
+        else:
+            reads.append((paths, sample))
+    logging.info('Read %s contigs and %s reads samples from manifest "%s"', len(input_genomes), len(reads), path)
+    return input_genomes, reads
+
+
+def parse_shard(shard: str) -> Tuple[int, int]:
+    """Parse a 1-based shard number and number of shards (e.g. "2/8") for use as an argparse type"""
+    m = REGEX_SHARD.match(shard)
+    if not m:
+        raise argparse.ArgumentTypeError(f'Shard "{shard}" not formatted as "<shard>/<number of shards>" (e.g. "1/4")')
+    i, n = int(m.group(1)), int(m.group(2))
+    if not 1 <= i <= n:
+        raise argparse.ArgumentTypeError(f'Shard "{shard}" must be between 1 and the number of shards')
+    return i, n
+
+
+def assign_shards(sample_sizes: List[Tuple[str, int]], n_shards: int) -> List[int]:
+    """Assign samples to shards balanced by input size
+
+    Samples are assigned from largest to smallest (ties broken by sample name) to the shard with the smallest total
+    input size so far (ties broken by shard number), so the assignment is deterministic for the same samples and sizes.
+
+    Args:
+        sample_sizes: Sample name and input file size of each sample
+        n_shards: Number of shards
+
+    Returns:
+        0-based shard index of each sample
+    """
+    shards = [0] * len(sample_sizes)
+    # (total size, shard index) of each shard
+    heap = [(0, i) for i in range(n_shards)]
+    for index in sorted(range(len(sample_sizes)), key=lambda x: (-sample_sizes[x][1], sample_sizes[x][0])):
+        total, shard = heapq.heappop(heap)
+        shards[index] = shard
+        heapq.heappush(heap, (total + sample_sizes[index][1], shard))
+    return shards
+
+
+def shard_inputs(input_genomes: List[Tuple[str, str]],
+                 reads: List[Tuple[List[str], str]],
+                 shard: int,
+                 n_shards: int,
+                 file_sizes: Optional[Dict[str, int]] = None) \
+        -> Tuple[List[Tuple[str, str]], List[Tuple[List[str], str]]]:
+    """Select the contigs and reads samples of a shard
+
+    Args:
+        input_genomes: List of (contig filename, sample name)
+        reads: List of ([reads filepaths], sample name)
+        shard: 1-based shard number
+        n_shards: Number of shards
+        file_sizes: Already known input file sizes (see `bio_hansel.profiling.input_bytes`)
+
+    Returns:
+        Contigs and reads samples assigned to the shard in input order
+    """
+    inputs: List[Tuple[Any, str]] = input_genomes + reads
+    sizes = [input_bytes(paths, file_sizes) for paths, _ in inputs]
+    shards = assign_shards([(sample, size) for (_, sample), size in zip(inputs, sizes)], n_shards)
+    selected = {i for i, x in enumerate(shards) if x == shard - 1}
+    shard_genomes = [x for i, x in enumerate(input_genomes) if i in selected]
+    shard_reads = [x for i, x in enumerate(reads, start=len(input_genomes)) if i in selected]
+    logging.info('Shard %s/%s: subtyping %s of %s samples (%s bytes of input)',
+                 shard,
+                 n_shards,
+                 len(selected),
+                 len(inputs),
+                 sum(sizes[i] for i in selected))
+    return shard_genomes, shard_reads
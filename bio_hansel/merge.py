@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+`hansel-merge` command for combining the summary, simple summary or k-mer results outputs of runs over shards of a
+batch of samples (see `bio_hansel.manifest`) into a single output.
+"""
+import argparse
+import logging
+import sys
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from . import __version__
+from .const import OUTPUT_FORMATS
+
+SCRIPT_NAME = 'hansel-merge'
+
+
+def read_table(path: str, input_format: str = 'tsv') -> pd.DataFrame:
+    """Read a results table written by `bio_hansel.output.write_table`
+
+    Tab-delimited values are read as strings so that they are written back unchanged.
+
+    Args:
+        path: Results table path
+        input_format: "tsv", "parquet" or "arrow"
+    """
+    if input_format == 'tsv':
+        return pd.read_csv(path, sep='\t', dtype=str, keep_default_na=False)
+    import pyarrow as pa
+    if input_format == 'parquet':
+        import pyarrow.parquet as pq
+        table = pq.read_table(path)
+    else:
+        with pa.memory_map(path) as source:
+            table = pa.ipc.open_file(source).read_all()
+    df = table.to_pandas()
+    # dictionary encoded columns are re-encoded when written
+    return df.astype({column: object for column in df.select_dtypes('category').columns})
+
+
+def merge_tables(dfs: List[pd.DataFrame], sample_order: Optional[Dict[str, int]] = None) -> pd.DataFrame:
+    """Combine results tables of disjoint sets of samples
+
+    Columns missing from some tables (e.g. "avg_kmer_coverage" is dropped from summaries of contigs only runs) are
+    empty for the samples of those tables.
+
+    Args:
+        dfs: Results tables with a "sample" column
+        sample_order: Optional sample name to sort position (e.g. the order of samples in a manifest); samples not in
+            `sample_order` are placed last in input order
+
+    Returns:
+        Combined results table
+
+    Raises:
+        ValueError: if a sample is in more than one table
+    """
+    seen = {}
+    for i, df in enumerate(dfs):
+        for sample in df['sample'].unique():
+            if sample in seen:
+                raise ValueError(f'Sample "{sample}" is in merged tables {seen[sample] + 1} and {i + 1}')
+            seen[sample] = i
+    df = pd.concat(dfs, ignore_index=True, sort=False)
+    if all(x.dtypes.eq(object).all() for x in dfs):
+        df = df.fillna('')
+    if sample_order:
+        positions = df['sample'].map(lambda x: sample_order.get(x, len(sample_order)))
+        df = df.iloc[positions.values.argsort(kind='stable')].reset_index(drop=True)
+    return df
+
+
+def init_parser():
+    parser = argparse.ArgumentParser(prog=SCRIPT_NAME,
+                                     description='Merge bio_hansel summary, simple summary or k-mer results outputs '
+                                                 'of shards of a batch of samples (e.g. "hansel --manifest samples.tsv '
+                                                 '--shard 1/4 -o summary-1.tsv ...") into one output')
+    parser.add_argument('inputs',
+                        nargs='+',
+                        help='Outputs of the same type (e.g. "-o" summaries) of each shard')
+    parser.add_argument('-o', '--output',
+                        required=True,
+                        help='Merged output path')
+    parser.add_argument('--manifest',
+                        help='Order samples as in this manifest (default: order of inputs)')
+    parser.add_argument('--format',
+                        choices=OUTPUT_FORMATS,
+                        default='tsv',
+                        help='Format of the input and output files (default="tsv")')
+    parser.add_argument('--force',
+                        action='store_true',
+                        help='Force existing output file to be overwritten')
+    parser.add_argument('-v', '--verbose',
+                        action='count',
+                        default=0,
+                        help='Logging verbosity level (-v == show warnings; -vvv == show debug info)')
+    parser.add_argument('-V', '--version',
+                        action='version',
+                        version='%(prog)s {}'.format(__version__))
+    return parser
+
+
+def main():
+    from .main import init_console_logger
+    from .manifest import manifest_samples
+    from .output import write_table
+    from .utils import does_file_exist
+
+    parser = init_parser()
+    args = parser.parse_args()
+    init_console_logger(args.verbose)
+    try:
+        does_file_exist(args.output, args.force)
+        sample_order = None
+        if args.manifest:
+            sample_order = {sample: i for i, sample in enumerate(manifest_samples(args.manifest))}
+        df = merge_tables([read_table(x, args.format) for x in args.inputs], sample_order)
+        write_table(df, args.output, args.format)
+        logging.info('Merged %s rows of %s samples from %s inputs into "%s"',
+                     df.shape[0], df['sample'].nunique(), len(args.inputs), args.output)
+    except (ValueError, OSError) as ex:
+        logging.error(ex)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
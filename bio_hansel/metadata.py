@@ -1,3 +1,4 @@
+import io
 import logging
 from typing import Optional
 
@@ -36,7 +37,23 @@ def read_metadata_table(path: str) -> Optional[pd.DataFrame]:
             list(FILE_EXT_TO_PD_READ_FUNC.keys())
         ))
         return None
-    dfmd: pd.DataFrame = FILE_EXT_TO_PD_READ_FUNC[file_ext](path)
+    return _prepare_metadata_table(FILE_EXT_TO_PD_READ_FUNC[file_ext](path), path)
+
+
+def parse_metadata_table(text: str, source: str = 'metadata') -> pd.DataFrame:
+    """Parse the contents of a tab-delimited subtype metadata table into a Pandas DataFrame.
+
+    Args:
+        text: Tab-delimited table with a `subtype` column and a header row
+        source: Table source for messages
+
+    Returns:
+        DataFrame of table
+    """
+    return _prepare_metadata_table(pd.read_table(io.StringIO(text)), source)
+
+
+def _prepare_metadata_table(dfmd: pd.DataFrame, path: str) -> pd.DataFrame:
     assert np.any(dfmd.columns == 'subtype'), 'Column with name "subtype" expected in metadata file "{}"'.format(path)
     dfmd.subtype.fillna('#N/A', inplace=True)
     dfmd.subtype = dfmd.subtype.astype(str)
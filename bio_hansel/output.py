@@ -0,0 +1,435 @@
+# -*- coding: utf-8 -*-
+"""
+Conversion of subtyping results into output records and writing of results tables.
+"""
+import json
+import os
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+import attr
+import pandas as pd
+
+from .const import SUBTYPE_SUMMARY_COLS
+from .subtype import Subtype
+from .utils import df_field_fillna
+
+COLUMNAR_FORMATS = ['parquet', 'arrow']
+# low cardinality string columns to dictionary encode in columnar output
+DICTIONARY_COLUMNS = ['sample', 'scheme', 'subtype', 'qc_status']
+# k-mer results output schema for contigs and reads subtyping results
+KMER_RESULTS_COLUMN_TYPES = [('kmername', 'string'),
+                             ('seq', 'string'),
+                             ('freq', 'int64'),
+                             ('is_revcomp', 'bool_'),
+                             ('contig_id', 'string'),
+                             ('match_index', 'int64'),
+                             ('refposition', 'int64'),
+                             ('subtype', 'string'),
+                             ('is_pos_kmer', 'bool_'),
+                             ('is_kmer_freq_okay', 'bool_'),
+                             ('total_refposition_kmer_frequency', 'int64'),
+                             ('kmer_fraction', 'float64'),
+                             ('is_kmer_fraction_okay', 'bool_'),
+                             ('file_path', 'string'),
+                             ('sample', 'string'),
+                             ('scheme', 'string'),
+                             ('scheme_version', 'string'),
+                             ('kmer_set', 'string'),
+                             ('qc_status', 'string'), ]
+
+
+def summary_record(st: Subtype) -> Dict[str, Any]:
+    """Get the subtyping summary record for a Subtype result
+
+    Args:
+        st: Subtype result
+
+    Returns:
+        Dict of Subtype attribute names to values excluding the scheme summary info and input format
+    """
+    return attr.asdict(st, filter=lambda a, v: a.name not in {'scheme_subtype_counts', 'input_format'})
+
+
+def kmer_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Get JSON serializable records of detailed subtyping results
+
+    Args:
+        df: Detailed subtyping results
+
+    Returns:
+        List of dicts of column names to values for each row in `df`
+    """
+    return json.loads(df.to_json(orient='records'))
+
+
+def prepare_kmer_results(df: pd.DataFrame) -> pd.DataFrame:
+    """Prepare the detailed subtyping results of a sample for the k-mer results output
+
+    Positive k-mers are listed first, the QC message, which is redundant across each of the k-mers, is dropped and
+    missing subtypes are filled with "#N/A".
+
+    Args:
+        df: Detailed subtyping results for a sample
+
+    Returns:
+        K-mer results output rows for the sample
+    """
+    df = df.sort_values('is_pos_kmer', ascending=False)
+    df = df.drop(columns=['qc_message'], errors='ignore')
+    return df_field_fillna(df)
+
+
+def _is_null(x: Any) -> bool:
+    return x is None or (isinstance(x, float) and x != x)
+
+
+def _string_array(values: pd.Series):
+    import pyarrow as pa
+    try:
+        return pa.array(values, type=pa.string(), from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # e.g. lists of read file paths
+        return pa.array([None if _is_null(x) else str(x) for x in values], type=pa.string())
+
+
+class ColumnarWriter(object):
+    """Write tables to a Parquet or Arrow IPC file in row groups/record batches
+
+    Columns in `dictionary_columns` are dictionary encoded with a dictionary that is shared and extended across each
+    written batch so that an Arrow IPC file only needs dictionary deltas.
+
+    Args:
+        path: Output file path
+        output_format: "parquet" or "arrow"
+        column_types: Optional list of column names and pyarrow type factory names (e.g. "string", "bool_") defining
+            the output schema. Columns missing from a batch are null. By default, the schema is inferred from the
+            first batch.
+        dictionary_columns: Columns to dictionary encode
+    """
+
+    def __init__(self,
+                 path: str,
+                 output_format: str,
+                 column_types: Optional[List[Tuple[str, str]]] = None,
+                 dictionary_columns: Optional[List[str]] = None):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError(f'The "pyarrow" package is required for "{output_format}" output. '
+                              f'Install it with "pip install pyarrow"')
+        if output_format not in COLUMNAR_FORMATS:
+            raise ValueError(f'Unexpected columnar output format "{output_format}". '
+                             f'Expected one of {COLUMNAR_FORMATS}')
+        self.path = path
+        self.output_format = output_format
+        self.column_types = column_types
+        self.dictionary_columns = DICTIONARY_COLUMNS if dictionary_columns is None else dictionary_columns
+        self.n_rows = 0
+        self._dictionaries: Dict[str, Dict[str, int]] = {}
+        self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _dictionary_array(self, column: str, values):
+        import pyarrow as pa
+        values = values.map(lambda x: None if _is_null(x) else str(x))
+        dictionary = self._dictionaries.setdefault(column, {})
+        for x in values.dropna().unique():
+            if x not in dictionary:
+                dictionary[x] = len(dictionary)
+        indices = pa.array(values.map(dictionary), type=pa.int32(), from_pandas=True)
+        return pa.DictionaryArray.from_arrays(indices, pa.array(list(dictionary), type=pa.string()))
+
+    def _table(self, df: pd.DataFrame):
+        import pyarrow as pa
+        if self.column_types:
+            columns = [(column, getattr(pa, arrow_type)()) for column, arrow_type in self.column_types]
+        else:
+            columns = [(column, None) for column in df.columns]
+        arrays = []
+        names = []
+        for column, arrow_type in columns:
+            values = df[column] if column in df.columns else pd.Series([None] * df.shape[0], dtype=object)
+            if column in self.dictionary_columns:
+                array = self._dictionary_array(column, values)
+            elif arrow_type == pa.string() or (arrow_type is None and values.dtype == object):
+                array = _string_array(values)
+            else:
+                array = pa.array(values, type=arrow_type, from_pandas=True)
+            arrays.append(array)
+            names.append(column)
+        return pa.Table.from_arrays(arrays, names=names)
+
+    def write(self, df: pd.DataFrame) -> None:
+        """Write a batch of rows as a Parquet row group or Arrow record batch
+
+        Args:
+            df: Rows to write
+        """
+        import pyarrow as pa
+        table = self._table(df)
+        if self._writer is None:
+            if self.output_format == 'parquet':
+                import pyarrow.parquet as pq
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            else:
+                compression = 'zstd' if pa.Codec.is_available('zstd') else None
+                options = pa.ipc.IpcWriteOptions(compression=compression, emit_dictionary_deltas=True)
+                self._writer = pa.ipc.new_file(self.path, table.schema, options=options)
+        self._writer.write_table(table)
+        self.n_rows += table.num_rows
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+class KmerResultsWriter(object):
+    """Write k-mer results to a Parquet or Arrow IPC file as results for each sample arrive
+
+    Like the other results writers, results for each sample are passed to `add` as the summary record and detailed
+    subtyping results of the sample.
+
+    K-mer results are buffered until `samples_per_batch` samples have been added and then written as one row group or
+    record batch so that k-mer results for all samples never need to be held in memory.
+
+    Args:
+        path: Output file path
+        output_format: "parquet" or "arrow"
+        samples_per_batch: Number of samples to write per row group/record batch
+    """
+
+    def __init__(self, path: str, output_format: str, samples_per_batch: int = 100):
+        self.writer = ColumnarWriter(path, output_format, column_types=KMER_RESULTS_COLUMN_TYPES)
+        self.samples_per_batch = samples_per_batch
+        self.n_samples = 0
+        self._batch: List[pd.DataFrame] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, summary: Dict[str, Any], df: Optional[pd.DataFrame]) -> None:
+        if df is None:
+            return
+        self._batch.append(prepare_kmer_results(df))
+        self.n_samples += 1
+        if len(self._batch) >= self.samples_per_batch:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._batch:
+            self.writer.write(pd.concat(self._batch, sort=False))
+            self._batch = []
+
+    def close(self) -> None:
+        self.flush()
+        self.writer.close()
+
+
+def write_table(df: pd.DataFrame, path: str, output_format: str = 'tsv') -> None:
+    """Write a results table in the specified output format
+
+    Args:
+        df: Results table
+        path: Output file path
+        output_format: "tsv", "parquet" or "arrow"
+    """
+    if output_format == 'tsv':
+        df.to_csv(path, sep='\t', index=None, float_format='%.3f')
+    else:
+        with ColumnarWriter(path, output_format) as writer:
+            writer.write(df)
+
+
+def _json_safe(x: Any) -> Any:
+    return None if isinstance(x, float) and x != x else x
+
+
+def metadata_lookup(df_md: Optional[pd.DataFrame]) -> Dict[str, Dict[str, Any]]:
+    """Get a lookup of subtype to subtype metadata
+
+    Args:
+        df_md: Subtype metadata table
+
+    Returns:
+        Dict of subtype to dict of metadata column names to values
+    """
+    if df_md is None:
+        return {}
+    df_md = df_md.drop_duplicates(subset='subtype').set_index('subtype')
+    return {subtype: {k: _json_safe(v) for k, v in row.items()} for subtype, row in df_md.to_dict('index').items()}
+
+
+def summary_output_record(summary: Dict[str, Any],
+                          metadata: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """Get the subtyping summary output fields for a sample with any subtype metadata merged in
+
+    Args:
+        summary: Subtyping summary record (see `summary_record`)
+        metadata: Lookup of subtype to subtype metadata (see `metadata_lookup`)
+
+    Returns:
+        Dict of summary output field names to values
+    """
+    out = {k: _json_safe(summary.get(k)) for k in SUBTYPE_SUMMARY_COLS}
+    if not out['subtype']:
+        out['subtype'] = '#N/A'
+    if metadata:
+        for k, v in metadata.get(out['subtype'], {}).items():
+            out.setdefault(k, v)
+    return out
+
+
+class JsonLinesWriter(object):
+    """Write records to a JSON Lines file flushing after each record
+
+    Records are written as soon as they are available so that downstream consumers can start reading results before
+    a batch run finishes.
+
+    Args:
+        path: Output file path or "-" for stdout
+        append: Append to an existing output file rather than overwriting it
+    """
+
+    def __init__(self, path: str, append: bool = False):
+        self.path = path
+        self.n_records = 0
+        self._handle = sys.stdout if path == '-' else open(path, 'a' if append else 'w')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self._handle.write(json.dumps(record, default=str) + '\n')
+        self._handle.flush()
+        self.n_records += 1
+
+    def write_all(self, records: List[Dict[str, Any]]) -> None:
+        self._handle.write(''.join(json.dumps(record, default=str) + '\n' for record in records))
+        self._handle.flush()
+        self.n_records += len(records)
+
+    def close(self) -> None:
+        if self._handle is not None and self._handle is not sys.stdout:
+            self._handle.close()
+        self._handle = None
+
+
+class SummaryJsonLinesWriter(JsonLinesWriter):
+    """Write a subtyping summary record for each sample to a JSON Lines file as results arrive
+
+    Args:
+        path: Output file path or "-" for stdout
+        metadata: Lookup of subtype to subtype metadata to merge into each record (see `metadata_lookup`)
+        append: Append to an existing output file rather than overwriting it
+    """
+
+    def __init__(self, path: str, metadata: Optional[Dict[str, Dict[str, Any]]] = None, append: bool = False):
+        super().__init__(path, append)
+        self.metadata = metadata
+
+    def add(self, summary: Dict[str, Any], df: Optional[pd.DataFrame]) -> None:
+        self.write(summary_output_record(summary, self.metadata))
+
+
+class KmerResultsJsonLinesWriter(JsonLinesWriter):
+    """Write a record for each k-mer result of each sample to a JSON Lines file as results arrive
+
+    Args:
+        path: Output file path or "-" for stdout
+    """
+
+    def add(self, summary: Dict[str, Any], df: Optional[pd.DataFrame]) -> None:
+        if df is not None:
+            self.write_all(kmer_records(prepare_kmer_results(df)))
+
+
+class TsvAppender(object):
+    """Append rows to a tab-separated results table flushing after each write
+
+    The header is written if the table is new or empty. Rows appended to an existing table are written in the columns
+    of its header so that a table can grow across runs.
+
+    Args:
+        path: Output file path
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.n_rows = 0
+        self.columns: Optional[List[str]] = None
+        needs_newline = False
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path) as f:
+                self.columns = f.readline().rstrip('\n').split('\t')
+            # a row may have been partially written when the previous run was killed
+            with open(path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b'\n'
+        self._handle = open(path, 'a')
+        if needs_newline:
+            self._handle.write('\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, df: pd.DataFrame) -> None:
+        header = self.columns is None
+        if header:
+            self.columns = list(df.columns)
+        df.reindex(columns=self.columns).to_csv(self._handle, sep='\t', index=None, header=header, float_format='%.3f')
+        self._handle.flush()
+        self.n_rows += df.shape[0]
+
+    def close(self) -> None:
+        if self._handle is not None:
+            self._handle.close()
+        self._handle = None
+
+
+class SummaryTsvAppender(TsvAppender):
+    """Append the subtyping summary of each sample to a tab-separated table as results arrive
+
+    Args:
+        path: Output file path
+        df_metadata: Subtype metadata table to merge into each summary
+    """
+
+    def __init__(self, path: str, df_metadata: Optional[pd.DataFrame] = None):
+        super().__init__(path)
+        self.df_metadata = df_metadata
+
+    def add(self, summary: Dict[str, Any], df: Optional[pd.DataFrame]) -> None:
+        from .metadata import merge_results_with_metadata
+
+        dfsummary = df_field_fillna(pd.DataFrame([summary]).reindex(columns=SUBTYPE_SUMMARY_COLS))
+        if self.df_metadata is not None:
+            dfsummary = merge_results_with_metadata(dfsummary, self.df_metadata)
+        self.write(dfsummary)
+
+
+class KmerResultsTsvAppender(TsvAppender):
+    """Append the k-mer results of each sample to a tab-separated table as results arrive
+
+    Args:
+        path: Output file path
+    """
+
+    def add(self, summary: Dict[str, Any], df: Optional[pd.DataFrame]) -> None:
+        if df is not None:
+            self.write(prepare_kmer_results(df))
@@ -1,8 +1,20 @@
 # -*- coding: utf-8 -*-
 
+import io
 import logging
-
+import os
 import re
+import shlex
+import shutil
+import signal
+import stat
+import subprocess
+import sys
+from contextlib import contextmanager
+from typing import Optional
+
+from .const import STDIN_PATH
+from .pipeline import abort_on_stop
 
 VALID_NUCLEOTIDES = {'A', 'a',
                      'C', 'c',
@@ -21,7 +33,14 @@ VALID_NUCLEOTIDES = {'A', 'a',
                      'N', 'n',
                      'X', 'x', }  # X for masked nucleotides
 
-REGEX_GZIPPED = re.compile(r'^.+\.gz$')
+REGEX_COMPRESSED = re.compile(r'^.+\.(gz|zst|bz2|xz)$')
+
+# magic bytes, name and streaming decompression command of each supported compression format
+COMPRESSION_FORMATS = [(b'\x1f\x8b', 'gzip', 'zcat'),
+                       (b'\x28\xb5\x2f\xfd', 'zstd', 'zstd -dcq'),
+                       (b'BZh', 'bzip2', 'bzip2 -dc'),
+                       (b'\xfd7zXZ\x00', 'xz', 'xz -dc'), ]
+MAGIC_BYTES_LENGTH = max(len(magic) for magic, _, _ in COMPRESSION_FORMATS)
 
 
 # SimpleFastaParser function from BioPython
@@ -69,48 +88,173 @@ def SimpleFastaParser(handle):
     yield title, "".join(lines).replace(" ", "").replace("\r", "").upper()
 
 
-def parse_fasta(filepath):
-    """Parse a FASTA/FASTA.GZ file returning a generator yielding tuples of fasta headers to sequences.
+def compression_format(head: bytes) -> Optional[str]:
+    """Get the compression format ("gzip", "zstd", "bzip2" or "xz") of a file from its first bytes
 
     Args:
-        filepath (str): Fasta file path
+        head: First bytes of the file (at least `MAGIC_BYTES_LENGTH` bytes unless the file is shorter)
 
     Returns:
-        generator: yields tuples of (<fasta header>, <fasta sequence>)
+        Compression format or None if the file is not compressed in a supported format
+    """
+    for magic, name, _ in COMPRESSION_FORMATS:
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def _text_decoder(f, compression: str):
+    """Decompress a binary file object in this process returning a text file object"""
+    if compression == 'zstd':
+        try:
+            # standard library zstd module of Python >= 3.14
+            from compression import zstd
+            return zstd.open(f, 'rt')
+        except ImportError:
+            pass
+        try:
+            import zstandard
+        except ImportError:
+            raise OSError('Decompressing zstd compressed standard input or named pipes (or files without the "zstd" '
+                          'command installed) requires the "zstandard" package') from None
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True))
+    import bz2
+    import gzip
+    import lzma
+    return {'gzip': gzip, 'bzip2': bz2, 'xz': lzma}[compression].open(f, 'rt')
+
+
+@contextmanager
+def _decompress(filepath, compression: str):
+    """Open a compressed file decompressed by an external command (e.g. zcat), raising an OSError if the command fails
+    (e.g. corrupt or truncated file)
+
+    The file is decompressed in this process if the command is not installed.
     """
-    if REGEX_GZIPPED.match(filepath):
-        logging.debug('Opening "%s" as gzipped file', filepath)
-        # using os.popen with zcat since it is much faster than gzip.open or gzip.open(io.BufferedReader)
-        # http://aripollak.com/pythongzipbenchmarks/
-        # assumes Linux os with zcat installed
-        import os
-        with os.popen('zcat < {}'.format(filepath)) as f:
-            yield from SimpleFastaParser(f)
+    # using a zcat pipe (like os.popen) since it is much faster than gzip.open or gzip.open(io.BufferedReader)
+    # http://aripollak.com/pythongzipbenchmarks/
+    # the decompression command also runs in parallel with parsing and matching
+    command = next(x for _, name, x in COMPRESSION_FORMATS if name == compression)
+    program = command.split()[0]
+    if shutil.which(program) is None:
+        logging.debug('"%s" not found; decompressing "%s" in Python', program, filepath)
+        with open(filepath, 'rb') as fbin, _text_decoder(fbin, compression) as f:
+            yield f
+        return
+    # the command runs in its own process group so that the shell and the command can be killed together
+    process = subprocess.Popen('{} < {}'.format(command, shlex.quote(filepath)),
+                               shell=True,
+                               stdout=subprocess.PIPE,
+                               universal_newlines=True,
+                               start_new_session=True)
+    aborted = []
+
+    def abort():
+        aborted.append(True)
+        _kill_process_group(process)
+
+    try:
+        # a hung command is killed if subtyping stops while waiting for it (e.g. on a sample timeout)
+        with abort_on_stop(abort):
+            yield process.stdout
+    except BaseException:
+        _kill_process_group(process)
+        raise
+    finally:
+        process.stdout.close()
+        status = process.wait()
+    if status and not aborted:
+        raise OSError('Could not decompress "{}"; {} exited with status {}'.format(filepath, program, status))
+
+
+def _kill_process_group(process: subprocess.Popen) -> None:
+    if process.poll() is not None:
+        return
+    try:
+        if hasattr(os, 'killpg'):
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except OSError:
+        pass
+
+
+def _unblock_fifo(filepath) -> None:
+    """Open and close a named pipe for writing so that a reader blocked opening it reads the end of the pipe"""
+    try:
+        if stat.S_ISFIFO(os.stat(filepath).st_mode):
+            os.close(os.open(filepath, os.O_WRONLY | os.O_NONBLOCK))
+    except OSError:
+        pass
+
+
+@contextmanager
+def _open_input(filepath):
+    """Open an input sequence file, named pipe or standard input ("-") for reading text
+
+    Gzip, zstd, bzip2 and xz compressed inputs are detected by their magic bytes (see `compression_format`) and
+    decompressed while they are read.
+    """
+    if filepath == STDIN_PATH:
+        import multiprocessing
+        # the standard input of worker processes is /dev/null so reading it would silently yield no sequences
+        if multiprocessing.current_process().name != 'MainProcess':
+            raise ValueError('Standard input can only be read in the main process')
+        compression = compression_format(sys.stdin.buffer.peek(MAGIC_BYTES_LENGTH))
+        if compression is None:
+            yield sys.stdin
+        else:
+            with _text_decoder(sys.stdin.buffer, compression) as f:
+                yield f
+        return
+    # opening a named pipe blocks until it is opened for writing; a blocked open is ended if subtyping stops
+    with abort_on_stop(lambda: _unblock_fifo(filepath)), open(filepath, 'rb') as fbin:
+        if not stat.S_ISREG(os.fstat(fbin.fileno()).st_mode):
+            # named pipes can only be read once so the bytes peeked at are decompressed in this process
+            compression = compression_format(fbin.peek(MAGIC_BYTES_LENGTH))
+            with (_text_decoder(fbin, compression) if compression else io.TextIOWrapper(fbin)) as f:
+                yield f
+            return
+        compression = compression_format(fbin.read(MAGIC_BYTES_LENGTH))
+    if compression is not None:
+        logging.debug('Opening "%s" as %s compressed file', filepath, compression)
+        with _decompress(filepath, compression) as f:
+            yield f
+    elif REGEX_COMPRESSED.match(filepath):
+        raise OSError('Could not decompress "{}"; it is not a gzip, zstd, bzip2 or xz file'.format(filepath))
     else:
         with open(filepath, 'r') as f:
-            yield from SimpleFastaParser(f)
+            yield f
+
+
+def parse_fasta(filepath):
+    """Parse a FASTA file returning a generator yielding tuples of fasta headers to sequences.
+
+    Gzip, zstd, bzip2 or xz compressed files are decompressed while they are parsed.
+
+    Args:
+        filepath (str): Fasta file path, named pipe or "-" for standard input
+
+    Returns:
+        generator: yields tuples of (<fasta header>, <fasta sequence>)
+    """
+    with _open_input(filepath) as f:
+        yield from SimpleFastaParser(f)
 
 
 def parse_fastq(filepath):
-    """Parse a FASTQ/FASTQ.GZ file returning a generator yielding tuples of FASTQ entry headers and sequences.
+    """Parse a FASTQ file returning a generator yielding tuples of FASTQ entry headers and sequences.
+
+    Gzip, zstd, bzip2 or xz compressed files are decompressed while they are parsed.
 
     Args:
-        filepath (str): FASTQ/FASTQ.GZ file path
+        filepath (str): FASTQ file path, named pipe or "-" for standard input
 
     Returns:
         generator: yields tuples of (<fastq header>, <fastq sequence>)
     """
-    if REGEX_GZIPPED.match(filepath):
-        logging.debug('Opening "%s" as gzipped file', filepath)
-        # using os.popen with zcat since it is much faster than gzip.open or gzip.open(io.BufferedReader)
-        # http://aripollak.com/pythongzipbenchmarks/
-        # assumes Linux os with zcat installed
-        import os
-        with os.popen('zcat < {}'.format(filepath)) as f:
-            yield from _parse_fastq(f)
-    else:
-        with open(filepath, 'r') as f:
-            yield from _parse_fastq(f)
+    with _open_input(filepath) as f:
+        yield from _parse_fastq(f)
 
 
 def _parse_fastq(f):
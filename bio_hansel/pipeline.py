@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Overlapping of input reading with k-mer matching.
+
+`pipelined` reads and parses sequences in a background thread that fills batches into a bounded queue while the
+caller matches k-mers against the previous batches. Gzipped inputs are decompressed by a separate zcat process, so
+decompression, waiting on reads from disk or the zcat pipe (which release the GIL) and k-mer matching overlap; only
+the line parsing itself competes with matching for the GIL. `prefetch_files` asks the OS to start reading the next
+input files into the page cache while the current input is being subtyped.
+
+If iteration stops early (e.g. on a `bio_hansel.subtyper.sample_timeout`) while the reader thread is blocked reading,
+the callbacks the reader registered with `abort_on_stop` are called to unblock it, e.g. by killing a hung zcat process,
+so that neither the thread nor the decompression process outlive the sample.
+"""
+import logging
+import os
+import queue
+import stat
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, List, TypeVar, Union
+
+T = TypeVar('T')
+
+# number of records per batch passed from the reader thread
+PIPELINE_BATCH_SIZE = 1000
+# maximum number of parsed batches waiting to be matched
+PIPELINE_QUEUE_BATCHES = 8
+# seconds to wait for the reader thread to stop when matching ends early
+READER_JOIN_TIMEOUT = 1.0
+
+_DONE = object()
+
+# thread ident to callbacks unblocking the reads of the thread (see `abort_on_stop`)
+_abort_callbacks = {}  # type: dict
+_abort_lock = threading.Lock()
+
+
+class _ReaderError(object):
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+@contextmanager
+def abort_on_stop(abort: Callable[[], None]) -> Iterator[None]:
+    """Call `abort` to unblock reads in this thread if it is a `pipelined` reader thread whose consumer stops early
+
+    Args:
+        abort: Callback called from the consumer thread, e.g. to kill the process the reads come from
+    """
+    ident = threading.get_ident()
+    with _abort_lock:
+        _abort_callbacks.setdefault(ident, []).append(abort)
+    try:
+        yield
+    finally:
+        with _abort_lock:
+            callbacks = _abort_callbacks[ident]
+            callbacks.remove(abort)
+            if not callbacks:
+                del _abort_callbacks[ident]
+
+
+def _abort_reads(thread: threading.Thread) -> None:
+    with _abort_lock:
+        callbacks = list(_abort_callbacks.get(thread.ident, []))
+    for abort in callbacks:
+        try:
+            abort()
+        except Exception as ex:
+            logging.debug('Could not abort reads of thread "%s": %s', thread.name, ex)
+
+
+def _read_batches(records: Iterable[T], out: queue.Queue, batch_size: int, stop: threading.Event) -> None:
+    def put(x) -> bool:
+        while not stop.is_set():
+            try:
+                out.put(x, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    it = iter(records)
+    try:
+        batch = []
+        for record in it:
+            batch.append(record)
+            if len(batch) == batch_size:
+                if not put(batch):
+                    return
+                batch = []
+        if batch and not put(batch):
+            return
+        put(_DONE)
+    except BaseException as ex:
+        put(_ReaderError(ex))
+    finally:
+        # close the parser (and any decompression process) in the thread that used it
+        close = getattr(it, 'close', None)
+        if close is not None:
+            close()
+
+
+def pipelined(records: Iterable[T],
+              batch_size: int = PIPELINE_BATCH_SIZE,
+              max_batches: int = PIPELINE_QUEUE_BATCHES) -> Iterator[T]:
+    """Iterate over `records` produced by a background reader thread
+
+    Errors raised while reading are re-raised when the batch they occurred in is reached. If iteration stops early,
+    the reader thread is signalled to stop, its blocked reads are aborted (see `abort_on_stop`) and the underlying
+    iterator is closed by it.
+
+    Args:
+        records: Iterable of records (e.g. a FASTQ or FASTA parser)
+        batch_size: Number of records per batch passed from the reader thread
+        max_batches: Maximum number of batches read ahead
+
+    Yields:
+        Records in order
+    """
+    batches = queue.Queue(maxsize=max_batches)
+    stop = threading.Event()
+    reader = threading.Thread(target=_read_batches,
+                              args=(records, batches, batch_size, stop),
+                              name='pipeline-reader',
+                              daemon=True)
+    reader.start()
+    finished = False
+    try:
+        while True:
+            batch = batches.get()
+            if batch is _DONE:
+                finished = True
+                break
+            if isinstance(batch, _ReaderError):
+                finished = True
+                raise batch.error
+            yield from batch
+    finally:
+        stop.set()
+        if not finished:
+            _abort_reads(reader)
+        reader.join(READER_JOIN_TIMEOUT)
+        if reader.is_alive():
+            logging.warning('Input reader thread is still blocked reading after subtyping stopped')
+
+
+def prefetch_files(paths: Union[str, List[str], None]) -> None:
+    """Ask the OS to read input files into the page cache in the background (no-op where unsupported)
+
+    Only regular files are prefetched; opening a named pipe would unblock (and closing it would break) its writer.
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    if isinstance(paths, str):
+        paths = [paths]
+    for path in paths or []:
+        try:
+            if not stat.S_ISREG(os.stat(path).st_mode):
+                continue
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
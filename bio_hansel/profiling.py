@@ -0,0 +1,393 @@
+# -*- coding: utf-8 -*-
+"""
+Per-stage wall and CPU time profiling of subtyping.
+
+Subtyping code marks its stages with `stage` (or `timed_iter` for time spent pulling items from an iterator, e.g.
+parsing reads) which only record timings while a sample is being profiled with `profile_sample`; otherwise they are
+no-ops. Stage times are exclusive of nested stages so that stage times of a sample add up to at most its total time.
+CPU times are of the profiled process; CPU time of child processes (e.g. `zcat` decompressing gzipped inputs) is
+recorded separately for each sample.
+
+Profiles also cheaply account for the resources used to subtype each sample: counts recorded with `count` (e.g.
+sequences parsed and k-mer hits), elapsed time and the peak RSS of the process while subtyping the sample. Stage timing
+can be turned off (`time_stages=False`) to only account for resources.
+
+With `record_spans=True`, the start and duration of each stage is also recorded so that the activity of each worker
+process can be shown on a timeline (see `chrome_trace`).
+"""
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import attr
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows where child process CPU time and peak RSS are not accounted for
+    resource = None
+
+
+@attr.s
+class StageTimes(object):
+    wall = attr.ib(default=0.0)
+    cpu = attr.ib(default=0.0)
+    calls = attr.ib(default=0)
+
+
+@attr.s
+class Profile(object):
+    """Wall and CPU times of the stages of subtyping a sample or of a run"""
+    name = attr.ib(default=None)  # type: Optional[str]
+    pid = attr.ib(factory=os.getpid)
+    # wall clock (epoch) time at start
+    start = attr.ib(factory=time.time)
+    wall = attr.ib(default=0.0)
+    cpu = attr.ib(default=0.0)
+    # CPU time of child processes that exited while profiling
+    child_cpu = attr.ib(default=0.0)
+    stages = attr.ib(factory=lambda: defaultdict(StageTimes))  # type: Dict[str, StageTimes]
+    counts = attr.ib(factory=lambda: defaultdict(int))  # type: Dict[str, int]
+    peak_rss_mb = attr.ib(default=None)  # type: Optional[float]
+    time_stages = attr.ib(default=True)
+    # stage name, start relative to profile start and duration in seconds of each stage if recording spans
+    spans = attr.ib(default=None)  # type: Optional[List[tuple]]
+    _t0 = attr.ib(factory=time.perf_counter, repr=False)
+    _c0 = attr.ib(factory=time.process_time, repr=False)
+    _lap = attr.ib(default=None, repr=False)
+    # stack of [wall, cpu] of nested stage time for each open stage
+    _nested = attr.ib(factory=list, repr=False)
+
+    def add(self, name: str, wall: float, cpu: float, span_start: Optional[float] = None) -> None:
+        if self.spans is not None and span_start is not None:
+            self.spans.append((name, span_start - self._t0, wall))
+        times = self.stages[name]
+        times.wall += wall
+        times.cpu += cpu
+        times.calls += 1
+        if self._nested:
+            self._nested[-1][0] += wall
+            self._nested[-1][1] += cpu
+
+    def lap(self, name: str) -> None:
+        """Record the time since the previous lap (or start) as stage `name`"""
+        t, c = time.perf_counter(), time.process_time()
+        t0, c0 = self._lap or (self._t0, self._c0)
+        self.add(name, t - t0, c - c0, span_start=t0)
+        self._lap = (t, c)
+
+    def finish(self) -> 'Profile':
+        self.wall = time.perf_counter() - self._t0
+        self.cpu = time.process_time() - self._c0
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(name=self.name,
+                    pid=self.pid,
+                    start=self.start,
+                    wall=self.wall,
+                    cpu=self.cpu,
+                    child_cpu=self.child_cpu,
+                    peak_rss_mb=self.peak_rss_mb,
+                    counts=dict(self.counts),
+                    stages={k: attr.asdict(v) for k, v in self.stages.items()})
+
+
+# profile of the sample being subtyped in this process
+_active = None  # type: Optional[Profile]
+
+
+def _children_cpu() -> float:
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _reset_peak_rss() -> None:
+    # writing "5" to clear_refs resets the peak RSS (VmHWM) of the process on Linux
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak RSS of this process in MB since it was last reset (see `profile_sample`) or since the process started
+
+    Returns:
+        Peak RSS in MB or None if it cannot be read on this platform
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def is_profiling() -> bool:
+    return _active is not None and _active.time_stages
+
+
+@contextmanager
+def profile_sample(name: Optional[str] = None,
+                   time_stages: bool = True,
+                   record_spans: bool = False) -> Iterator[Profile]:
+    """Profile the stages of subtyping a sample in this process and account for the resources used
+
+    Args:
+        name: Sample name
+        time_stages: Record stage timings; if False, only resource usage is accounted for
+        record_spans: Record the start and duration of each stage
+
+    Yields:
+        Profile that is finished when the context exits
+    """
+    global _active
+    previous = _active
+    child_cpu = _children_cpu()
+    _reset_peak_rss()
+    _active = profile = Profile(name, time_stages=time_stages, spans=[] if record_spans else None)
+    try:
+        yield profile
+    finally:
+        _active = previous
+        profile.finish()
+        profile.child_cpu = _children_cpu() - child_cpu
+        profile.peak_rss_mb = peak_rss_mb()
+
+
+def count(name: str, n: int) -> None:
+    """Add `n` to count `name` of the sample being profiled, if any"""
+    if _active is not None:
+        _active.counts[name] += n
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Record the wall and CPU time of a stage for the sample being profiled, if any"""
+    profile = _active
+    if profile is None or not profile.time_stages:
+        yield
+        return
+    profile._nested.append([0.0, 0.0])
+    t0, c0 = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        wall, cpu = time.perf_counter() - t0, time.process_time() - c0
+        nested_wall, nested_cpu = profile._nested.pop()
+        profile.add(name, wall - nested_wall, cpu - nested_cpu)
+        if profile.spans is not None:
+            # spans show the whole duration of a stage including nested stages
+            profile.spans.append((name, t0 - profile._t0, wall))
+
+
+def timed_iter(iterable: Iterable, name: str) -> Iterable:
+    """Record the time spent getting each item from `iterable` as stage `name` for the sample being profiled, if any"""
+    profile = _active
+    if profile is None or not profile.time_stages:
+        return iterable
+    return _timed_iter(iter(iterable), name, profile)
+
+
+def _timed_iter(it: Iterator, name: str, profile: Profile) -> Iterator:
+    perf_counter, process_time = time.perf_counter, time.process_time
+    times = profile.stages[name]
+    while True:
+        t0, c0 = perf_counter(), process_time()
+        try:
+            item = next(it)
+        except StopIteration:
+            return
+        finally:
+            wall, cpu = perf_counter() - t0, process_time() - c0
+            times.wall += wall
+            times.cpu += cpu
+            if profile._nested:
+                profile._nested[-1][0] += wall
+                profile._nested[-1][1] += cpu
+        times.calls += 1
+        yield item
+
+
+def input_bytes(input_paths: Any, file_sizes: Optional[Dict[str, int]] = None) -> int:
+    """Total size of the input file(s) of a sample
+
+    Args:
+        input_paths: Input file path(s)
+        file_sizes: Already known file sizes (e.g. from `bio_hansel.utils.scan_directory`) so that those files are not
+            stat'ed again
+
+    Returns:
+        Total size in bytes of the input files that exist
+    """
+    if isinstance(input_paths, str):
+        input_paths = [input_paths]
+    total = 0
+    for x in input_paths or []:
+        if file_sizes and x in file_sizes:
+            total += file_sizes[x]
+        elif os.path.exists(x):
+            total += os.path.getsize(x)
+    return total
+
+
+def count_input_bytes(input_paths: Any) -> None:
+    """Count the total size of the input file(s) of the sample being profiled, if any"""
+    if _active is not None:
+        count('input_bytes', input_bytes(input_paths))
+
+
+def resource_record(profile: Profile) -> Dict[str, Any]:
+    """Get the resource usage summary columns for a sample
+
+    Args:
+        profile: Sample profile
+
+    Returns:
+        Dict of resource summary column (see `bio_hansel.const.RESOURCE_SUMMARY_COLS`) to value
+    """
+    return dict(input_bytes=profile.counts.get('input_bytes', 0),
+                n_sequences=profile.counts.get('sequences', 0),
+                n_kmer_hits=profile.counts.get('kmer_hits', 0),
+                elapsed_seconds=round(profile.wall, 3),
+                peak_rss_mb=None if profile.peak_rss_mb is None else round(profile.peak_rss_mb, 1))
+
+
+def stage_totals(profiles: List[Profile]) -> List[Dict[str, Any]]:
+    """Aggregate stage times over profiles
+
+    Time of each profile not spent in any stage is counted as stage "other" and CPU time of child processes as stage
+    "child_processes" (e.g. `zcat` decompression running concurrently with parsing).
+
+    Returns:
+        List of dicts of stage name, number of profiles with the stage, number of calls, total and max wall time and
+        total CPU time sorted by descending total wall time
+    """
+    totals = {}
+    for profile in profiles:
+        stages = {k: (v.wall, v.cpu, v.calls) for k, v in profile.stages.items()}
+        other_wall = profile.wall - sum(x for x, _, _ in stages.values())
+        other_cpu = profile.cpu - sum(x for _, x, _ in stages.values())
+        if profile.wall > 0:
+            stages['other'] = (max(other_wall, 0.0), max(other_cpu, 0.0), 1)
+        if profile.child_cpu > 0:
+            stages['child_processes'] = (0.0, profile.child_cpu, 1)
+        for name, (wall, cpu, calls) in stages.items():
+            x = totals.setdefault(name, dict(stage=name, n=0, calls=0, wall=0.0, cpu=0.0, max_wall=0.0))
+            x['n'] += 1
+            x['calls'] += calls
+            x['wall'] += wall
+            x['cpu'] += cpu
+            x['max_wall'] = max(x['max_wall'], wall)
+    return sorted(totals.values(), key=lambda x: (-x['wall'], -x['cpu']))
+
+
+def profile_report(run_profile: Profile, sample_profiles: List[Profile]) -> Dict[str, Any]:
+    """Get a JSON serializable report of run and per-sample stage timings
+
+    Args:
+        run_profile: Profile of the whole run
+        sample_profiles: Profiles of each sample
+
+    Returns:
+        Dict with the run profile ("run"), stage times aggregated over samples ("stages") and each sample profile
+        ("samples")
+    """
+    return dict(run=run_profile.to_dict(),
+                stages=stage_totals(sample_profiles),
+                samples=[x.to_dict() for x in sample_profiles])
+
+
+def write_profile_report(path: str, report: Dict[str, Any]) -> None:
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=1)
+
+
+def profile_summary(report: Dict[str, Any], top: int = 10) -> str:
+    """Get a human readable summary of the hottest stages in a profile report
+
+    Args:
+        report: Profile report (see `profile_report`)
+        top: Maximum number of per-sample stages to show
+
+    Returns:
+        Summary text
+    """
+    run = report['run']
+    samples = report['samples']
+    lines = [f'Run: {run["wall"]:.3f}s wall, {run["cpu"]:.3f}s CPU in the main process; {len(samples)} samples',
+             f'{"run stage":<24}{"wall_s":>10}{"cpu_s":>10}{"%wall":>8}']
+    for name, x in sorted(run['stages'].items(), key=lambda kv: -kv[1]['wall']):
+        pct = 100 * x['wall'] / run['wall'] if run['wall'] else 0.0
+        lines.append(f'{name:<24}{x["wall"]:>10.3f}{x["cpu"]:>10.3f}{pct:>8.1f}')
+    if samples:
+        total_wall = sum(x['wall'] for x in samples)
+        slowest = max(samples, key=lambda x: x['wall'])
+        lines += [f'Samples: {total_wall:.3f}s wall in total; slowest "{slowest["name"]}" {slowest["wall"]:.3f}s',
+                  f'{"sample stage":<24}{"wall_s":>10}{"cpu_s":>10}{"%wall":>8}{"max_s":>10}{"calls":>12}']
+        for x in report['stages'][:top]:
+            pct = 100 * x['wall'] / total_wall if total_wall else 0.0
+            lines.append(f'{x["stage"]:<24}{x["wall"]:>10.3f}{x["cpu"]:>10.3f}{pct:>8.1f}{x["max_wall"]:>10.3f}'
+                         f'{x["calls"]:>12}')
+    return '\n'.join(lines)
+
+
+def _trace_events(profile: Profile, pid: int, category: str, args: Optional[Dict[str, Any]] = None) \
+        -> List[Dict[str, Any]]:
+    # trace event timestamps and durations are in microseconds
+    events = [dict(name=profile.name, cat=category, ph='X', pid=pid, tid=profile.pid,
+                   ts=profile.start * 1e6, dur=profile.wall * 1e6, args=args or {})]
+    for name, start, wall in profile.spans or []:
+        events.append(dict(name=name, cat='stage', ph='X', pid=pid, tid=profile.pid,
+                           ts=(profile.start + start) * 1e6, dur=wall * 1e6))
+    return events
+
+
+def chrome_trace(run_profile: Profile, sample_profiles: List[Profile]) -> Dict[str, Any]:
+    """Get a Chrome trace of the run and the samples subtyped by each worker process
+
+    The trace is in the Trace Event Format which can be viewed with chrome://tracing or https://ui.perfetto.dev. Each
+    worker process is shown as a thread with a span for each sample it subtyped and nested spans for the stages of
+    subtyping the sample.
+
+    Args:
+        run_profile: Profile of the whole run in the main process
+        sample_profiles: Profiles of each sample with spans recorded
+
+    Returns:
+        Trace Event Format JSON object
+    """
+    pid = run_profile.pid
+    events = [dict(name='process_name', ph='M', pid=pid, tid=pid, args=dict(name='hansel')),
+              dict(name='thread_name', ph='M', pid=pid, tid=pid, args=dict(name=f'main (pid {pid})'))]
+    workers = sorted({x.pid for x in sample_profiles} - {pid})
+    for i, worker_pid in enumerate(workers, start=1):
+        events.append(dict(name='thread_name', ph='M', pid=pid, tid=worker_pid,
+                           args=dict(name=f'worker {i} (pid {worker_pid})')))
+        events.append(dict(name='thread_sort_index', ph='M', pid=pid, tid=worker_pid, args=dict(sort_index=i)))
+    events += _trace_events(run_profile, pid, 'run')
+    for profile in sample_profiles:
+        events += _trace_events(profile, pid, 'sample', dict(cpu=profile.cpu,
+                                                             child_cpu=profile.child_cpu,
+                                                             peak_rss_mb=profile.peak_rss_mb,
+                                                             **profile.counts))
+    return dict(traceEvents=events, displayTimeUnit='ms')
+
+
+def write_chrome_trace(path: str, trace: Dict[str, Any]) -> None:
+    with open(path, 'w') as f:
+        json.dump(trace, f)
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+"""
+Live progress and throughput reporting of subtyping runs.
+
+Worker processes report the sample they start and finish and, every `REPORT_INTERVAL` seconds while parsing, the
+number of reads/contigs and bases parsed since their last report to a queue. A `ProgressMonitor` in the main process
+consumes the queue in a background thread and shows samples done/total, reads and bases per second, ETA and the
+current sample of each worker either as a live rich progress display or as periodic log lines for non-interactive
+batch jobs.
+
+Reporting is a no-op in processes where `init_progress_worker` has not been called with a queue so that parsing is not
+slowed down when progress is not shown.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+from .const import PROGRESS_MODES
+
+# minimum seconds between worker progress reports
+REPORT_INTERVAL = 0.5
+# records parsed between checks of whether a progress report is due
+REPORT_CHECK_RECORDS = 1000
+
+# queue of progress events of this process or None if progress is not reported
+_queue = None
+
+
+def init_progress_worker(queue) -> None:
+    """Report progress events of this (worker) process to `queue` (or stop reporting if None)"""
+    global _queue
+    _queue = queue
+
+
+def _report(*event: Any) -> None:
+    if _queue is not None:
+        _queue.put((os.getpid(),) + event)
+
+
+@contextmanager
+def sample_progress(sample: str) -> Iterator[None]:
+    """Report the start and end of subtyping a sample"""
+    _report('start', sample)
+    try:
+        yield
+    finally:
+        _report('finish', sample)
+
+
+def progress_iter(records: Iterable[Tuple[str, str]]) -> Iterable[Tuple[str, str]]:
+    """Report the number of records (reads or contigs) and bases parsed from an iterable of (header, sequence)"""
+    if _queue is None:
+        return records
+    return _progress_iter(records)
+
+
+def _progress_iter(records: Iterable[Tuple[str, str]]) -> Iterator[Tuple[str, str]]:
+    n = 0
+    bases = 0
+    last_report = time.monotonic()
+    try:
+        for record in records:
+            n += 1
+            bases += len(record[1])
+            if n % REPORT_CHECK_RECORDS == 0 and time.monotonic() - last_report >= REPORT_INTERVAL:
+                _report('parsed', n, bases)
+                n = bases = 0
+                last_report = time.monotonic()
+            yield record
+    finally:
+        if n:
+            _report('parsed', n, bases)
+
+
+class ProgressState(object):
+    """Progress of a subtyping run aggregated from worker progress events
+
+    Args:
+        total_samples: Number of samples to subtype
+        total_bytes: Total input file size of the samples to subtype (ETA is estimated from the input bytes of
+            finished samples if > 0, otherwise from the number of finished samples)
+        sample_bytes: Input file size of each sample
+    """
+
+    def __init__(self, total_samples: int, total_bytes: int = 0, sample_bytes: Optional[Dict[str, int]] = None):
+        self.total_samples = total_samples
+        self.total_bytes = total_bytes
+        self.sample_bytes = sample_bytes or {}
+        self.start = time.monotonic()
+        self.done_samples = 0
+        self.done_bytes = 0
+        self.reads = 0
+        self.bases = 0
+        # worker pid to current sample and reads parsed for it
+        self.workers = {}  # type: Dict[int, list]
+        self._lock = threading.Lock()
+
+    def handle(self, event: Tuple[Any, ...]) -> None:
+        pid, kind, *values = event
+        with self._lock:
+            if kind == 'start':
+                self.workers[pid] = [values[0], 0]
+            elif kind == 'parsed':
+                n, bases = values
+                self.reads += n
+                self.bases += bases
+                if pid in self.workers:
+                    self.workers[pid][1] += n
+            elif kind == 'finish':
+                self.workers[pid] = [None, 0]
+                self.done_samples += 1
+                self.done_bytes += self.sample_bytes.get(values[0], 0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            elapsed = time.monotonic() - self.start
+            if self.total_bytes > 0 and self.done_bytes > 0:
+                fraction = self.done_bytes / self.total_bytes
+            elif self.total_samples > 0:
+                fraction = self.done_samples / self.total_samples
+            else:
+                fraction = 1.0
+            eta = elapsed * (1 - fraction) / fraction if fraction > 0 else None
+            return dict(done_samples=self.done_samples,
+                        total_samples=self.total_samples,
+                        elapsed=elapsed,
+                        reads_per_second=self.reads / elapsed if elapsed > 0 else 0.0,
+                        bases_per_second=self.bases / elapsed if elapsed > 0 else 0.0,
+                        eta=eta,
+                        workers=[(pid, sample, n) for pid, (sample, n) in sorted(self.workers.items())])
+
+
+def _si(x: float) -> str:
+    for unit in ['', 'k', 'M', 'G']:
+        if abs(x) < 1000:
+            return f'{x:.1f}{unit}'
+        x /= 1000
+    return f'{x:.1f}T'
+
+
+def _duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return '?'
+    seconds = int(seconds)
+    return f'{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}'
+
+
+def progress_message(snapshot: Dict[str, Any]) -> str:
+    """Get a one line progress message"""
+    x = snapshot
+    pct = 100 * x['done_samples'] / x['total_samples'] if x['total_samples'] else 100.0
+    busy = ['{} ({} reads)'.format(sample, _si(n)) for _, sample, n in x['workers'] if sample]
+    return (f'{x["done_samples"]}/{x["total_samples"]} samples ({pct:.1f}%); {_si(x["reads_per_second"])} reads/s; '
+            f'{_si(x["bases_per_second"])} bases/s; elapsed {_duration(x["elapsed"])}; ETA {_duration(x["eta"])}'
+            + (f'; running: {", ".join(busy)}' if busy else ''))
+
+
+class ProgressMonitor(object):
+    """Consume worker progress events and show progress until stopped
+
+    Example:
+        Show a progress bar while subtyping::
+
+            with ProgressMonitor(len(tasks), mode='bar') as monitor:
+                for st, df in iter_subtyping_results(tasks, n_threads, progress_queue=monitor.queue):
+                    ...
+
+    Args:
+        total_samples: Number of samples to subtype
+        mode: "bar" for a live rich progress display or "log" for periodic log lines
+        interval: Seconds between progress log lines
+        sample_bytes: Input file size of each sample for estimating the ETA
+        console: rich Console to show the progress display on (default: console of the rich logging handler, if any)
+    """
+
+    def __init__(self,
+                 total_samples: int,
+                 mode: str = 'bar',
+                 interval: float = 30.0,
+                 sample_bytes: Optional[Dict[str, int]] = None,
+                 console=None):
+        from multiprocessing import Queue
+
+        if mode not in PROGRESS_MODES:
+            raise ValueError(f'Unknown progress mode "{mode}"; expected one of {PROGRESS_MODES}')
+        self.mode = mode
+        self.interval = interval
+        self.state = ProgressState(total_samples, sum((sample_bytes or {}).values()), sample_bytes)
+        self.queue = Queue()
+        self.console = console
+        self._stop = threading.Event()
+        self._thread = None
+        self._progress = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self) -> None:
+        if self.mode == 'bar':
+            self._start_progress_display()
+        self._thread = threading.Thread(target=self._run, name='progress-monitor', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._drain()
+        if self._progress is not None:
+            self._update_progress_display()
+            self._progress.stop()
+            self._progress = None
+        elif self.mode == 'log':
+            self._log()
+        self.queue.close()
+
+    def _drain(self) -> None:
+        import queue
+        while True:
+            try:
+                self.state.handle(self.queue.get_nowait())
+            except queue.Empty:
+                return
+
+    def _run(self) -> None:
+        import queue
+        last_update = time.monotonic()
+        update_interval = 0.2 if self.mode == 'bar' else self.interval
+        while not self._stop.is_set():
+            try:
+                self.state.handle(self.queue.get(timeout=0.1))
+            except queue.Empty:
+                pass
+            if time.monotonic() - last_update >= update_interval:
+                last_update = time.monotonic()
+                if self.mode == 'bar':
+                    self._update_progress_display()
+                else:
+                    self._log()
+
+    def _log(self) -> None:
+        print(time.strftime('[%Y-%m-%d %X] ') + 'Progress: ' + progress_message(self.state.snapshot()),
+              file=sys.stderr,
+              flush=True)
+
+    def _start_progress_display(self) -> None:
+        from rich.logging import RichHandler
+        from rich.progress import Progress, BarColumn, MofNCompleteColumn, TextColumn, TimeElapsedColumn
+        from rich.text import Text
+
+        class ProgressDisplay(Progress):
+            """Samples progress bar followed by the current sample of each worker"""
+            workers = []
+
+            def get_renderables(self):
+                yield self.make_tasks_table(self.tasks)
+                yield from self.workers
+
+        console = self.console
+        if console is None:
+            console = next((x.console for x in logging.getLogger().handlers if isinstance(x, RichHandler)), None)
+        self._text = Text
+        self._progress = ProgressDisplay(TextColumn('Samples'),
+                                         BarColumn(),
+                                         MofNCompleteColumn(),
+                                         TimeElapsedColumn(),
+                                         TextColumn('{task.fields[stats]}'),
+                                         console=console)
+        self._samples_task = self._progress.add_task('samples', total=self.state.total_samples, stats='')
+        self._progress.start()
+
+    def _update_progress_display(self) -> None:
+        x = self.state.snapshot()
+        stats = (f'{_si(x["reads_per_second"])} reads/s {_si(x["bases_per_second"])} bases/s '
+                 f'ETA {_duration(x["eta"])}')
+        self._progress.workers = [self._text(f'  worker {i}: ' + (f'{sample} ({_si(n)} reads)' if sample else 'idle'),
+                                             style='dim' if sample is None else '')
+                                  for i, (_, sample, n) in enumerate(x['workers'], start=1)]
+        self._progress.update(self._samples_task, completed=x['done_samples'], stats=stats)
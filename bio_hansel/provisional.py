@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+Provisional subtyping of reads while they are read.
+
+Scheme k-mers are counted in the reads as they arrive (e.g. from a sequencer through a named pipe or standard input)
+and the reads are periodically subtyped from the k-mer frequencies counted so far (see
+`Subtyper.subtype_reads_kmer_counts`). Each of these provisional calls is reported with the number of reads and
+seconds it took to reach it.
+
+The call is final once the same subtype has passed QC for a number of consecutive provisional calls. Since QC checks
+the k-mer coverage thresholds of the scheme's `SubtypingParams` (e.g. `min_coverage_warning` and
+`low_coverage_depth_freq`), a final call has the coverage required of a call from the whole read set. Reading stops
+once the call is final; if the reads run out first, the last call is the subtype of all of the reads.
+
+Example:
+    Subtype reads streamed from a sequencer as soon as the call is stable::
+
+        basecaller | hansel-stream -s heidelberg -n sample1 - --calls calls.jsonl -o summary.tsv
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional, Union
+
+import attr
+import pandas as pd
+
+from . import __version__
+from .subtype import Subtype
+from .qc.const import QC
+
+DEFAULT_INTERVAL_READS = 20000
+DEFAULT_INTERVAL_SECONDS = 10.0
+DEFAULT_STABLE_CALLS = 3
+
+
+@attr.s
+class ProvisionalCall(object):
+    """Subtyping result of the reads read so far
+
+    Attributes:
+        st: Subtype result
+        df: Detailed subtyping results
+        n_reads: Number of reads subtyped
+        seconds: Seconds from the start of reading to the call
+        is_final: Is this the last call for the sample?
+        is_stable: Has the subtype passed QC for the required number of consecutive calls? A final call that is not
+            stable is the subtype of all of the reads.
+    """
+    st = attr.ib(validator=attr.validators.instance_of(Subtype))  # type: Subtype
+    df = attr.ib(repr=False)  # type: pd.DataFrame
+    n_reads = attr.ib()  # type: int
+    seconds = attr.ib()  # type: float
+    is_final = attr.ib(default=False)  # type: bool
+    is_stable = attr.ib(default=False)  # type: bool
+
+
+def iter_provisional_calls(subtyper,
+                           reads: Union[str, List[str]],
+                           genome_name: str,
+                           interval_reads: int = DEFAULT_INTERVAL_READS,
+                           interval_seconds: Optional[float] = DEFAULT_INTERVAL_SECONDS,
+                           stable_calls: int = DEFAULT_STABLE_CALLS) -> Iterator[ProvisionalCall]:
+    """Subtype reads while they are read yielding provisional calls until the call is final
+
+    A provisional call is made after every `interval_reads` reads or, for slowly arriving reads, once a read arrives
+    at least `interval_seconds` after the previous call.
+
+    Args:
+        subtyper: `bio_hansel.subtyper.Subtyper` with the scheme loaded
+        reads: Input FASTQ file path(s), named pipe(s) or "-" for standard input
+        genome_name: Input genome name
+        interval_reads: Maximum number of reads between provisional calls
+        interval_seconds: Maximum seconds between provisional calls (default: only `interval_reads`)
+        stable_calls: Number of consecutive provisional calls with the same subtype passing QC for the call to be final
+
+    Yields:
+        Provisional calls; the last call is final
+    """
+    from .aho_corasick import _iter_fastqs_reads, kmer_counts_table
+    from .pipeline import pipelined
+
+    fastqs = [reads] if isinstance(reads, str) else reads
+    automaton = subtyper.automaton
+    kmer_seq_counts: Dict[str, int] = defaultdict(int)
+    # subtypes of the consecutive calls passing QC
+    passing: List[str] = []
+    start = time.monotonic()
+    last_call_reads = 0
+    last_call_time = start
+    n_reads = 0
+
+    def call(is_final: bool) -> ProvisionalCall:
+        nonlocal last_call_reads, last_call_time
+        st, df = subtyper.subtype_reads_kmer_counts(kmer_counts_table(automaton, kmer_seq_counts), reads, genome_name)
+        last_call_reads = n_reads
+        last_call_time = time.monotonic()
+        if st.qc_status != QC.PASS or not st.subtype or (passing and passing[-1] != st.subtype):
+            passing.clear()
+        if st.qc_status == QC.PASS and st.subtype:
+            passing.append(st.subtype)
+        is_stable = len(passing) >= stable_calls
+        return ProvisionalCall(st, df,
+                               n_reads=n_reads,
+                               seconds=last_call_time - start,
+                               is_final=is_final or is_stable,
+                               is_stable=is_stable)
+
+    # small batches so that slowly arriving reads are counted soon after they arrive
+    records = pipelined(_iter_fastqs_reads(tuple(fastqs)), batch_size=100)
+    try:
+        for n_reads, (_, sequence) in enumerate(records, start=1):
+            for _, (_, kmer_seq, _) in automaton.iter(sequence):
+                kmer_seq_counts[kmer_seq] += 1
+            if not kmer_seq_counts:
+                continue
+            if n_reads - last_call_reads >= interval_reads \
+                    or (interval_seconds is not None and time.monotonic() - last_call_time >= interval_seconds):
+                result = call(is_final=False)
+                yield result
+                if result.is_final:
+                    return
+    finally:
+        # stop reading any remaining reads
+        records.close()
+    yield call(is_final=True)
+
+
+def call_record(result: ProvisionalCall) -> dict:
+    """Get the output record of a provisional call
+
+    Args:
+        result: Provisional call
+
+    Returns:
+        Subtyping summary record with the number of reads and seconds to the call and whether it is final and stable
+    """
+    from .output import summary_output_record, summary_record
+
+    record = summary_output_record(summary_record(result.st))
+    record.update(n_reads=result.n_reads,
+                  seconds=round(result.seconds, 3),
+                  is_final=result.is_final,
+                  is_stable=result.is_stable)
+    return record
+
+
+def init_parser():
+    parser = argparse.ArgumentParser(prog='hansel-stream',
+                                     description='Subtype reads while they are read, reporting provisional subtype '
+                                                 'calls until the call is stable')
+    parser.add_argument('reads',
+                        nargs='+',
+                        help='FASTQ files, named pipes or "-" for standard input of the reads of one sample')
+    parser.add_argument('-n', '--sample-name',
+                        help='Sample name (default: from the first FASTQ filename)')
+    parser.add_argument('-s', '--scheme',
+                        default='heidelberg',
+                        help='Scheme to use for subtyping (built-in: "heidelberg", "enteritidis", "typhimurium", '
+                             '"typhi", "tb_lineage"; OR user-specified: /path/to/user/scheme)')
+    parser.add_argument('--scheme-name', help='Custom user-specified SNP substyping scheme name')
+    parser.add_argument('--calls',
+                        default='-',
+                        help='JSON Lines output path of each provisional call with the number of reads and seconds '
+                             'to the call (default: standard output)')
+    parser.add_argument('-o', '--output-summary', help='Final subtyping summary output path')
+    parser.add_argument('-O', '--output-kmer-results', help='Final subtyping kmer matching output path')
+    parser.add_argument('--force',
+                        action='store_true',
+                        help='Force existing output files to be overwritten')
+    parser.add_argument('--interval-reads',
+                        type=int,
+                        default=DEFAULT_INTERVAL_READS,
+                        help=f'Maximum reads between provisional calls (default={DEFAULT_INTERVAL_READS})')
+    parser.add_argument('--interval-seconds',
+                        type=float,
+                        default=DEFAULT_INTERVAL_SECONDS,
+                        help=f'Maximum seconds between provisional calls (default={DEFAULT_INTERVAL_SECONDS:g})')
+    parser.add_argument('--stable-calls',
+                        type=int,
+                        default=DEFAULT_STABLE_CALLS,
+                        help='Consecutive provisional calls of the same subtype passing QC for the call to be final '
+                             f'(default={DEFAULT_STABLE_CALLS})')
+    for name, opt_type in [('min_kmer_freq', int), ('min_kmer_frac', float), ('max_kmer_freq', int),
+                           ('low_cov_depth_freq', int), ('max_missing_kmers', float), ('min_ambiguous_kmers', int),
+                           ('low_cov_warning', int), ('max_intermediate_kmers', float),
+                           ('max_degenerate_kmers', int)]:
+        parser.add_argument('--' + name.replace('_', '-'), type=opt_type, help='See "hansel --help"')
+    parser.add_argument('-v', '--verbose',
+                        action='count',
+                        default=0,
+                        help='Logging verbosity level (-v == show warnings; -vvv == show debug info)')
+    parser.add_argument('-V', '--version',
+                        action='version',
+                        version='%(prog)s {}'.format(__version__))
+    return parser
+
+
+def main():
+    from .const import STDIN_PATH
+    from .main import init_console_logger
+
+    parser = init_parser()
+    args = parser.parse_args()
+    if args.interval_reads < 1:
+        parser.error('"--interval-reads" must be at least 1')
+    if args.stable_calls < 1:
+        parser.error('"--stable-calls" must be at least 1')
+    if args.reads.count(STDIN_PATH) > 1:
+        parser.error('Standard input ("-") can only be read once')
+    if STDIN_PATH in args.reads and not args.sample_name:
+        parser.error('A sample name ("-n") is required to read standard input')
+    for path in args.reads:
+        if path != STDIN_PATH and not os.path.exists(path):
+            parser.error(f'Input file "{path}" does not exist')
+    init_console_logger(args.verbose)
+
+    from .output import JsonLinesWriter, prepare_kmer_results, write_table
+    from .subtyper import Subtyper
+    from .utils import init_subtyping_params, check_expanded_kmers, does_file_exist, fastq_sample_name, \
+        df_field_fillna
+    from .const import SUBTYPE_SUMMARY_COLS
+
+    for path in [args.output_summary, args.output_kmer_results, None if args.calls == '-' else args.calls]:
+        does_file_exist(path, args.force)
+    genome_name = args.sample_name or fastq_sample_name(args.reads[0])[0]
+    subtyper = Subtyper(args.scheme,
+                        subtyping_params=init_subtyping_params(args, args.scheme),
+                        scheme_name=args.scheme_name)
+    check_expanded_kmers(subtyper.bundle.n_expanded_kmers, subtyper.subtyping_params.max_degenerate_kmers)
+    reads = args.reads[0] if len(args.reads) == 1 else args.reads
+    result = None
+    try:
+        with JsonLinesWriter(args.calls) as calls_writer:
+            for result in iter_provisional_calls(subtyper, reads, genome_name,
+                                                 interval_reads=args.interval_reads,
+                                                 interval_seconds=args.interval_seconds,
+                                                 stable_calls=args.stable_calls):
+                calls_writer.write(call_record(result))
+                logging.info('%s call for sample "%s" after %s reads (%.1f seconds): subtype "%s" (QC %s)',
+                             'Final' if result.is_final else 'Provisional',
+                             genome_name, result.n_reads, result.seconds, result.st.subtype, result.st.qc_status)
+    except (ValueError, OSError) as ex:
+        logging.error(ex)
+        sys.exit(1)
+    if result.is_stable:
+        logging.info('Subtype of sample "%s" is stable after %s reads (%.1f seconds)',
+                     genome_name, result.n_reads, result.seconds)
+    else:
+        logging.warning('Subtype of sample "%s" was not stable before the reads ran out; reporting the subtype of all '
+                        '%s reads', genome_name, result.n_reads)
+    if args.output_summary:
+        from .output import summary_record
+        dfsummary = df_field_fillna(pd.DataFrame([summary_record(result.st)])[SUBTYPE_SUMMARY_COLS])
+        write_table(dfsummary, args.output_summary)
+    if args.output_kmer_results:
+        write_table(prepare_kmer_results(result.df), args.output_kmer_results)
+
+
+if __name__ == '__main__':
+    main()
@@ -8,3 +8,4 @@ class QC:
     UNCONFIDENT_RESULTS_ERROR_4 = 'Inconclusive Results Error 4'
     NO_SUBTYPE_RESULT = 'No subtype result!'
     NO_TARGETS_FOUND = 'No kmers/targets were found in this sample.'
+    SUBTYPING_ERROR = 'Subtyping error'
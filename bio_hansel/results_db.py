@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite results store for accumulating subtyping results across runs.
+
+Subtyping summaries are upserted by sample, scheme and scheme version so that re-running a sample replaces its previous
+results, and k-mer hits are replaced for each re-run sample. Results are written in one transaction per batch of
+samples as results arrive.
+"""
+import logging
+import sqlite3
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from . import __version__
+from .const import SUBTYPE_SUMMARY_COLS
+
+SUMMARY_COLUMN_TYPES = [('sample', 'TEXT NOT NULL'),
+                        ('scheme', 'TEXT NOT NULL'),
+                        ('scheme_version', 'TEXT NOT NULL'),
+                        ('kmer_set', 'TEXT'),
+                        ('subtype', 'TEXT'),
+                        ('all_subtypes', 'TEXT'),
+                        ('kmers_matching_subtype', 'TEXT'),
+                        ('are_subtypes_consistent', 'INTEGER'),
+                        ('inconsistent_subtypes', 'TEXT'),
+                        ('n_kmers_matching_all', 'INTEGER'),
+                        ('n_kmers_matching_all_expected', 'TEXT'),
+                        ('n_kmers_matching_positive', 'INTEGER'),
+                        ('n_kmers_matching_positive_expected', 'TEXT'),
+                        ('n_kmers_matching_subtype', 'INTEGER'),
+                        ('n_kmers_matching_subtype_expected', 'TEXT'),
+                        ('file_path', 'TEXT'),
+                        ('avg_kmer_coverage', 'REAL'),
+                        ('qc_status', 'TEXT'),
+                        ('qc_message', 'TEXT'),
+                        ('run_id', 'INTEGER'), ]
+
+KMER_HITS_COLUMN_TYPES = [('sample', 'TEXT NOT NULL'),
+                          ('scheme', 'TEXT NOT NULL'),
+                          ('scheme_version', 'TEXT NOT NULL'),
+                          ('kmername', 'TEXT'),
+                          ('refposition', 'INTEGER'),
+                          ('subtype', 'TEXT'),
+                          ('is_pos_kmer', 'INTEGER'),
+                          ('seq', 'TEXT'),
+                          ('freq', 'INTEGER'),
+                          ('is_kmer_freq_okay', 'INTEGER'),
+                          ('kmer_fraction', 'REAL'),
+                          ('is_kmer_fraction_okay', 'INTEGER'),
+                          ('contig_id', 'TEXT'),
+                          ('match_index', 'INTEGER'),
+                          ('is_revcomp', 'INTEGER'),
+                          ('run_id', 'INTEGER'), ]
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started TEXT,
+    finished TEXT,
+    bio_hansel_version TEXT,
+    n_samples INTEGER
+);
+CREATE TABLE IF NOT EXISTS summary (
+    {', '.join(f'{c} {t}' for c, t in SUMMARY_COLUMN_TYPES)},
+    PRIMARY KEY (sample, scheme, scheme_version)
+);
+CREATE INDEX IF NOT EXISTS summary_subtype ON summary (subtype);
+CREATE INDEX IF NOT EXISTS summary_scheme_version ON summary (scheme, scheme_version);
+CREATE TABLE IF NOT EXISTS kmer_hits (
+    {', '.join(f'{c} {t}' for c, t in KMER_HITS_COLUMN_TYPES)}
+);
+CREATE INDEX IF NOT EXISTS kmer_hits_sample ON kmer_hits (sample, scheme, scheme_version);
+CREATE INDEX IF NOT EXISTS kmer_hits_subtype ON kmer_hits (subtype);
+"""
+
+
+def _sql_value(x: Any) -> Any:
+    if x is None or isinstance(x, (str, int, float)):
+        return None if isinstance(x, float) and x != x else x
+    if hasattr(x, 'item'):
+        # numpy scalar
+        return _sql_value(x.item())
+    return str(x)
+
+
+class ResultsDatabase(object):
+    """SQLite store of subtyping results across runs
+
+    Results for each sample are passed to `add` as the summary record and detailed subtyping results of the sample,
+    like the other results writers.
+
+    Args:
+        path: SQLite database file path; created if it does not exist
+        samples_per_transaction: Number of samples to write per transaction
+        include_kmers: Store the k-mer hits for each sample?
+    """
+
+    def __init__(self, path: str, samples_per_transaction: int = 100, include_kmers: bool = True):
+        self.path = path
+        self.samples_per_transaction = samples_per_transaction
+        self.include_kmers = include_kmers
+        self.n_samples = 0
+        self._batch: List[Tuple[Dict[str, Any], Optional[pd.DataFrame]]] = []
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+        with self.conn:
+            cursor = self.conn.execute('INSERT INTO runs (started, bio_hansel_version) VALUES (?, ?)',
+                                       (datetime.now().isoformat(), __version__))
+        self.run_id = cursor.lastrowid
+        logging.info('Writing results of run %s to SQLite results database "%s"', self.run_id, path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, summary: Dict[str, Any], df: Optional[pd.DataFrame]) -> None:
+        self._batch.append((summary, df if self.include_kmers else None))
+        if len(self._batch) >= self.samples_per_transaction:
+            self.flush()
+
+    def _summary_row(self, summary: Dict[str, Any]) -> List[Any]:
+        row = dict(summary)
+        row['scheme_version'] = row.get('scheme_version') or ''
+        row['run_id'] = self.run_id
+        return [_sql_value(row.get(c)) for c, _ in SUMMARY_COLUMN_TYPES]
+
+    def _kmer_hits_rows(self, summary: Dict[str, Any], df: pd.DataFrame) -> List[List[Any]]:
+        df = df[df['kmername'].notnull()] if 'kmername' in df.columns else df.iloc[0:0]
+        key = dict(sample=summary['sample'],
+                   scheme=summary['scheme'],
+                   scheme_version=summary.get('scheme_version') or '',
+                   run_id=self.run_id)
+        columns = [c for c, _ in KMER_HITS_COLUMN_TYPES]
+        values = [df[c].tolist() if c in df.columns else [key.get(c)] * df.shape[0] for c in columns]
+        return [[_sql_value(x) for x in row] for row in zip(*values)]
+
+    def flush(self) -> None:
+        """Upsert the summaries and replace the k-mer hits of buffered samples in one transaction"""
+        if not self._batch:
+            return
+        summary_columns = [c for c, _ in SUMMARY_COLUMN_TYPES]
+        kmer_hits_columns = [c for c, _ in KMER_HITS_COLUMN_TYPES]
+        with self.conn:
+            self.conn.executemany(f'INSERT OR REPLACE INTO summary ({", ".join(summary_columns)}) '
+                                  f'VALUES ({", ".join("?" * len(summary_columns))})',
+                                  [self._summary_row(summary) for summary, _ in self._batch])
+            for summary, df in self._batch:
+                if df is None:
+                    continue
+                self.conn.execute('DELETE FROM kmer_hits WHERE sample = ? AND scheme = ? AND scheme_version = ?',
+                                  (summary['sample'], summary['scheme'], summary.get('scheme_version') or ''))
+                self.conn.executemany(f'INSERT INTO kmer_hits ({", ".join(kmer_hits_columns)}) '
+                                      f'VALUES ({", ".join("?" * len(kmer_hits_columns))})',
+                                      self._kmer_hits_rows(summary, df))
+        self.n_samples += len(self._batch)
+        self._batch = []
+
+    def close(self) -> None:
+        if self.conn is None:
+            return
+        self.flush()
+        with self.conn:
+            self.conn.execute('UPDATE runs SET finished = ?, n_samples = ? WHERE run_id = ?',
+                              (datetime.now().isoformat(), self.n_samples, self.run_id))
+        self.conn.close()
+        self.conn = None
+        logging.info('Wrote results of %s samples to SQLite results database "%s"', self.n_samples, self.path)
+
+
+def read_summary(path: str, sample: Optional[str] = None, subtype: Optional[str] = None) -> pd.DataFrame:
+    """Read subtyping summaries from a SQLite results database
+
+    Args:
+        path: SQLite database file path
+        sample: Only read summaries for this sample
+        subtype: Only read summaries for this subtype
+
+    Returns:
+        Subtyping summaries
+    """
+    conditions = []
+    params = []
+    if sample is not None:
+        conditions.append('sample = ?')
+        params.append(sample)
+    if subtype is not None:
+        conditions.append('subtype = ?')
+        params.append(subtype)
+    where = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+    with sqlite3.connect(path) as conn:
+        return pd.read_sql_query(f'SELECT {", ".join(SUBTYPE_SUMMARY_COLS)} FROM summary{where}', conn, params=params)
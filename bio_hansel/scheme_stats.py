@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Validation and profiling of subtyping schemes.
+
+All checks and statistics are computed in a single pass over the scheme k-mers (and their non-degenerate expansions)
+using dicts and sets so that they scale linearly to schemes with tens of thousands of subtypes.
+"""
+import re
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import attr
+from ahocorasick import Automaton
+
+from .const import bases_dict
+from .subtype_stats import REGEX_SUBTYPE
+from .utils import expand_degenerate_bases, revcomp
+
+REGEX_KMER_HEADER = re.compile(r'^(negative)?(\d+)-(.+)$')
+ERROR = 'ERROR'
+WARNING = 'WARNING'
+
+
+@attr.s
+class SchemeIssue(object):
+    level = attr.ib(validator=attr.validators.in_([ERROR, WARNING]))
+    message = attr.ib(validator=attr.validators.instance_of(str))
+    # scheme k-mer headers the issue applies to
+    kmers = attr.ib(factory=list)  # type: List[str]
+
+
+def validate_scheme(kmers: List[Tuple[str, str]],
+                    max_degenerate_kmers: Optional[int] = None,
+                    max_examples: int = 5) -> List[SchemeIssue]:
+    """Validate scheme k-mers
+
+    Errors are problems that prevent subtyping with the scheme or make results wrong:
+
+    - k-mer headers not formatted as ``<refposition>-<subtype>`` or ``negative<refposition>-<subtype>``
+    - invalid subtypes (not numbers delimited by periods) or nucleotide characters
+    - duplicate k-mer headers
+    - identical non-degenerate k-mer sequences (including reverse complements) from different k-mers, only one of which
+      can be matched
+    - non-degenerate k-mer sequences contained in longer k-mers (or their reverse complements) from different k-mers,
+      which are matched wherever the longer k-mers are
+    - more non-degenerate k-mers than `max_degenerate_kmers`
+
+    Warnings are possible problems:
+
+    - k-mers of different lengths
+    - refpositions without both positive and negative k-mers
+    - subtypes with only negative k-mers or without k-mers for a parent subtype
+
+    Args:
+        kmers: Scheme k-mer headers and sequences
+        max_degenerate_kmers: Maximum number of non-degenerate k-mers including reverse complements
+        max_examples: Maximum number of offending k-mers to show in each issue message
+
+    Returns:
+        List of issues found
+    """
+    issues = []
+
+    def add_issue(level: str, message: str, headers: List[str]) -> None:
+        examples = ', '.join(f'"{x}"' for x in headers[:max_examples])
+        more = f' and {len(headers) - max_examples} more' if len(headers) > max_examples else ''
+        issues.append(SchemeIssue(level, f'{message} (n={len(headers)}): {examples}{more}', headers))
+
+    bad_headers = []
+    bad_subtypes = []
+    bad_seqs = []
+    header_counts = Counter()
+    lengths = Counter()
+    refposition_signs = defaultdict(set)
+    pos_subtypes = set()
+    all_subtypes = set()
+    # non-degenerate k-mer or reverse complement sequence to headers of k-mers that expand to it
+    seq_headers = defaultdict(set)
+    # header and sequence of each non-degenerate k-mer
+    expanded_kmers = []
+    n_expanded = 0
+    for header, seq in kmers:
+        header_counts[header] += 1
+        lengths[len(seq)] += 1
+        m = REGEX_KMER_HEADER.match(header)
+        if not m:
+            bad_headers.append(header)
+            continue
+        negative, refposition, subtype = m.groups()
+        if not REGEX_SUBTYPE.match(subtype):
+            bad_subtypes.append(header)
+            continue
+        all_subtypes.add(subtype)
+        if not negative:
+            pos_subtypes.add(subtype)
+        refposition_signs[int(refposition)].add(not negative)
+        if any(c not in bases_dict for c in seq):
+            bad_seqs.append(header)
+            continue
+        for expanded in expand_degenerate_bases(seq):
+            n_expanded += 1
+            expanded_kmers.append((header, expanded))
+            seq_headers[expanded].add(header)
+            rc = revcomp(expanded)
+            if rc != expanded:
+                seq_headers[rc].add(header)
+
+    if bad_headers:
+        add_issue(ERROR, 'K-mer headers not formatted as "<refposition>-<subtype>" or '
+                         '"negative<refposition>-<subtype>"', bad_headers)
+    if bad_subtypes:
+        add_issue(ERROR, 'K-mer subtypes not formatted as numbers delimited by periods (e.g. "1.2.3")', bad_subtypes)
+    if bad_seqs:
+        add_issue(ERROR, f'K-mer sequences with characters other than {"".join(bases_dict.keys())}', bad_seqs)
+    duplicate_headers = [h for h, n in header_counts.items() if n > 1]
+    if duplicate_headers:
+        add_issue(ERROR, 'Duplicate k-mer headers', duplicate_headers)
+    colliding = sorted({h for headers in seq_headers.values() if len(headers) > 1 for h in headers})
+    if colliding:
+        add_issue(ERROR, 'K-mers with identical or reverse complementary (non-degenerate) sequences; only one of '
+                         'each set of colliding k-mers can be matched', colliding)
+    # only k-mers shorter than others can be contained in them without colliding
+    if len(lengths) > 1:
+        contained = sorted(_contained_kmers(expanded_kmers, seq_headers))
+        if contained:
+            add_issue(ERROR, 'K-mers with (non-degenerate) sequences contained in longer k-mers or their reverse '
+                             'complements; they are matched wherever the longer k-mers are', contained)
+    if max_degenerate_kmers is not None and n_expanded * 2 > max_degenerate_kmers:
+        issues.append(SchemeIssue(ERROR, f'Scheme expands to {n_expanded * 2} non-degenerate k-mers and reverse '
+                                         f'complements which is more than the maximum of {max_degenerate_kmers}'))
+    if len(lengths) > 1:
+        issues.append(SchemeIssue(WARNING, f'K-mers are not all the same length: '
+                                           f'{dict(sorted(lengths.items()))} (length: count)'))
+    unpaired = [str(x) for x, signs in sorted(refposition_signs.items()) if len(signs) < 2]
+    if unpaired:
+        add_issue(WARNING, 'Refpositions without both positive and negative k-mers', unpaired)
+    negative_only = sorted(all_subtypes - pos_subtypes)
+    if negative_only:
+        add_issue(WARNING, 'Subtypes with only negative k-mers', negative_only)
+    missing_parents = sorted({x for x in pos_subtypes if '.' in x and x.rsplit('.', 1)[0] not in pos_subtypes})
+    if missing_parents:
+        add_issue(WARNING, 'Subtypes without positive k-mers for their parent subtype', missing_parents)
+    return issues
+
+
+def _contained_kmers(expanded_kmers: List[Tuple[str, str]], seq_headers: Dict[str, set]) -> set:
+    """Find k-mers contained in longer k-mers
+
+    An Aho-Corasick automaton of all non-degenerate k-mer sequences and reverse complements is run over each
+    non-degenerate k-mer to find the shorter k-mers within it.
+
+    Args:
+        expanded_kmers: Header and sequence of each non-degenerate k-mer
+        seq_headers: Non-degenerate k-mer or reverse complement sequence to headers of k-mers that expand to it
+
+    Returns:
+        Headers of k-mers contained in a longer k-mer with a different header
+    """
+    automaton = Automaton()
+    for seq, headers in seq_headers.items():
+        automaton.add_word(seq, (len(seq), headers))
+    automaton.make_automaton()
+    contained = set()
+    for header, seq in expanded_kmers:
+        for _, (length, headers) in automaton.iter(seq):
+            if length < len(seq):
+                contained.update(h for h in headers if h != header)
+    return contained
+
+
+def profile_scheme(bundle) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Profile a compiled scheme
+
+    Args:
+        bundle: Compiled scheme (see `bio_hansel.bundle.SchemeBundle`)
+
+    Returns:
+        - Dict of scheme summary statistics
+        - List of dicts of statistics for each subtype with positive k-mers
+    """
+    lengths = Counter(len(seq) for _, seq in bundle.kmers)
+    n_degenerate = sum(1 for _, seq in bundle.kmers if any(len(bases_dict[c]) > 1 for c in seq))
+    n_positive = int(bundle.kmer_is_positive.sum())
+    n_children = Counter(parent for parent in bundle.hierarchy.values() if parent is not None)
+    depths = {x: x.count('.') + 1 for x in bundle.subtype_counts}
+    summary = dict(kmer_set=bundle.kmer_set,
+                   scheme_version=bundle.scheme_version,
+                   n_kmers=len(bundle.kmers),
+                   n_positive_kmers=n_positive,
+                   n_negative_kmers=len(bundle.kmers) - n_positive,
+                   n_degenerate_kmers=n_degenerate,
+                   n_expanded_kmers=bundle.n_expanded_kmers,
+                   kmer_lengths=', '.join(f'{k}: {n}' for k, n in sorted(lengths.items())),
+                   n_refpositions=len(set(bundle.kmer_refposition.tolist())),
+                   n_subtypes=len(bundle.subtype_counts),
+                   max_subtype_depth=max(depths.values(), default=0),
+                   has_metadata=bool(bundle.metadata))
+    subtypes = [dict(subtype=x.subtype,
+                     parent=bundle.hierarchy.get(x.subtype),
+                     depth=depths[x.subtype],
+                     n_child_subtypes=n_children.get(x.subtype, 0),
+                     n_refpositions=len(x.refpositions or []),
+                     subtype_kmer_count=x.subtype_kmer_count,
+                     positive_kmer_count=x.positive_kmer_count,
+                     negative_kmer_count=x.negative_kmer_count,
+                     all_kmer_count=x.all_kmer_count)
+                for x in sorted(bundle.subtype_counts.values(), key=lambda x: x.subtype)]
+    return summary, subtypes
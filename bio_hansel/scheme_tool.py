@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+`hansel-scheme` command for working with subtyping schemes.
+"""
+import argparse
+import json
+import logging
+import sys
+from timeit import default_timer as timer
+
+from . import __version__
+
+SCRIPT_NAME = 'hansel-scheme'
+
+
+def compile_command(args: argparse.Namespace) -> None:
+    from .bundle import compile_scheme_fasta, compile_builtin_scheme, builtin_bundle_path, write_bundle
+    from .const import SCHEME_FASTAS
+    from .utils import get_scheme_fasta
+
+    start_time = timer()
+    if args.builtin:
+        for scheme in SCHEME_FASTAS:
+            write_bundle(compile_builtin_scheme(scheme), builtin_bundle_path(scheme))
+        return
+    if not args.scheme or not args.output:
+        raise ValueError('A scheme and output bundle path ("-o") must be specified unless compiling the built-in '
+                         'scheme bundles with "--builtin"')
+    if args.scheme in SCHEME_FASTAS:
+        bundle = compile_builtin_scheme(args.scheme)
+    else:
+        bundle = compile_scheme_fasta(get_scheme_fasta(args.scheme),
+                                      scheme_version=args.scheme_version,
+                                      metadata_path=args.metadata)
+    write_bundle(bundle, args.output)
+    logging.info('Compiled scheme "%s" with %s k-mers and %s subtypes into "%s" in %.3fs',
+                 args.scheme, len(bundle.kmers), len(bundle.subtype_counts), args.output, timer() - start_time)
+
+
+def info_command(args: argparse.Namespace) -> None:
+    from .bundle import read_bundle_header
+
+    print(json.dumps(read_bundle_header(args.bundle), indent=2))
+
+
+def validate_command(args: argparse.Namespace) -> None:
+    from .parsers import parse_fasta
+    from .scheme_stats import validate_scheme, ERROR
+    from .utils import get_scheme_fasta
+
+    scheme_fasta = get_scheme_fasta(args.scheme)
+    issues = validate_scheme(list(parse_fasta(scheme_fasta)), max_degenerate_kmers=args.max_degenerate_kmers)
+    for issue in issues:
+        log = logging.error if issue.level == ERROR else logging.warning
+        log(issue.message)
+    n_errors = sum(1 for x in issues if x.level == ERROR)
+    if n_errors:
+        raise ValueError(f'Scheme "{scheme_fasta}" is invalid with {n_errors} error(s) and '
+                         f'{len(issues) - n_errors} warning(s)')
+    logging.info('Scheme "%s" is valid with %s warning(s)', scheme_fasta, len(issues))
+
+
+def profile_command(args: argparse.Namespace) -> None:
+    from .bundle import load_scheme
+    from .scheme_stats import profile_scheme
+
+    start_time = timer()
+    bundle = load_scheme(args.scheme)
+    logging.info('Loaded scheme "%s" in %.3fs', args.scheme, timer() - start_time)
+    summary, subtypes = profile_scheme(bundle)
+    print(json.dumps(summary, indent=2))
+    if args.subtypes_output:
+        import pandas as pd
+        pd.DataFrame(subtypes).to_csv(args.subtypes_output, sep='\t', index=False)
+        logging.info('Wrote stats for %s subtypes to "%s"', len(subtypes), args.subtypes_output)
+
+
+def init_parser():
+    parser = argparse.ArgumentParser(prog=SCRIPT_NAME,
+                                     description='Compile, validate and profile bio_hansel subtyping schemes')
+    parser.add_argument('-v', '--verbose',
+                        action='count',
+                        default=0,
+                        help='Logging verbosity level (-v == show warnings; -vvv == show debug info)')
+    parser.add_argument('-V', '--version',
+                        action='version',
+                        version='%(prog)s {}'.format(__version__))
+    subparsers = parser.add_subparsers(dest='command', metavar='COMMAND')
+    subparsers.required = True
+
+    compile_parser = subparsers.add_parser('compile',
+                                           help='Compile a scheme FASTA into a binary scheme bundle that can be used '
+                                                'with "hansel -s"')
+    compile_parser.add_argument('scheme',
+                                nargs='?',
+                                help='Scheme FASTA path or built-in scheme name')
+    compile_parser.add_argument('-o', '--output',
+                                help='Output scheme bundle path')
+    compile_parser.add_argument('--scheme-version',
+                                help='Scheme version to store in the bundle')
+    compile_parser.add_argument('--metadata',
+                                help='Subtype metadata table (.tsv, .tab or .csv with a "subtype" column) to store in '
+                                     'the bundle')
+    compile_parser.add_argument('--builtin',
+                                action='store_true',
+                                help='Recompile the scheme bundles shipped with the built-in schemes')
+    compile_parser.set_defaults(func=compile_command)
+
+    info_parser = subparsers.add_parser('info', help='Show the header of a scheme bundle')
+    info_parser.add_argument('bundle', help='Scheme bundle path')
+    info_parser.set_defaults(func=info_command)
+
+    validate_parser = subparsers.add_parser('validate',
+                                            help='Check a scheme FASTA for malformed, duplicate and colliding k-mers '
+                                                 '(exit code 1 if there are errors)')
+    validate_parser.add_argument('scheme', help='Scheme FASTA path or built-in scheme name')
+    validate_parser.add_argument('--max-degenerate-kmers',
+                                 type=int,
+                                 help='Maximum number of non-degenerate k-mers including reverse complements the '
+                                      'scheme may expand to')
+    validate_parser.set_defaults(func=validate_command)
+
+    profile_parser = subparsers.add_parser('profile',
+                                           help='Show k-mer and subtype statistics for a scheme as JSON')
+    profile_parser.add_argument('scheme', help='Scheme FASTA path, scheme bundle path or built-in scheme name')
+    profile_parser.add_argument('--subtypes-output',
+                                help='Output tab-delimited table of per-subtype k-mer statistics')
+    profile_parser.set_defaults(func=profile_command)
+    return parser
+
+
+def main():
+    from .main import init_console_logger
+
+    parser = init_parser()
+    args = parser.parse_args()
+    init_console_logger(args.verbose)
+    try:
+        args.func(args)
+    except (ValueError, OSError) as ex:
+        logging.error(ex)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,434 @@
+# -*- coding: utf-8 -*-
+"""
+Long-running local subtyping service.
+
+Subtyping a single sample with `hansel` is dominated by interpreter startup, scheme parsing and Aho-Corasick automaton
+construction. The service keeps schemes loaded in a pool of worker processes and accepts subtyping jobs as JSON over
+HTTP on localhost or on a Unix domain socket, returning the same summary and k-mer results as the `hansel` JSON Lines
+outputs.
+
+Endpoints:
+
+- ``GET /health``: service status
+- ``GET /schemes``: built-in schemes and versions
+- ``POST /subtype``: subtype a sample, e.g.::
+
+    {"sample": "SRR123", "reads": ["SRR123_1.fastq.gz", "SRR123_2.fastq.gz"], "scheme": "heidelberg"}
+    {"sample": "genome", "contigs": "genome.fasta", "scheme": "/path/to/scheme.fasta",
+     "subtyping_params": {"min_kmer_freq": 10}, "kmer_results": false}
+
+  and the response is ``{"summary": {...}, "kmer_results": [...]}``.
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from multiprocessing import Pool
+from socketserver import ThreadingMixIn, UnixStreamServer
+from threading import BoundedSemaphore, Lock
+from typing import Any, Dict, List, Optional
+
+import attr
+
+from . import __version__, program_name
+from .bundle import read_scheme
+from .const import SCHEME_FASTAS
+from .output import summary_record, summary_output_record, kmer_records, prepare_kmer_results, metadata_lookup
+from .subtyper import Subtyper
+from .subtyping_params import SubtypingParams
+from .utils import init_subtyping_params, check_expanded_kmers
+
+DEFAULT_PORT = 8765
+SUBTYPING_PARAMS_FIELDS = set(attr.fields_dict(SubtypingParams).keys())
+
+
+class ServiceBusy(Exception):
+    """The service is running its maximum number of concurrent subtyping jobs"""
+
+
+@attr.s
+class LoadedScheme(object):
+    """Scheme loaded for subtyping with its subtype metadata lookup"""
+    subtyper = attr.ib()  # type: Subtyper
+    metadata = attr.ib(factory=dict)  # type: Dict[str, Dict[str, Any]]
+
+
+def load_scheme(scheme: str) -> LoadedScheme:
+    """Load a scheme for subtyping with a copy of its default subtyping parameters
+
+    Custom schemes are loaded without the per-process scheme cache of `bio_hansel.bundle.load_scheme` so that they
+    are released once unloaded from the `SchemeCache`.
+    """
+    logging.info('Loading scheme "%s"', scheme)
+    subtyper = Subtyper(scheme=scheme,
+                        subtyping_params=attr.evolve(init_subtyping_params(scheme=scheme)),
+                        bundle=None if scheme in SCHEME_FASTAS else read_scheme(scheme))
+    check_expanded_kmers(subtyper.bundle.n_expanded_kmers, subtyper.subtyping_params.max_degenerate_kmers)
+    return LoadedScheme(subtyper=subtyper, metadata=metadata_lookup(subtyper.bundle.metadata_table()))
+
+
+class SchemeCache(object):
+    """Loaded schemes of a worker process
+
+    Built-in schemes stay loaded once used. Custom scheme files are keyed on their path and modification time so that
+    edited schemes are reloaded, and only the `max_custom_schemes` most recently used are kept loaded.
+    """
+
+    def __init__(self, max_custom_schemes: int = 8):
+        self.max_custom_schemes = max_custom_schemes
+        self.builtin = {}  # type: Dict[str, LoadedScheme]
+        self.custom = OrderedDict()  # type: OrderedDict
+
+    def get(self, scheme: str) -> LoadedScheme:
+        if scheme in SCHEME_FASTAS:
+            if scheme not in self.builtin:
+                self.builtin[scheme] = load_scheme(scheme)
+            return self.builtin[scheme]
+        key = (os.path.abspath(scheme), os.stat(scheme).st_mtime_ns)
+        if key in self.custom:
+            self.custom.move_to_end(key)
+            return self.custom[key]
+        loaded = load_scheme(scheme)
+        self.custom[key] = loaded
+        while len(self.custom) > self.max_custom_schemes:
+            (path, _), _ = self.custom.popitem(last=False)
+            logging.info('Unloaded least recently used custom scheme "%s"', path)
+        return loaded
+
+
+# scheme cache of a worker process
+_schemes = None  # type: Optional[SchemeCache]
+
+
+def init_worker(preload: List[str], max_custom_schemes: int) -> None:
+    global _schemes
+    _schemes = SchemeCache(max_custom_schemes)
+    for scheme in preload:
+        _schemes.get(scheme)
+
+
+def parse_job(request: Dict[str, Any]) -> Dict[str, Any]:
+    """Validate a subtyping job request
+
+    Args:
+        request: Decoded JSON subtyping request
+
+    Returns:
+        Subtyping job with defaults filled in
+
+    Raises:
+        ValueError: if the request is invalid
+    """
+    if not isinstance(request, dict):
+        raise ValueError('Subtyping request must be a JSON object')
+    sample = request.get('sample')
+    if not isinstance(sample, str) or sample == '':
+        raise ValueError('Subtyping request must specify a "sample" name')
+    if ('contigs' in request) == ('reads' in request):
+        raise ValueError('Subtyping request must specify one of "contigs" or "reads"')
+    if 'contigs' in request:
+        paths = [request['contigs']]
+    else:
+        paths = request['reads'] if isinstance(request['reads'], list) else [request['reads']]
+    for path in paths:
+        if not isinstance(path, str) or not os.path.isfile(path):
+            raise ValueError(f'Input file "{path}" does not exist')
+    scheme = request.get('scheme', 'heidelberg')
+    if not isinstance(scheme, str) or (scheme not in SCHEME_FASTAS and not os.path.isfile(scheme)):
+        raise ValueError(f'Scheme "{scheme}" is not a built-in scheme or a scheme FASTA file')
+    params = request.get('subtyping_params') or {}
+    if not isinstance(params, dict) or not set(params.keys()) <= SUBTYPING_PARAMS_FIELDS:
+        raise ValueError(f'"subtyping_params" must be an object with keys in {sorted(SUBTYPING_PARAMS_FIELDS)}')
+    try:
+        attr.evolve(SubtypingParams(), **params)
+    except (TypeError, AttributeError) as ex:
+        raise ValueError(f'Invalid "subtyping_params": {ex}')
+    return dict(sample=sample,
+                contigs=request.get('contigs'),
+                reads=None if 'contigs' in request else paths,
+                scheme=scheme,
+                scheme_name=request.get('scheme_name'),
+                subtyping_params=params,
+                kmer_results=bool(request.get('kmer_results', True)))
+
+
+def run_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Subtype a sample in a worker process with its loaded schemes
+
+    Args:
+        job: Subtyping job (see `parse_job`)
+
+    Returns:
+        Dict with the subtyping summary and, if requested, k-mer results records
+    """
+    loaded = _schemes.get(job['scheme'])
+    subtyper = loaded.subtyper
+    subtyping_params = None
+    if job['subtyping_params']:
+        subtyping_params = attr.evolve(subtyper.subtyping_params, **job['subtyping_params'])
+    subtyper = subtyper.with_options(subtyping_params=subtyping_params, scheme_name=job['scheme_name'])
+    if job['contigs']:
+        st, df = subtyper.subtype_contigs(job['contigs'], job['sample'])
+    else:
+        st, df = subtyper.subtype_reads(job['reads'], job['sample'])
+    out = {'summary': summary_output_record(summary_record(st), loaded.metadata)}
+    if job['kmer_results']:
+        out['kmer_results'] = kmer_records(prepare_kmer_results(df))
+    return out
+
+
+class SubtypingService(object):
+    """Pool of worker processes with loaded schemes that subtype samples
+
+    Each worker process keeps its own loaded schemes so memory use grows with the number of workers. `subtype` may be
+    called from multiple threads; at most `max_concurrent` jobs are accepted at once and further jobs are rejected
+    with `ServiceBusy` rather than queued without bound.
+
+    Args:
+        n_workers: Number of worker processes
+        max_concurrent: Maximum number of running and queued jobs (default: 2 jobs per worker)
+        max_custom_schemes: Maximum number of custom schemes kept loaded in each worker
+        preload: Schemes to load in each worker at startup
+    """
+
+    def __init__(self,
+                 n_workers: int = 1,
+                 max_concurrent: Optional[int] = None,
+                 max_custom_schemes: int = 8,
+                 preload: Optional[List[str]] = None):
+        self.n_workers = n_workers
+        self.max_concurrent = max_concurrent or 2 * n_workers
+        self._slots = BoundedSemaphore(self.max_concurrent)
+        self._lock = Lock()
+        self.n_active = 0
+        self.n_completed = 0
+        logging.info('Starting %s subtyping workers', n_workers)
+        self.pool = Pool(processes=n_workers,
+                         initializer=init_worker,
+                         initargs=(list(preload or []), max_custom_schemes))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def subtype(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Subtype a sample
+
+        Args:
+            request: Subtyping request (see `parse_job`)
+
+        Returns:
+            Dict with the subtyping summary and, if requested, k-mer results records
+
+        Raises:
+            ValueError: if the request is invalid
+            ServiceBusy: if `max_concurrent` jobs are already running or queued
+        """
+        job = parse_job(request)
+        if not self._slots.acquire(blocking=False):
+            raise ServiceBusy(f'Service is running the maximum of {self.max_concurrent} concurrent jobs')
+        try:
+            with self._lock:
+                self.n_active += 1
+            return self.pool.apply(run_job, (job,))
+        finally:
+            with self._lock:
+                self.n_active -= 1
+                self.n_completed += 1
+            self._slots.release()
+
+    def status(self) -> Dict[str, Any]:
+        return dict(status='ok',
+                    version=__version__,
+                    workers=self.n_workers,
+                    max_concurrent=self.max_concurrent,
+                    active_jobs=self.n_active,
+                    completed_jobs=self.n_completed)
+
+    def close(self) -> None:
+        self.pool.terminate()
+        self.pool.join()
+
+
+class SubtypingRequestHandler(BaseHTTPRequestHandler):
+    server_version = f'{program_name}/{__version__}'
+
+    def address_string(self):
+        # Unix domain socket clients have no address
+        return self.client_address[0] if self.client_address else 'unix-socket'
+
+    def log_message(self, format, *args):
+        logging.debug('%s - %s', self.address_string(), format % args)
+
+    def _send_json(self, status: int, obj: Any, headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, self.server.service.status())
+        elif self.path == '/schemes':
+            self._send_json(200, {name: {'version': x['version']} for name, x in SCHEME_FASTAS.items()})
+        else:
+            self._send_json(404, {'error': f'Unknown endpoint "{self.path}"'})
+
+    def do_POST(self):
+        if self.path != '/subtype':
+            self._send_json(404, {'error': f'Unknown endpoint "{self.path}"'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'null')
+            self._send_json(200, self.server.service.subtype(request))
+        except (ValueError, FileNotFoundError) as ex:
+            self._send_json(400, {'error': str(ex)})
+        except ServiceBusy as ex:
+            self._send_json(503, {'error': str(ex)}, {'Retry-After': '1'})
+        except Exception as ex:
+            logging.exception('Subtyping request failed')
+            self._send_json(500, {'error': f'{type(ex).__name__}: {ex}'})
+
+
+class SubtypingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int, service: SubtypingService):
+        super().__init__(('127.0.0.1', port), SubtypingRequestHandler)
+        self.service = service
+
+
+class SubtypingUnixServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, service: SubtypingService):
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, SubtypingRequestHandler)
+        self.service = service
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a Unix domain socket"""
+
+    def __init__(self, socket_path: str, timeout: Optional[float] = None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def request_subtyping(request: Dict[str, Any],
+                      port: int = DEFAULT_PORT,
+                      socket_path: Optional[str] = None,
+                      timeout: Optional[float] = None) -> Dict[str, Any]:
+    """Send a subtyping request to a running subtyping service
+
+    Args:
+        request: Subtyping request (see `parse_job`)
+        port: Service localhost HTTP port
+        socket_path: Service Unix domain socket path; used instead of `port` if specified
+        timeout: Request timeout in seconds
+
+    Returns:
+        Dict with the subtyping summary and, if requested, k-mer results records
+
+    Raises:
+        RuntimeError: if the service could not subtype the sample
+    """
+    if socket_path:
+        conn = UnixHTTPConnection(socket_path, timeout=timeout)
+    else:
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    try:
+        conn.request('POST', '/subtype', body=json.dumps(request), headers={'Content-Type': 'application/json'})
+        resp = conn.getresponse()
+        out = json.loads(resp.read())
+    finally:
+        conn.close()
+    if resp.status != 200:
+        raise RuntimeError(f'Subtyping service error {resp.status}: {out.get("error")}')
+    return out
+
+
+def init_parser():
+    parser = argparse.ArgumentParser(prog='hansel-server',
+                                     description='Run a local bio_hansel subtyping service that keeps schemes loaded '
+                                                 'in a pool of worker processes')
+    parser.add_argument('-p', '--port',
+                        type=int,
+                        default=DEFAULT_PORT,
+                        help=f'Localhost HTTP port to listen on (default={DEFAULT_PORT})')
+    parser.add_argument('--socket',
+                        help='Unix domain socket path to listen on instead of a localhost HTTP port')
+    parser.add_argument('-t', '--threads',
+                        type=int,
+                        default=1,
+                        help='Number of subtyping worker processes (default=1)')
+    parser.add_argument('--max-concurrent',
+                        type=int,
+                        help='Maximum number of concurrent subtyping jobs; further requests are rejected with HTTP '
+                             '503 (default=2 per worker)')
+    parser.add_argument('--max-custom-schemes',
+                        type=int,
+                        default=8,
+                        help='Maximum number of custom schemes kept loaded per worker (default=8)')
+    parser.add_argument('--preload',
+                        nargs='*',
+                        default=list(SCHEME_FASTAS.keys()),
+                        help='Schemes to load when workers start (default: all built-in schemes)')
+    parser.add_argument('-v', '--verbose',
+                        action='count',
+                        default=0,
+                        help='Logging verbosity level (-v == show warnings; -vvv == show debug info)')
+    return parser
+
+
+def main():
+    from .main import init_console_logger
+    args = init_parser().parse_args()
+    init_console_logger(args.verbose)
+    service = SubtypingService(n_workers=args.threads,
+                               max_concurrent=args.max_concurrent,
+                               max_custom_schemes=args.max_custom_schemes,
+                               preload=args.preload)
+    if args.socket:
+        server = SubtypingUnixServer(args.socket, service)
+        logging.info('Listening on Unix socket "%s"', args.socket)
+    else:
+        server = SubtypingHTTPServer(args.port, service)
+        logging.info('Listening on http://127.0.0.1:%s', args.port)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        logging.info('Shutting down')
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == '__main__':
+    main()
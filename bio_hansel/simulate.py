@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+"""
+Simulate reads and assemblies of a particular subtype from a subtyping scheme for testing and benchmarking.
+
+A synthetic genome of a subtype is made by placing the positive k-mers of the subtype and its parent subtypes and the
+negative k-mers of all other refpositions between random spacer sequences. Reads are sampled uniformly from both
+strands of the genome to a given coverage and contigs are made by splitting the genome, with random substitutions
+introduced at a given per-base error rate.
+
+Usage:
+    python -m bio_hansel.simulate -s heidelberg --subtype 2.2.1.1.1 --coverage 30 --error-rate 0.005 -o outdir
+"""
+import argparse
+import gzip
+import logging
+import os
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .const import bases_dict
+from .parsers import parse_fasta
+from .qc.utils import component_subtypes
+from .utils import get_scheme_fasta
+
+# nucleotides indexed by 2-bit code; the complement of code `x` is `3 - x`
+NT_CODES = np.frombuffer(b'ACGT', dtype=np.uint8)
+# number of reads (or read pairs) generated at a time
+READ_BATCH_SIZE = 10000
+
+
+def _random_seq(rng: np.random.Generator, length: int) -> str:
+    return NT_CODES[rng.integers(0, 4, length)].tobytes().decode()
+
+
+def _resolve_degenerate_bases(rng: np.random.Generator, seq: str) -> str:
+    return ''.join(bases_dict[c][rng.integers(0, len(bases_dict[c]))] for c in seq)
+
+
+def simulate_genome(kmers: List[Tuple[str, str]],
+                    subtype: str,
+                    genome_size: Optional[int] = None,
+                    spacer_length: int = 100,
+                    seed: Optional[int] = None) -> str:
+    """Simulate a genome sequence of a subtype
+
+    Args:
+        kmers: Scheme k-mer headers and sequences
+        subtype: Subtype to simulate
+        genome_size: Genome size; if larger than the scheme k-mers and minimum spacers, the k-mers are spread evenly
+            across a random sequence of this size
+        spacer_length: Minimum length of random sequence between k-mers
+        seed: Random seed
+
+    Returns:
+        Genome sequence
+    """
+    rng = np.random.default_rng(seed)
+    lineage = set(component_subtypes(subtype))
+    # a refposition may have positive k-mers for several subtypes with different alleles
+    positive = defaultdict(dict)
+    negative = {}
+    for header, seq in kmers:
+        refposition, kmer_subtype = header.replace('negative', '').split('-', 1)
+        if header.startswith('negative'):
+            negative[int(refposition)] = seq
+        else:
+            positive[int(refposition)][kmer_subtype] = seq
+    if not any(subtype in x for x in positive.values()):
+        raise ValueError(f'Subtype "{subtype}" has no positive k-mers in the scheme')
+    segments = []
+    for refposition in sorted(set(positive) | set(negative)):
+        lineage_seqs = [seq for x, seq in positive[refposition].items() if x in lineage]
+        if lineage_seqs:
+            segments.append(lineage_seqs[0])
+        elif refposition in negative:
+            segments.append(negative[refposition])
+    segments = [_resolve_degenerate_bases(rng, x) for x in segments]
+    kmers_length = sum(len(x) for x in segments)
+    if genome_size is not None:
+        spacer_length = max(spacer_length, (genome_size - kmers_length) // (len(segments) + 1))
+    spacer_lengths = [spacer_length] * (len(segments) + 1)
+    if genome_size is not None:
+        spacer_lengths[-1] += max(0, genome_size - kmers_length - spacer_length * len(spacer_lengths))
+    spacers = [_random_seq(rng, x) for x in spacer_lengths]
+    genome = [spacers[0]]
+    for segment, spacer in zip(segments, spacers[1:]):
+        genome += [segment, spacer]
+    return ''.join(genome)
+
+
+def _encode(seq: str) -> np.ndarray:
+    codes = np.zeros(len(seq), dtype=np.uint8)
+    arr = np.frombuffer(seq.encode(), dtype=np.uint8)
+    for code, nt in enumerate(NT_CODES):
+        codes[arr == nt] = code
+    return codes
+
+
+def _add_errors(rng: np.random.Generator, codes: np.ndarray, error_rate: float) -> np.ndarray:
+    if error_rate <= 0:
+        return codes
+    errors = rng.random(codes.shape) < error_rate
+    # substitute a different base at each error position
+    return np.where(errors, (codes + rng.integers(1, 4, codes.shape, dtype=np.uint8)) % 4, codes).astype(np.uint8)
+
+
+def _decode_rows(codes: np.ndarray) -> List[str]:
+    return [x.tobytes().decode() for x in NT_CODES[codes]]
+
+
+def simulate_reads(genome: str,
+                   coverage: float,
+                   read_length: int = 150,
+                   error_rate: float = 0.0,
+                   paired: bool = False,
+                   fragment_length: int = 400,
+                   seed: Optional[int] = None) -> Iterator[Tuple[str, ...]]:
+    """Simulate reads sampled uniformly from both strands of a genome
+
+    Args:
+        genome: Genome sequence
+        coverage: Mean read coverage depth
+        read_length: Read length
+        error_rate: Per-base substitution error rate
+        paired: Simulate paired-end reads
+        fragment_length: Paired-end fragment length
+        seed: Random seed
+
+    Yields:
+        Read sequence, or tuple of forward and reverse read sequences of each pair if `paired`
+    """
+    rng = np.random.default_rng(seed)
+    genome_codes = _encode(genome)
+    span = min(fragment_length if paired else read_length, len(genome))
+    read_length = min(read_length, span)
+    n_reads = int(np.ceil(coverage * len(genome) / (read_length * (2 if paired else 1))))
+    offsets = np.arange(read_length)
+    for batch_start in range(0, n_reads, READ_BATCH_SIZE):
+        n = min(READ_BATCH_SIZE, n_reads - batch_start)
+        starts = rng.integers(0, len(genome) - span + 1, n)
+        is_reverse = rng.random(n) < 0.5
+        fwd = genome_codes[starts[:, None] + offsets]
+        # second read of a pair is the reverse complement of the end of the fragment
+        rev = 3 - genome_codes[(starts + span - read_length)[:, None] + offsets][:, ::-1]
+        fwd, rev = np.where(is_reverse[:, None], rev, fwd), np.where(is_reverse[:, None], fwd, rev)
+        fwd = _decode_rows(_add_errors(rng, fwd, error_rate))
+        if paired:
+            yield from zip(fwd, _decode_rows(_add_errors(rng, rev, error_rate)))
+        else:
+            yield from ((x,) for x in fwd)
+
+
+def simulate_contigs(genome: str,
+                     n_contigs: int = 1,
+                     error_rate: float = 0.0,
+                     seed: Optional[int] = None) -> List[str]:
+    """Simulate an assembly by splitting a genome into contigs of similar size
+
+    Args:
+        genome: Genome sequence
+        n_contigs: Number of contigs
+        error_rate: Per-base substitution error rate
+        seed: Random seed
+
+    Returns:
+        Contig sequences
+    """
+    rng = np.random.default_rng(seed)
+    codes = _add_errors(rng, _encode(genome), error_rate)
+    return [NT_CODES[x].tobytes().decode() for x in np.array_split(codes, n_contigs)]
+
+
+def _open_output(path: str):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'wt', compresslevel=1)
+    return open(path, 'w')
+
+
+def write_fasta(path: str, seqs: List[str], prefix: str = 'contig') -> None:
+    with _open_output(path) as f:
+        for i, seq in enumerate(seqs, start=1):
+            f.write(f'>{prefix}_{i}\n{seq}\n')
+
+
+def write_fastqs(paths: List[str], reads: Iterator[Tuple[str, ...]], prefix: str = 'read') -> int:
+    """Write simulated reads to one FASTQ per read of each pair
+
+    Returns:
+        Number of reads (or read pairs) written
+    """
+    n = 0
+    handles = [_open_output(x) for x in paths]
+    try:
+        for n, seqs in enumerate(reads, start=1):
+            for i, (f, seq) in enumerate(zip(handles, seqs), start=1):
+                f.write(f'@{prefix}_{n}/{i}\n{seq}\n+\n{"I" * len(seq)}\n')
+    finally:
+        for f in handles:
+            f.close()
+    return n
+
+
+def simulate_sample(scheme: str,
+                    subtype: str,
+                    outdir: str,
+                    sample: Optional[str] = None,
+                    coverage: float = 30.0,
+                    error_rate: float = 0.0,
+                    read_length: int = 150,
+                    paired: bool = False,
+                    genome_size: Optional[int] = None,
+                    n_contigs: int = 0,
+                    contig_error_rate: float = 0.0,
+                    compress: bool = False,
+                    seed: Optional[int] = None) -> Dict[str, List[str]]:
+    """Simulate reads and/or contigs of a subtype and write them to an output directory
+
+    Args:
+        scheme: Built-in scheme name or scheme FASTA path
+        subtype: Subtype to simulate
+        outdir: Output directory
+        sample: Sample name used for output file names (default: subtype)
+        coverage: Mean read coverage depth; no reads are simulated if 0
+        error_rate: Per-base substitution error rate of reads
+        read_length: Read length
+        paired: Simulate paired-end reads
+        genome_size: Genome size (see `simulate_genome`)
+        n_contigs: Number of contigs; no contigs are simulated if 0
+        contig_error_rate: Per-base substitution error rate of contigs
+        compress: Gzip compress output files
+        seed: Random seed
+
+    Returns:
+        Dict with lists of output FASTQ paths ("reads") and FASTA paths ("contigs")
+    """
+    sample = sample or f'subtype-{subtype}'
+    ext = '.gz' if compress else ''
+    kmers = list(parse_fasta(get_scheme_fasta(scheme)))
+    genome = simulate_genome(kmers, subtype, genome_size=genome_size, seed=seed)
+    os.makedirs(outdir, exist_ok=True)
+    outputs = {'reads': [], 'contigs': []}
+    if coverage > 0:
+        if paired:
+            paths = [os.path.join(outdir, f'{sample}_{i}.fastq{ext}') for i in (1, 2)]
+        else:
+            paths = [os.path.join(outdir, f'{sample}.fastq{ext}')]
+        n_reads = write_fastqs(paths, simulate_reads(genome, coverage,
+                                                     read_length=read_length,
+                                                     error_rate=error_rate,
+                                                     paired=paired,
+                                                     seed=seed))
+        logging.info('Wrote %s simulated reads of subtype %s to %s', n_reads, subtype, paths)
+        outputs['reads'] = paths
+    if n_contigs > 0:
+        path = os.path.join(outdir, f'{sample}.fasta{ext}')
+        write_fasta(path, simulate_contigs(genome, n_contigs, error_rate=contig_error_rate, seed=seed))
+        logging.info('Wrote %s simulated contigs of subtype %s to "%s"', n_contigs, subtype, path)
+        outputs['contigs'] = [path]
+    return outputs
+
+
+def init_parser():
+    parser = argparse.ArgumentParser(prog='python -m bio_hansel.simulate',
+                                     description='Simulate reads and contigs of a subtype from a subtyping scheme')
+    parser.add_argument('-s', '--scheme', default='heidelberg', help='Built-in scheme name or scheme FASTA path')
+    parser.add_argument('--subtype', required=True, help='Subtype to simulate')
+    parser.add_argument('-o', '--outdir', required=True, help='Output directory')
+    parser.add_argument('--sample', help='Sample name for output file names (default: "subtype-<subtype>")')
+    parser.add_argument('--coverage', type=float, default=30.0, help='Read coverage; 0 for no reads (default=30)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Read per-base substitution rate (default=0)')
+    parser.add_argument('--read-length', type=int, default=150, help='Read length (default=150)')
+    parser.add_argument('--paired', action='store_true', help='Simulate paired-end reads')
+    parser.add_argument('--genome-size', type=int, help='Genome size (default: scheme k-mers with 100 bp spacers)')
+    parser.add_argument('--contigs', type=int, default=0, help='Number of contigs to simulate (default=0)')
+    parser.add_argument('--contig-error-rate',
+                        type=float,
+                        default=0.0,
+                        help='Contig per-base substitution rate (default=0)')
+    parser.add_argument('--gzip', action='store_true', help='Gzip compress outputs')
+    parser.add_argument('--seed', type=int, help='Random seed')
+    return parser
+
+
+def main():
+    args = init_parser().parse_args()
+    logging.basicConfig(level=logging.INFO)
+    simulate_sample(args.scheme, args.subtype, args.outdir,
+                    sample=args.sample,
+                    coverage=args.coverage,
+                    error_rate=args.error_rate,
+                    read_length=args.read_length,
+                    paired=args.paired,
+                    genome_size=args.genome_size,
+                    n_contigs=args.contigs,
+                    contig_error_rate=args.contig_error_rate,
+                    compress=args.gzip,
+                    seed=args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,7 +4,7 @@ from typing import List, Optional
 
 import attr
 
-from .const import REGEX_FASTQ
+from .const import REGEX_FASTQ, STDIN_PATH
 
 
 @attr.s
@@ -13,6 +13,7 @@ class Subtype(object):
     file_path = attr.ib()
     scheme = attr.ib(validator=attr.validators.instance_of(str))
     scheme_version = attr.ib(default=None, validator=attr.validators.optional(attr.validators.instance_of(str)))
+    kmer_set = attr.ib(default=None, validator=attr.validators.optional(attr.validators.instance_of(str)))
     subtype = attr.ib(default=None, validator=attr.validators.optional(attr.validators.instance_of(str)))
     non_present_subtypes = attr.ib(default=None)  # type: Optional[List[str]]
     missing_nested_subtypes = attr.ib(default=None)
@@ -35,20 +36,24 @@ class Subtype(object):
     qc_status = attr.ib(default=None, validator=attr.validators.optional(attr.validators.instance_of(str)))
     qc_message = attr.ib(default=None, validator=attr.validators.optional(attr.validators.instance_of(str)))
     scheme_subtype_counts = attr.ib(default=None, repr=False)
+    # "fasta" or "fastq" if known regardless of input filename(s) (e.g. standard input or named pipes)
+    input_format = attr.ib(default=None, repr=False)
 
     @file_path.validator
     def _file_path_validator(self, attribute, value):
         if isinstance(value, str):
-            if not os.path.exists(self.file_path):
+            if value != STDIN_PATH and not os.path.exists(self.file_path):
                 raise OSError('Input file "{}" does not exist!'.format(value))
         elif isinstance(value, list):
             for x in value:
-                if not os.path.exists(x):
+                if x != STDIN_PATH and not os.path.exists(x):
                     raise OSError('Input file "{}" does not exist!'.format(x))
         else:
             raise ValueError(f'Unexpected type for input file path "{type(value)}": {value}')
 
     def is_fastq_input(self):
+        if self.input_format is not None:
+            return self.input_format == 'fastq'
         if isinstance(self.file_path, str):
             return bool(REGEX_FASTQ.match(self.file_path))
         elif isinstance(self.file_path, list):
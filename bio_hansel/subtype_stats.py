@@ -1,14 +1,20 @@
 # -*- coding: utf-8 -*-
+import hashlib
 import logging
+import os
 import re
 from collections import defaultdict
-from typing import Dict, List, Set
+from functools import lru_cache
+from typing import Dict, Iterable, List, Set, Tuple
 
 import attr
 
 from .parsers import parse_fasta
 
 
+REGEX_SUBTYPE = re.compile(r'^\d+(\.\d+)*$')
+
+
 @attr.s
 class SubtypeCounts:
     subtype = attr.ib()
@@ -20,7 +26,6 @@ class SubtypeCounts:
 
     @subtype.validator
     def _check_subtype(self, attribute, value):
-        REGEX_SUBTYPE = re.compile(r'^\d+(\.\d+)*$')
         if value is None or value == '':
             raise ValueError('Subtype cannot be None or empty string')
         if not REGEX_SUBTYPE.match(value):
@@ -49,11 +54,11 @@ class SubtypeCounts:
                              f'positive kmers cannot be zero!')
 
 
-def _kmers(kmers_fasta: str) -> (Dict[str, List[str]], Dict[str, List[str]], Set[int]):
+def _kmers(scheme_kmers: Iterable[Tuple[str, str]]) -> (Dict[str, List[str]], Dict[str, List[str]], Set[int]):
     kmers = defaultdict(list)
     neg_kmers = defaultdict(list)
     sizes = set()
-    for h, s in parse_fasta(kmers_fasta):
+    for h, s in scheme_kmers:
         sizes.add(len(s))
         _, st = h.split('-')
         if 'negative' not in h:
@@ -64,10 +69,28 @@ def _kmers(kmers_fasta: str) -> (Dict[str, List[str]], Dict[str, List[str]], Set
 
 
 def subtype_counts(scheme_fasta: str) -> Dict[str, SubtypeCounts]:
+    return subtype_counts_from_kmers(parse_fasta(scheme_fasta), scheme_fasta)
+
+
+def subtype_counts_from_kmers(scheme_kmers: Iterable[Tuple[str, str]],
+                              scheme: str = 'scheme') -> Dict[str, SubtypeCounts]:
+    """Get summary information about each subtype in a scheme
+
+    Args:
+        scheme_kmers: Scheme kmer headers and sequences
+        scheme: Scheme name or path for log messages
+
+    Returns:
+        Dict of subtype to SubtypeCounts
+    """
     subtype_counts = {}
-    kmers, neg_kmers, sizes = _kmers(scheme_fasta)
+    kmers, neg_kmers, sizes = _kmers(scheme_kmers)
     if len(sizes) > 1:
-        logging.warning('Not all markers in "%s" of the same size! %s', scheme_fasta, sizes)
+        logging.warning('Not all markers in "%s" of the same size! %s', scheme, sizes)
+    # the negative k-mers of a subtype are those of every other subtype except its parent subtypes, so they are
+    # counted by subtracting the parent subtype negative k-mer counts from the total rather than summing over all
+    # other subtypes for each subtype
+    total_neg_count = sum(len(v) for v in neg_kmers.values())
     ks = [x for x in kmers.keys()]
     ks.sort()
     for k in ks:
@@ -78,11 +101,10 @@ def subtype_counts(scheme_fasta: str) -> Dict[str, SubtypeCounts]:
             for i in range(len(r)):
                 sub_k = '.'.join(r[:i + 1])
                 subtypes_set.add(sub_k)
-                pos_kmers = kmers[sub_k]
-                st_pos_count_rest += len(pos_kmers)
+                st_pos_count_rest += len(kmers.get(sub_k, []))
         st_count = len(kmers[k])
         st_count_pos = st_pos_count_rest + st_count
-        st_neg_count = sum(len(v) for k, v in neg_kmers.items() if k not in subtypes_set)
+        st_neg_count = total_neg_count - sum(len(neg_kmers.get(x, [])) for x in subtypes_set)
 
         subtype_count = SubtypeCounts(subtype=k,
                                       refpositions={int(v.split('-')[0]) for v in kmers[k]},
@@ -92,3 +114,42 @@ def subtype_counts(scheme_fasta: str) -> Dict[str, SubtypeCounts]:
                                       all_kmer_count=st_neg_count + st_count_pos)
         subtype_counts[k] = subtype_count
     return subtype_counts
+
+
+def kmer_set_digest(scheme_fasta: str) -> str:
+    """Get a digest identifying the set of k-mers in a scheme
+
+    The digest only depends on the k-mer headers and sequences so that k-mer matches counted against a scheme can be
+    tagged with the exact k-mer set they were counted against regardless of scheme file name or k-mer order.
+
+    Digests are cached by scheme path, modification time and size so that a scheme FASTA edited in place is digested
+    again by long-running processes (e.g. `hansel-server`).
+
+    Args:
+        scheme_fasta: Scheme FASTA path
+
+    Returns:
+        Hex digest of the scheme k-mer set
+    """
+    stat = os.stat(scheme_fasta)
+    return _kmer_set_digest(scheme_fasta, stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=64)
+def _kmer_set_digest(scheme_fasta: str, mtime_ns: int, size: int) -> str:
+    return kmer_set_digest_from_kmers(parse_fasta(scheme_fasta))
+
+
+def kmer_set_digest_from_kmers(kmers: Iterable[Tuple[str, str]]) -> str:
+    """Get a digest identifying a set of scheme k-mers (see `kmer_set_digest`)
+
+    Args:
+        kmers: Scheme k-mer headers and sequences
+
+    Returns:
+        Hex digest of the scheme k-mer set
+    """
+    h = hashlib.sha256()
+    for header, seq in sorted(kmers):
+        h.update(f'{header}\t{seq}\n'.encode())
+    return h.hexdigest()[:16]
@@ -2,20 +2,30 @@
 """
 Functions for subtyping of reads (e.g. FASTQ) and contigs (e.g. FASTA) using bio_hansel-compatible subtyping schemes.
 """
+import copy
+import inspect
 import logging
 import re
-from typing import Optional, List, Dict, Union, Tuple, Set
+import signal
+import threading
+from contextlib import contextmanager
+from functools import partial
+from typing import Optional, List, Dict, Union, Tuple, Set, Callable, Iterator, Any
 
+import attr
 import pandas as pd
 
-from .aho_corasick import init_automaton, find_in_fasta, find_in_fastqs
-from .const import COLUMNS_TO_REMOVE
+from .aho_corasick import find_in_fasta, find_in_fastqs
+from .bundle import load_scheme, SchemeBundle
+from .const import COLUMNS_TO_REMOVE, STDIN_PATH
+from .pipeline import prefetch_files
+from .profiling import Profile, profile_sample, stage, count_input_bytes
+from .progress import init_progress_worker, sample_progress
 from .qc import perform_quality_check, QC
 from .subtype import Subtype
 from .subtype_stats import SubtypeCounts
-from .subtype_stats import subtype_counts
 from .subtyping_params import SubtypingParams
-from .utils import find_inconsistent_subtypes, get_scheme_fasta, get_scheme_version, init_subtyping_params
+from .utils import find_inconsistent_subtypes, get_scheme_version, init_subtyping_params
 
 
 def subtype_reads_samples(reads: List[Tuple[List[str], str]],
@@ -35,17 +45,13 @@ def subtype_reads_samples(reads: List[Tuple[List[str], str]],
         n_threads: number of threads to use for subtyping analysis
 
     Returns:
-        List of tuple of Subtype and detailed subtyping results for each sample
+        List of tuple of Subtype and detailed subtyping results for each sample; samples that could not be subtyped
+        (e.g. unreadable input files) have a "FAIL" QC status with the error as the QC message
     """
     if n_threads == 1:
         logging.info('Serial single threaded run mode on %s input genomes', len(reads))
-        outputs = [subtype_reads(reads=fastq_files,
-                                 genome_name=genome_name,
-                                 scheme=scheme,
-                                 scheme_name=scheme_name,
-                                 subtyping_params=subtyping_params,
-                                 scheme_subtype_counts=scheme_subtype_counts)
-                   for fastq_files, genome_name in reads]
+        tasks = subtyping_tasks([], reads, scheme, scheme_name, subtyping_params, scheme_subtype_counts)
+        outputs = [run_subtyping_task(task, isolate_errors=True) for task in tasks]
     else:
         outputs = parallel_query_reads(reads=reads,
                                        scheme=scheme,
@@ -73,23 +79,284 @@ def subtype_contigs_samples(input_genomes: List[Tuple[str, str]],
         n_threads: number of threads to use for subtyping analysis
 
     Returns:
-        List of tuple of Subtype and detailed subtyping results for each sample
+        List of tuple of Subtype and detailed subtyping results for each sample; samples that could not be subtyped
+        (e.g. unreadable input files) have a "FAIL" QC status with the error as the QC message
     """
     if n_threads == 1:
         logging.info('Serial single threaded run mode on %s input genomes', len(input_genomes))
-        outputs = [subtype_contigs(fasta_path=input_fasta,
-                                   genome_name=genome_name,
-                                   scheme=scheme,
-                                   scheme_name=scheme_name,
-                                   subtyping_params=subtyping_params,
-                                   scheme_subtype_counts=scheme_subtype_counts)
-                   for input_fasta, genome_name in input_genomes]
+        tasks = subtyping_tasks(input_genomes, [], scheme, scheme_name, subtyping_params, scheme_subtype_counts)
+        outputs = [run_subtyping_task(task, isolate_errors=True) for task in tasks]
     else:
         outputs = parallel_query_contigs(input_genomes, scheme, scheme_name, subtyping_params, scheme_subtype_counts,
                                          n_threads)
     return outputs
 
 
+SubtypingTask = Tuple[Callable[..., Tuple[Subtype, pd.DataFrame]], Tuple[Any, ...]]
+
+
+def subtyping_tasks(input_genomes: List[Tuple[str, str]],
+                    reads: List[Tuple[List[str], str]],
+                    scheme: str,
+                    scheme_name: Optional[str] = None,
+                    subtyping_params: Optional[SubtypingParams] = None,
+                    scheme_subtype_counts: Optional[Dict[str, SubtypeCounts]] = None) -> List[SubtypingTask]:
+    """Get the subtyping function and arguments for each input sample
+
+    Args:
+        input_genomes: input genomes; tuple of FASTA file path and genome name
+        reads: input genomes; tuple of list of FASTQ file paths and genome name
+        scheme: bio_hansel scheme FASTA path
+        scheme_name: optional scheme name
+        subtyping_params: scheme specific subtyping parameters
+        scheme_subtype_counts: summary information about scheme
+
+    Returns:
+        List of tuples of subtyping function and arguments
+    """
+    tasks = [(subtype_contigs, (input_fasta, genome_name, scheme, subtyping_params, scheme_name,
+                                scheme_subtype_counts))
+             for input_fasta, genome_name in input_genomes]
+    tasks += [(subtype_reads, (fastqs, genome_name, scheme, scheme_name, subtyping_params, scheme_subtype_counts))
+              for fastqs, genome_name in reads]
+    return tasks
+
+
+def task_sample(task: SubtypingTask) -> Tuple[Any, str]:
+    """Get the input path(s) and sample name of a subtyping task"""
+    _, args = task
+    return args[0], args[1]
+
+
+def reads_stdin(task: SubtypingTask) -> bool:
+    """Does a subtyping task read its input from standard input?"""
+    paths = task_sample(task)[0]
+    return STDIN_PATH in ([paths] if isinstance(paths, str) else paths)
+
+
+class SampleTimeout(TimeoutError):
+    """Subtyping a sample took longer than the per-sample timeout"""
+
+
+@contextmanager
+def sample_timeout(seconds: Optional[float]) -> Iterator[None]:
+    """Raise `SampleTimeout` in the block if it runs longer than `seconds`
+
+    The timeout is implemented with SIGALRM so it interrupts blocking reads (e.g. from a hung decompression process)
+    and only applies in the main thread of a process on Unix.
+    """
+    if not seconds or not hasattr(signal, 'SIGALRM') or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def on_timeout(signum, frame):
+        raise SampleTimeout(f'Subtyping took longer than the timeout of {seconds:g} seconds')
+
+    previous = signal.signal(signal.SIGALRM, on_timeout)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def failed_subtyping_result(sample: str,
+                            file_path: Union[str, List[str]],
+                            scheme: str,
+                            error: str,
+                            scheme_version: Optional[str] = None) -> Tuple[Subtype, pd.DataFrame]:
+    """Get a "FAIL" subtyping result for a sample that could not be subtyped
+
+    Args:
+        sample: Sample name
+        file_path: Input file path(s); may not exist
+        scheme: Scheme name
+        error: Description of the error
+        scheme_version: Scheme version
+
+    Returns:
+        - Subtype result with a "FAIL" QC status and the error as the QC message
+        - pd.DataFrame of detailed subtyping results with 1 null result row (see `empty_results`)
+    """
+    # the input files may not exist
+    with attr.validators.disabled():
+        st = Subtype(sample=sample,
+                     file_path=file_path,
+                     scheme=scheme,
+                     scheme_version=scheme_version,
+                     qc_status=QC.FAIL,
+                     qc_message=f'{QC.SUBTYPING_ERROR}: {error}',
+                     are_subtypes_consistent=False)
+    return st, empty_results(st)
+
+
+def is_failed_sample(st: Subtype) -> bool:
+    """Could the sample not be subtyped due to an error (see `failed_subtyping_result`)?"""
+    return st.qc_status == QC.FAIL and (st.qc_message or '').startswith(QC.SUBTYPING_ERROR)
+
+
+def failed_task_result(task: SubtypingTask, error: str) -> Tuple[Subtype, pd.DataFrame]:
+    """Get a "FAIL" subtyping result for a subtyping task that raised an error"""
+    func, args = task
+    arguments = inspect.signature(func).bind(*args).arguments
+    scheme = arguments.get('scheme_name') or arguments['scheme']
+    return failed_subtyping_result(sample=arguments['genome_name'],
+                                   file_path=task_sample(task)[0],
+                                   scheme=scheme,
+                                   error=error,
+                                   scheme_version=get_scheme_version(arguments['scheme']))
+
+
+def run_subtyping_task(task: SubtypingTask,
+                       timeout: Optional[float] = None,
+                       retries: int = 0,
+                       isolate_errors: bool = False) -> Tuple[Subtype, pd.DataFrame]:
+    """Run a subtyping task
+
+    Args:
+        task: subtyping function and arguments for a sample
+        timeout: maximum seconds to subtype the sample per attempt (see `sample_timeout`)
+        retries: number of times to retry subtyping the sample if it fails or times out; missing or unreadable input
+            files (`OSError`) are not retried
+        isolate_errors: return a "FAIL" result (see `failed_subtyping_result`) if the sample could not be subtyped
+            instead of raising the error
+
+    Returns:
+        Tuple of Subtype and detailed subtyping results
+    """
+    func, args = task
+    sample = task_sample(task)[1]
+    with sample_progress(sample):
+        for attempt in range(retries + 1):
+            try:
+                with sample_timeout(timeout):
+                    return func(*args)
+            except Exception as ex:
+                # missing or unreadable input files fail the same way on every attempt
+                if attempt < retries and (isinstance(ex, SampleTimeout) or not isinstance(ex, OSError)):
+                    logging.warning('Retrying sample "%s" (%s of %s retries) after error: %s: %s',
+                                    sample, attempt + 1, retries, type(ex).__name__, ex)
+                    continue
+                if not isolate_errors:
+                    raise
+                logging.error('Could not subtype sample "%s": %s: %s', sample, type(ex).__name__, ex)
+                return failed_task_result(task, f'{type(ex).__name__}: {ex}')
+
+
+def _iter_task_results(run_task: Callable,
+                       tasks: List[SubtypingTask],
+                       n_threads: int,
+                       progress_queue,
+                       max_tasks_per_worker: Optional[int] = None) -> Iterator:
+    if n_threads == 1:
+        logging.info('Serial single threaded run mode on %s input genomes', len(tasks))
+        init_progress_worker(progress_queue)
+        try:
+            for i, task in enumerate(tasks):
+                # the next sample's input is read into the page cache while this sample is subtyped
+                if i + 1 < len(tasks):
+                    prefetch_files(task_sample(tasks[i + 1])[0])
+                yield run_task(task)
+        finally:
+            init_progress_worker(None)
+        return
+    from multiprocessing import Pool
+    # the standard input of worker processes is /dev/null so a sample streamed through standard input is subtyped by
+    # this process while the worker processes subtype the other samples
+    stdin_tasks = [x for x in tasks if reads_stdin(x)]
+    tasks = [x for x in tasks if not reads_stdin(x)]
+    logging.info('Initializing thread pool with %s threads', n_threads)
+    with Pool(processes=n_threads,
+              initializer=init_progress_worker,
+              initargs=(progress_queue,),
+              maxtasksperchild=max_tasks_per_worker) as pool:
+        logging.info('Running analysis asynchronously on %s input genomes', len(tasks))
+        results = pool.imap_unordered(run_task, tasks)
+        # samples start in input order: the first `n_threads` start at once and the next `n_threads` are prefetched,
+        # then each time a sample is done another one starts and one more is prefetched
+        for task in tasks[n_threads:2 * n_threads]:
+            prefetch_files(task_sample(task)[0])
+        if stdin_tasks:
+            init_progress_worker(progress_queue)
+            try:
+                for task in stdin_tasks:
+                    yield run_task(task)
+            finally:
+                init_progress_worker(None)
+        for i, result in enumerate(results, start=2 * n_threads):
+            if i < len(tasks):
+                prefetch_files(task_sample(tasks[i])[0])
+            yield result
+
+
+def iter_subtyping_results(tasks: List[SubtypingTask],
+                           n_threads: int = 1,
+                           progress_queue=None,
+                           timeout: Optional[float] = None,
+                           retries: int = 0,
+                           isolate_errors: bool = False,
+                           max_tasks_per_worker: Optional[int] = None) -> Iterator[Tuple[Subtype, pd.DataFrame]]:
+    """Run subtyping tasks yielding each result as soon as it is available
+
+    Results from parallel runs are yielded in order of completion rather than in order of input so that each result
+    can be handled (e.g. checkpointed) without waiting on slower samples.
+
+    Args:
+        tasks: subtyping function and arguments for each sample
+        n_threads: number of threads to use for subtyping analysis
+        progress_queue: queue to report progress events to (see `bio_hansel.progress.ProgressMonitor`)
+        timeout: maximum seconds to subtype each sample per attempt
+        retries: number of times to retry subtyping a sample if it fails or times out
+        isolate_errors: yield a "FAIL" result for samples that could not be subtyped instead of raising the error
+            (see `run_subtyping_task`)
+        max_tasks_per_worker: replace worker processes after they have subtyped this many samples (default: never)
+
+    Yields:
+        Tuple of Subtype and detailed subtyping results for each sample
+    """
+    run_task = partial(run_subtyping_task, timeout=timeout, retries=retries, isolate_errors=isolate_errors)
+    yield from _iter_task_results(run_task, tasks, n_threads, progress_queue, max_tasks_per_worker)
+
+
+def run_profiled_subtyping_task(task: SubtypingTask,
+                                time_stages: bool = True,
+                                record_spans: bool = False,
+                                **kwargs) -> Tuple[Subtype, pd.DataFrame, Profile]:
+    with profile_sample(time_stages=time_stages, record_spans=record_spans) as profile:
+        st, df = run_subtyping_task(task, **kwargs)
+        count_input_bytes(st.file_path)
+    profile.name = st.sample
+    return st, df, profile
+
+
+def iter_profiled_subtyping_results(tasks: List[SubtypingTask],
+                                    n_threads: int = 1,
+                                    time_stages: bool = True,
+                                    record_spans: bool = False,
+                                    progress_queue=None,
+                                    **kwargs) -> Iterator[Tuple[Subtype, pd.DataFrame, Profile]]:
+    """Run subtyping tasks recording per-stage timings and resource usage yielding each result as soon as it is
+    available
+
+    See `iter_subtyping_results` and `bio_hansel.profiling`.
+
+    Args:
+        tasks: subtyping function and arguments for each sample
+        n_threads: number of threads to use for subtyping analysis
+        time_stages: record per-stage timings; if False, only resource usage is recorded
+        record_spans: record the start and duration of each stage (see `bio_hansel.profiling.chrome_trace`)
+        progress_queue: queue to report progress events to (see `bio_hansel.progress.ProgressMonitor`)
+        **kwargs: `timeout`, `retries`, `isolate_errors` and `max_tasks_per_worker` (see `iter_subtyping_results`)
+
+    Yields:
+        Tuple of Subtype, detailed subtyping results and profile for each sample
+    """
+    max_tasks_per_worker = kwargs.pop('max_tasks_per_worker', None)
+    run_task = partial(run_profiled_subtyping_task, time_stages=time_stages, record_spans=record_spans, **kwargs)
+    yield from _iter_task_results(run_task, tasks, n_threads, progress_queue, max_tasks_per_worker)
+
+
 def subtype_contigs(fasta_path: str,
                     genome_name: str,
                     scheme: str,
@@ -111,23 +378,29 @@ def subtype_contigs(fasta_path: str,
         - Subtype result
         - pd.DataFrame of detailed subtyping results
     """
-    scheme_fasta = get_scheme_fasta(scheme)
-    if scheme_subtype_counts is None:
-        scheme_subtype_counts = subtype_counts(scheme_fasta)
-    if subtyping_params is None:
-        subtyping_params = init_subtyping_params(scheme=scheme)
-    scheme_version = get_scheme_version(scheme)
-    st = Subtype(sample=genome_name,
-                 file_path=fasta_path,
-                 scheme=scheme_name or scheme,
-                 scheme_version=scheme_version,
-                 scheme_subtype_counts=scheme_subtype_counts)
-
-    automaton = init_automaton(scheme_fasta)
-    df = find_in_fasta(automaton, fasta_path)
+    subtyper = Subtyper(scheme=scheme,
+                        subtyping_params=subtyping_params,
+                        scheme_name=scheme_name,
+                        scheme_subtype_counts=scheme_subtype_counts)
+    return subtyper.subtype_contigs(fasta_path, genome_name)
+
+
+def contigs_subtyping_results(st: Subtype,
+                              df: pd.DataFrame,
+                              subtyping_params: SubtypingParams) -> Tuple[Subtype, pd.DataFrame]:
+    """Get the subtype result and detailed subtyping results from scheme k-mer matches found in contigs
+
+    Args:
+        st: Subtype result with sample, input and scheme info set
+        df: Scheme k-mer matches found in the input contigs (see `find_in_fasta`)
+        subtyping_params: scheme specific subtyping parameters
 
+    Returns:
+        - Subtype result
+        - pd.DataFrame of detailed subtyping results
+    """
     if df is None or df.shape[0] == 0:
-        logging.warning('No subtyping kmer matches for input "%s" for scheme "%s"', fasta_path, scheme)
+        logging.warning('No subtyping kmer matches for input "%s" for scheme "%s"', st.file_path, st.scheme)
         st.qc_status = QC.FAIL
         st.qc_message = QC.NO_TARGETS_FOUND
         st.are_subtypes_consistent = False
@@ -138,15 +411,18 @@ def subtype_contigs(fasta_path: str,
     df['refposition'] = [int(x.replace('negative', '')) for x in refpositions]
     df['subtype'] = subtypes
     df['is_pos_kmer'] = ~df.kmername.str.contains('negative')
-    process_subtyping_results(st, df, scheme_subtype_counts)
-    st.qc_status, st.qc_message = perform_quality_check(st, df, subtyping_params)
+    with stage('process_results'):
+        process_subtyping_results(st, df, st.scheme_subtype_counts)
+    with stage('qc'):
+        st.qc_status, st.qc_message = perform_quality_check(st, df, subtyping_params)
 
     logging.info(st)
 
-    df['sample'] = genome_name
-    df['file_path'] = fasta_path
-    df['scheme'] = scheme_name or scheme
-    df['scheme_version'] = scheme_version
+    df['sample'] = st.sample
+    df['file_path'] = st.file_path
+    df['scheme'] = st.scheme
+    df['scheme_version'] = st.scheme_version
+    df['kmer_set'] = st.kmer_set
     df['qc_status'] = st.qc_status
     df['qc_message'] = st.qc_message
 
@@ -173,21 +449,15 @@ def parallel_query_contigs(input_genomes: List[Tuple[str, str]],
         n_threads: Number of threads to use
 
     Returns:
-        A list of tuples of Subtype results and a pd.DataFrame of detailed subtyping results for each input
+        A list of tuples of Subtype results and a pd.DataFrame of detailed subtyping results for each input; inputs
+        that could not be subtyped have a "FAIL" QC status with the error as the QC message
     """
     from multiprocessing import Pool
     logging.info('Initializing thread pool with %s threads', n_threads)
-    pool = Pool(processes=n_threads)
-    logging.info('Running analysis asynchronously on %s input genomes', len(input_genomes))
-    res = [pool.apply_async(subtype_contigs, (input_fasta,
-                                              genome_name,
-                                              scheme,
-                                              subtyping_params,
-                                              scheme_name,
-                                              scheme_subtype_counts))
-           for input_fasta, genome_name in input_genomes]
-    logging.info('Parallel analysis complete! Retrieving analysis results')
-    return [x.get() for x in res]
+    tasks = subtyping_tasks(input_genomes, [], scheme, scheme_name, subtyping_params, scheme_subtype_counts)
+    with Pool(processes=n_threads) as pool:
+        logging.info('Running analysis asynchronously on %s input genomes', len(input_genomes))
+        return pool.map(partial(run_subtyping_task, isolate_errors=True), tasks)
 
 
 def parallel_query_reads(reads: List[Tuple[List[str], str]],
@@ -209,21 +479,15 @@ def parallel_query_reads(reads: List[Tuple[List[str], str]],
         n_threads: number of threads to use
 
     Returns:
-        A list of tuples of Subtype results and a pd.DataFrame of detailed subtyping results for each input
+        A list of tuples of Subtype results and a pd.DataFrame of detailed subtyping results for each input; inputs
+        that could not be subtyped have a "FAIL" QC status with the error as the QC message
     """
     from multiprocessing import Pool
     logging.info('Initializing thread pool with %s threads', n_threads)
-    pool = Pool(processes=n_threads)
-    logging.info('Running analysis asynchronously on %s input genomes', len(reads))
-    res = [pool.apply_async(subtype_reads, (fastqs,
-                                            genome_name,
-                                            scheme,
-                                            scheme_name,
-                                            subtyping_params,
-                                            scheme_subtype_counts))
-           for fastqs, genome_name in reads]
-    logging.info('Parallel analysis complete! Retrieving analysis results')
-    return [x.get() for x in res]
+    tasks = subtyping_tasks([], reads, scheme, scheme_name, subtyping_params, scheme_subtype_counts)
+    with Pool(processes=n_threads) as pool:
+        logging.info('Running analysis asynchronously on %s input genomes', len(reads))
+        return pool.map(partial(run_subtyping_task, isolate_errors=True), tasks)
 
 
 def get_kmer_fraction(row):
@@ -276,29 +540,29 @@ def subtype_reads(reads: Union[str, List[str]],
         - Subtype result
         - pd.DataFrame of detailed subtyping results
     """
-    scheme_fasta = get_scheme_fasta(scheme)
-    if scheme_subtype_counts is None:
-        scheme_subtype_counts = subtype_counts(scheme_fasta)
-    if subtyping_params is None:
-        subtyping_params = init_subtyping_params(scheme=scheme)
-    scheme_version = get_scheme_version(scheme)
-
-    st = Subtype(sample=genome_name,
-                 file_path=reads,
-                 scheme=scheme_name or scheme,
-                 scheme_version=scheme_version,
-                 scheme_subtype_counts=scheme_subtype_counts)
-
-    automaton = init_automaton(scheme_fasta)
-    if isinstance(reads, str):
-        df = find_in_fastqs(automaton, reads)
-    elif isinstance(reads, list):
-        df = find_in_fastqs(automaton, *reads)
-    else:
-        raise ValueError('Unexpected type "{}" for "reads": {}'.format(type(reads), reads))
+    subtyper = Subtyper(scheme=scheme,
+                        subtyping_params=subtyping_params,
+                        scheme_name=scheme_name,
+                        scheme_subtype_counts=scheme_subtype_counts)
+    return subtyper.subtype_reads(reads, genome_name)
+
+
+def reads_subtyping_results(st: Subtype,
+                            df: pd.DataFrame,
+                            subtyping_params: SubtypingParams) -> Tuple[Subtype, pd.DataFrame]:
+    """Get the subtype result and detailed subtyping results from scheme k-mer frequencies found in reads
+
+    Args:
+        st: Subtype result with sample, input and scheme info set
+        df: Scheme k-mer frequencies found in the input reads (see `find_in_fastqs`)
+        subtyping_params: scheme specific subtyping parameters
 
+    Returns:
+        - Subtype result
+        - pd.DataFrame of detailed subtyping results
+    """
     if df is None or df.shape[0] == 0:
-        logging.warning('No subtyping kmer matches for input "%s" for scheme "%s"', reads, scheme)
+        logging.warning('No subtyping kmer matches for input "%s" for scheme "%s"', st.file_path, st.scheme)
         st.are_subtypes_consistent = False
         st.qc_status = QC.FAIL
         st.qc_message = QC.NO_TARGETS_FOUND
@@ -311,16 +575,20 @@ def subtype_reads(reads: Union[str, List[str]],
     df['is_pos_kmer'] = ~df.kmername.str.contains('negative')
     df['is_kmer_freq_okay'] = (df.freq >= subtyping_params.min_kmer_freq) & (df.freq <= subtyping_params.max_kmer_freq)
     # apply a scaled approach for filtering of k-mers required for high coverage amplicon data
-    df = calc_kmer_fraction(df)
+    with stage('kmer_fraction'):
+        df = calc_kmer_fraction(df)
     df['is_kmer_fraction_okay'] = df.kmer_fraction >= subtyping_params.min_kmer_frac
     st.avg_kmer_coverage = df['freq'].mean()
-    st, filtered_df = process_subtyping_results(st, df[(df.is_kmer_freq_okay & df.is_kmer_fraction_okay)],
-                                                scheme_subtype_counts)
-    st.qc_status, st.qc_message = perform_quality_check(st, filtered_df, subtyping_params)
+    with stage('process_results'):
+        st, filtered_df = process_subtyping_results(st, df[(df.is_kmer_freq_okay & df.is_kmer_fraction_okay)],
+                                                    st.scheme_subtype_counts)
+    with stage('qc'):
+        st.qc_status, st.qc_message = perform_quality_check(st, filtered_df, subtyping_params)
     df['file_path'] = str(st.file_path)
-    df['sample'] = genome_name
-    df['scheme'] = scheme_name or scheme
-    df['scheme_version'] = scheme_version
+    df['sample'] = st.sample
+    df['scheme'] = st.scheme
+    df['scheme_version'] = st.scheme_version
+    df['kmer_set'] = st.kmer_set
     df['qc_status'] = st.qc_status
     df['qc_message'] = st.qc_message
     df = df[df.columns[~df.columns.isin(COLUMNS_TO_REMOVE)]]
@@ -533,3 +801,187 @@ def empty_results(st: Subtype) -> pd.DataFrame:
                                  scheme_version=st.scheme_version,
                                  qc_status=st.qc_status,
                                  qc_message=st.qc_message)}).transpose()
+
+
+class Subtyper(object):
+    """Subtype samples with a scheme loaded once and reused across samples
+
+    The scheme is loaded (see `bio_hansel.bundle.load_scheme`) and its k-mer automaton built when the `Subtyper` is
+    created so that subtyping each sample only searches the input for scheme k-mers.
+
+    Thread-safety: subtyping methods only read the loaded scheme, so a `Subtyper` may be shared by multiple threads
+    subtyping different samples concurrently. The loaded scheme should not be modified after creation; use
+    `with_options` to get a `Subtyper` with different subtyping parameters or scheme name sharing the loaded scheme.
+    Since k-mer searching holds the GIL, use the batch methods with `n_threads` > 1 for parallel subtyping; these
+    send a copy of the `Subtyper` to each worker process once rather than reloading the scheme for each sample.
+
+    Example:
+        Subtype many samples with the Heidelberg scheme::
+
+            subtyper = Subtyper('heidelberg')
+            st, df = subtyper.subtype_contigs('genome.fasta', 'genome')
+            for st, df in subtyper.iter_subtype_samples(reads=[(['a_1.fastq', 'a_2.fastq'], 'a')], n_threads=4):
+                print(st.sample, st.subtype)
+
+    Args:
+        scheme: built-in scheme name, scheme bundle path or scheme FASTA path
+        subtyping_params: scheme specific subtyping parameters (default: scheme defaults)
+        scheme_name: optional scheme name
+        scheme_subtype_counts: summary information about scheme (default: computed from scheme)
+        bundle: loaded scheme (default: loaded with `bio_hansel.bundle.load_scheme`)
+    """
+
+    def __init__(self,
+                 scheme: str = 'heidelberg',
+                 subtyping_params: Optional[SubtypingParams] = None,
+                 scheme_name: Optional[str] = None,
+                 scheme_subtype_counts: Optional[Dict[str, SubtypeCounts]] = None,
+                 bundle: Optional[SchemeBundle] = None):
+        self.scheme = scheme
+        self.scheme_name = scheme_name
+        self.bundle = bundle or load_scheme(scheme)
+        self.scheme_version = get_scheme_version(scheme) or self.bundle.scheme_version
+        self.kmer_set = self.bundle.kmer_set
+        self.subtyping_params = subtyping_params or init_subtyping_params(scheme=scheme)
+        self.scheme_subtype_counts = scheme_subtype_counts or self.bundle.subtype_counts
+        self.automaton = self.bundle.automaton
+
+    def with_options(self,
+                     subtyping_params: Optional[SubtypingParams] = None,
+                     scheme_name: Optional[str] = None) -> 'Subtyper':
+        """Get a Subtyper with different subtyping parameters and/or scheme name sharing this Subtyper's loaded scheme
+
+        Args:
+            subtyping_params: scheme specific subtyping parameters (default: this Subtyper's parameters)
+            scheme_name: optional scheme name (default: this Subtyper's scheme name)
+
+        Returns:
+            New Subtyper
+        """
+        subtyper = copy.copy(self)
+        if subtyping_params is not None:
+            subtyper.subtyping_params = subtyping_params
+        if scheme_name is not None:
+            subtyper.scheme_name = scheme_name
+        return subtyper
+
+    def _subtype(self, genome_name: str, file_path: Union[str, List[str]], input_format: str) -> Subtype:
+        return Subtype(sample=genome_name,
+                       file_path=file_path,
+                       scheme=self.scheme_name or self.scheme,
+                       scheme_version=self.scheme_version,
+                       kmer_set=self.kmer_set,
+                       scheme_subtype_counts=self.scheme_subtype_counts,
+                       input_format=input_format)
+
+    def subtype_contigs(self, fasta_path: str, genome_name: str) -> Tuple[Subtype, pd.DataFrame]:
+        """Subtype input contigs
+
+        Args:
+            fasta_path: Input FASTA file path
+            genome_name: Input genome name
+
+        Returns:
+            - Subtype result
+            - pd.DataFrame of detailed subtyping results
+        """
+        st = self._subtype(genome_name, fasta_path, 'fasta')
+        df = find_in_fasta(self.automaton, fasta_path)
+        return contigs_subtyping_results(st, df, self.subtyping_params)
+
+    def subtype_reads(self, reads: Union[str, List[str]], genome_name: str) -> Tuple[Subtype, pd.DataFrame]:
+        """Subtype input reads
+
+        Args:
+            reads: Input FASTQ file path(s)
+            genome_name: Input genome name
+
+        Returns:
+            - Subtype result
+            - pd.DataFrame of detailed subtyping results
+        """
+        if isinstance(reads, str):
+            df = find_in_fastqs(self.automaton, reads)
+        elif isinstance(reads, list):
+            df = find_in_fastqs(self.automaton, *reads)
+        else:
+            raise ValueError('Unexpected type "{}" for "reads": {}'.format(type(reads), reads))
+        return self.subtype_reads_kmer_counts(df, reads, genome_name)
+
+    def subtype_reads_kmer_counts(self,
+                                  df: pd.DataFrame,
+                                  reads: Union[str, List[str]],
+                                  genome_name: str) -> Tuple[Subtype, pd.DataFrame]:
+        """Subtype input reads from the scheme k-mer frequencies found in them
+
+        Args:
+            df: Scheme k-mer frequencies found in the reads (see `bio_hansel.aho_corasick.find_in_fastqs`)
+            reads: Input FASTQ file path(s)
+            genome_name: Input genome name
+
+        Returns:
+            - Subtype result
+            - pd.DataFrame of detailed subtyping results
+        """
+        st = self._subtype(genome_name, reads, 'fastq')
+        return reads_subtyping_results(st, df, self.subtyping_params)
+
+    def iter_subtype_samples(self,
+                             input_genomes: Optional[List[Tuple[str, str]]] = None,
+                             reads: Optional[List[Tuple[List[str], str]]] = None,
+                             n_threads: int = 1) -> Iterator[Tuple[Subtype, pd.DataFrame]]:
+        """Subtype samples yielding each result as soon as it is available
+
+        Results from parallel runs are yielded in order of completion rather than in order of input.
+
+        Args:
+            input_genomes: input genomes; tuple of FASTA file path and genome name
+            reads: input genomes; tuple of list of FASTQ file paths and genome name
+            n_threads: number of processes to use for subtyping
+
+        Yields:
+            Tuple of Subtype and detailed subtyping results for each sample
+        """
+        tasks = [('subtype_contigs', fasta_path, genome_name) for fasta_path, genome_name in input_genomes or []]
+        tasks += [('subtype_reads', fastqs, genome_name) for fastqs, genome_name in reads or []]
+        if n_threads == 1:
+            for method, x, genome_name in tasks:
+                yield getattr(self, method)(x, genome_name)
+            return
+        from multiprocessing import Pool
+        with Pool(processes=n_threads, initializer=_init_subtyper_worker, initargs=(self,)) as pool:
+            yield from pool.imap_unordered(_run_subtyper_worker_task, tasks)
+
+    def subtype_samples(self,
+                        input_genomes: Optional[List[Tuple[str, str]]] = None,
+                        reads: Optional[List[Tuple[List[str], str]]] = None,
+                        n_threads: int = 1) -> List[Tuple[Subtype, pd.DataFrame]]:
+        """Subtype samples
+
+        Args:
+            input_genomes: input genomes; tuple of FASTA file path and genome name
+            reads: input genomes; tuple of list of FASTQ file paths and genome name
+            n_threads: number of processes to use for subtyping
+
+        Returns:
+            List of tuple of Subtype and detailed subtyping results for each sample in order of input (contigs then
+            reads)
+        """
+        order = {genome_name: i for i, (_, genome_name) in enumerate((input_genomes or []) + (reads or []))}
+        outputs = list(self.iter_subtype_samples(input_genomes, reads, n_threads))
+        outputs.sort(key=lambda x: order[x[0].sample])
+        return outputs
+
+
+# Subtyper of a Subtyper.iter_subtype_samples worker process
+_worker_subtyper = None  # type: Optional[Subtyper]
+
+
+def _init_subtyper_worker(subtyper: Subtyper) -> None:
+    global _worker_subtyper
+    _worker_subtyper = subtyper
+
+
+def _run_subtyper_worker_task(task: Tuple[str, Any, str]) -> Tuple[Subtype, pd.DataFrame]:
+    method, x, genome_name = task
+    return getattr(_worker_subtyper, method)(x, genome_name)
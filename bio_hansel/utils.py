@@ -1,16 +1,17 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import fnmatch
 import logging
 import os
 import re
 from collections import defaultdict
 from itertools import product
-from typing import List, Any, Optional, Tuple, Union
+from typing import List, Any, Dict, Iterable, Optional, Tuple, Union
 
 import pandas as pd
 
-from .const import SCHEME_FASTAS, REGEX_FASTQ, REGEX_FASTA, bases_dict
+from .const import SCHEME_FASTAS, REGEX_FASTQ, REGEX_FASTA, REGEX_ILLUMINA_FASTQ, REGEX_INPUT, bases_dict
 from .parsers import parse_fasta
 from .subtyping_params import SubtypingParams
 
@@ -44,8 +45,8 @@ def genome_name_from_fasta_path(fasta_path: str) -> str:
         str: genome name
     """
     filename = os.path.basename(fasta_path)
-    filename = re.sub(r'\.gz$', '', filename)
-    return re.sub(r'\.(fa|fas|fasta|fna|\w+)(\.gz)?$', '', filename)
+    filename = re.sub(r'\.(gz|zst|bz2|xz)$', '', filename)
+    return re.sub(r'\.(fa|fas|fasta|fna|\w+)(\.(gz|zst|bz2|xz))?$', '', filename)
 
 
 def compare_subtypes(a: List[Any], b: List[Any]) -> bool:
@@ -99,12 +100,151 @@ def get_scheme_version(scheme: str) -> Optional[str]:
     return None
 
 
-def collect_fastq_from_dir(input_directory: str) -> List[Union[str, Tuple[List[str], str]]]:
+def _glob_regex(patterns: Optional[List[str]]) -> Optional['re.Pattern']:
+    if not patterns:
+        return None
+    return re.compile('|'.join(f'(?:{fnmatch.translate(x)})' for x in patterns))
+
+
+def _matches_glob(regex: 're.Pattern', name: str, relpath: str) -> bool:
+    return bool(regex.match(name) or regex.match(relpath))
+
+
+def scan_directory(input_directory: str,
+                   recursive: bool = False,
+                   include: Optional[List[str]] = None,
+                   exclude: Optional[List[str]] = None,
+                   n_threads: int = 1,
+                   filename_regex: Optional['re.Pattern'] = None) -> Dict[str, int]:
+    """Find files in a directory with their sizes
+
+    Directories are listed with `os.scandir` so only the files that are found are stat'ed (for their size). Glob
+    patterns are matched against the filename and the path relative to `input_directory` (e.g. "*.fastq.gz" or
+    "run1/*"); directories matching an exclude pattern (e.g. "Undetermined*") are not descended into. Symbolic links
+    to files are followed but symbolic links to directories are not.
+
+    Args:
+        input_directory: Directory path
+        recursive: Also find files in subdirectories
+        include: Only find files matching any of these glob patterns
+        exclude: Skip files and directories matching any of these glob patterns
+        n_threads: Number of directories to list in parallel (e.g. for network filesystems)
+        filename_regex: Only find files with names matching this regular expression
+
+    Returns:
+        Dict of absolute file path to file size in bytes sorted by path
+    """
+    root = os.path.abspath(input_directory)
+    prefix = os.path.join(root, '')
+    include_regex = _glob_regex(include)
+    exclude_regex = _glob_regex(exclude)
+
+    def scan(directory: str) -> Tuple[List[Tuple[str, int]], List[str]]:
+        files = []
+        subdirectories = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                relpath = entry.path[len(prefix):]
+                if exclude_regex and _matches_glob(exclude_regex, entry.name, relpath):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive:
+                            subdirectories.append(entry.path)
+                    elif (filename_regex is None or filename_regex.match(entry.name)) \
+                            and (include_regex is None or _matches_glob(include_regex, entry.name, relpath)) \
+                            and entry.is_file():
+                        files.append((entry.path, entry.stat().st_size))
+                except OSError as ex:
+                    logging.warning('Could not read "%s": %s', entry.path, ex)
+        return files, subdirectories
+
+    found = []
+    if n_threads > 1:
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+        with ThreadPoolExecutor(n_threads) as executor:
+            pending = {executor.submit(scan, root)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    files, subdirectories = future.result()
+                    found += files
+                    pending |= {executor.submit(scan, x) for x in subdirectories}
+    else:
+        directories = [root]
+        while directories:
+            files, subdirectories = scan(directories.pop())
+            found += files
+            directories += subdirectories
+    return dict(sorted(found))
+
+
+def group_input_files(paths: Iterable[str]) -> Tuple[List[Tuple[str, str]], List[Tuple[List[str], str]]]:
+    """Group FASTA and FASTQ file paths into samples
+
+    Each FASTA file is a sample and FASTQ files are grouped into samples by `group_fastqs`. Other files are ignored.
+
+    Args:
+        paths: Input file paths
+
+    Returns:
+        List of (contig filename, sample name)
+        List of ([reads filepaths], sample name)
+    """
+    input_genomes = []
     fastqs = []
-    for x in os.listdir(input_directory):
-        full_file_path = os.path.abspath(os.path.join(input_directory, x))
-        if os.path.isfile(full_file_path) and REGEX_FASTQ.match(x):
-            fastqs.append(full_file_path)
+    for path in paths:
+        filename = os.path.basename(path)
+        if REGEX_FASTQ.match(filename):
+            fastqs.append(path)
+        elif REGEX_FASTA.match(filename):
+            input_genomes.append((path, genome_name_from_fasta_path(path)))
+    return input_genomes, group_fastqs(fastqs) if fastqs else []
+
+
+def collect_inputs_from_dir(input_directory: str,
+                            recursive: bool = False,
+                            include: Optional[List[str]] = None,
+                            exclude: Optional[List[str]] = None,
+                            n_threads: int = 1) \
+        -> Tuple[List[Tuple[str, str]], List[Tuple[List[str], str]], Dict[str, int]]:
+    """Find FASTA and FASTQ files in a directory (see `scan_directory`)
+
+    FASTQ files are grouped into samples by `group_fastqs`. Files of a sample found in more than one directory (e.g.
+    top-up sequencing runs) are grouped into one sample with a warning.
+
+    Args:
+        input_directory: Directory path
+        recursive: Also find files in subdirectories
+        include: Only find files matching any of these glob patterns
+        exclude: Skip files and directories matching any of these glob patterns
+        n_threads: Number of directories to list in parallel
+
+    Returns:
+        List of (contig filename, sample name)
+        List of ([reads filepaths], sample name)
+        Dict of input file path to file size in bytes
+    """
+    files = scan_directory(input_directory, recursive, include, exclude, n_threads, filename_regex=REGEX_INPUT)
+    input_genomes, reads = group_input_files(files)
+    for paths, genome_name in reads:
+        directories = sorted({os.path.dirname(x) for x in paths})
+        if len(directories) > 1:
+            logging.warning('FASTQ files of sample "%s" in %s directories are subtyped as one sample: %s',
+                            genome_name, len(directories), directories)
+    logging.info('Found %s FASTA files and %s FASTQ files (%s read sets) of %s files in "%s"',
+                 len(input_genomes),
+                 sum(len(paths) for paths, _ in reads),
+                 len(reads),
+                 len(files),
+                 input_directory)
+    sizes = {path: files[path] for path, _ in input_genomes}
+    sizes.update((path, files[path]) for paths, _ in reads for path in paths)
+    return input_genomes, reads, sizes
+
+
+def collect_fastq_from_dir(input_directory: str) -> List[Union[str, Tuple[List[str], str]]]:
+    fastqs = list(scan_directory(input_directory, filename_regex=REGEX_FASTQ))
     if fastqs:
         logging.info('Found %s FASTQ files in %s',
                      len(fastqs),
@@ -118,38 +258,59 @@ def collect_fastq_from_dir(input_directory: str) -> List[Union[str, Tuple[List[s
     return []
 
 
+def fastq_sample_name(fastq: str) -> Tuple[str, bool]:
+    """Get the sample name of a FASTQ file from its filename
+
+    Illumina names (e.g. `sample_S1_L001_R1_001.fastq.gz`) give the sample name before the sample number, lane, read
+    and chunk number (`sample`). Other names give the base filename with "_\\d" removed (e.g. `reads_1.fastq` gives
+    `reads`).
+
+    Args:
+        fastq: FASTQ file path
+
+    Returns:
+        - sample name
+        - is the file Illumina index reads (I1/I2) rather than sequence reads?
+    """
+    basefilename = REGEX_FASTQ.sub(r'\1', os.path.basename(fastq))
+    m = REGEX_ILLUMINA_FASTQ.match(basefilename)
+    if m:
+        return m.group('sample'), m.group('read').startswith('I')
+    return re.sub(r'_\d', '', basefilename), False
+
+
 def group_fastqs(fastqs: List[str]) -> List[Tuple[List[str], str]]:
-    """Group FASTQs based on common base filename
+    """Group FASTQs based on common sample name
 
     For example, if you have 2 FASTQs:
 
     - reads_1.fastq
     - reads_2.fastq
 
-    The common name would be `reads` and the files would be grouped based on that common name.
+    The common name would be `reads` and the files would be grouped based on that common name. Multi-lane Illumina
+    runs (e.g. `reads_S1_L001_R1_001.fastq.gz` ... `reads_S1_L004_R2_001.fastq.gz`) are also grouped as `reads` and
+    Illumina index reads files (I1/I2) are skipped (see `fastq_sample_name`). The files of each sample are all counted
+    in one pass so they do not need to be concatenated.
 
     Args:
         fastqs: FASTQ file paths
 
     Returns:
-        list of grouped FASTQs grouped by common base filename
+        list of grouped FASTQs grouped by common sample name with the FASTQs of each sample sorted by filename
     """
     genome_fastqs = defaultdict(list)
     for fastq in fastqs:
-        filename = os.path.basename(fastq)
-        basefilename = re.sub(r'_\d', '', REGEX_FASTQ.sub(r'\1', filename))
-        genome_fastqs[basefilename].append(fastq)
-    return [(fastq_paths, genome_name) for genome_name, fastq_paths in genome_fastqs.items()]
+        genome_name, is_index_reads = fastq_sample_name(fastq)
+        if is_index_reads:
+            logging.info('Skipping Illumina index reads FASTQ "%s" of sample "%s"', fastq, genome_name)
+            continue
+        genome_fastqs[genome_name].append(fastq)
+    return [(sorted(fastq_paths, key=os.path.basename), genome_name)
+            for genome_name, fastq_paths in genome_fastqs.items()]
 
 
 def collect_fasta_from_dir(input_directory: str) -> List[Tuple[str, str]]:
-    input_genomes = []
-    for x in os.listdir(input_directory):
-        full_file_path = os.path.abspath(os.path.join(input_directory, x))
-        if os.path.isfile(full_file_path) and REGEX_FASTA.match(x):
-            genome_name = genome_name_from_fasta_path(full_file_path)
-            input_genomes.append((full_file_path, genome_name))
-    return input_genomes
+    return [(x, genome_name_from_fasta_path(x)) for x in scan_directory(input_directory, filename_regex=REGEX_FASTA)]
 
 
 NT_SUB = str.maketrans('acgtrymkswhbvdnxACGTRYMKSWHBVDNX',
@@ -214,23 +375,48 @@ def df_field_fillna(df: pd.DataFrame, field: str = 'subtype', na: str = '#N/A')
     return df
 
 
-def check_total_kmers(scheme_fasta, max_degenerate_kmers):
-    """Checks that the number of kmers about to be created is not at too high a computation or time cost
+def count_expanded_kmers(kmers: Iterable[Tuple[str, str]]) -> int:
+    """Count the non-degenerate kmers that scheme kmers expand to
 
     Args:
-         scheme_fasta: Kmer sequences from the SNV scheme
-         max_degenerate_kmers:  The max kmers allowed by the scheme
+        kmers: Scheme kmer headers and sequences
 
-    Raises:
-        ValueError if number of created kmers is greater than the max degenerate kmers argument
+    Returns:
+        Number of non-degenerate kmers excluding reverse complements
     """
     kmer_number = 0
-    for header, sequence in parse_fasta(scheme_fasta):
+    for header, sequence in kmers:
         value = 1
         for char in sequence:
             length_key = len(bases_dict[char])
             value *= length_key
         kmer_number += value
+    return kmer_number
+
+
+def check_total_kmers(scheme_fasta, max_degenerate_kmers):
+    """Checks that the number of kmers about to be created is not at too high a computation or time cost
+
+    Args:
+         scheme_fasta: Kmer sequences from the SNV scheme
+         max_degenerate_kmers:  The max kmers allowed by the scheme
+
+    Raises:
+        ValueError if number of created kmers is greater than the max degenerate kmers argument
+    """
+    check_expanded_kmers(count_expanded_kmers(parse_fasta(scheme_fasta)), max_degenerate_kmers)
+
+
+def check_expanded_kmers(kmer_number: int, max_degenerate_kmers: int) -> None:
+    """Checks that the number of non-degenerate scheme kmers is not at too high a computation or time cost
+
+    Args:
+         kmer_number: Number of non-degenerate scheme kmers excluding reverse complements (see `count_expanded_kmers`)
+         max_degenerate_kmers:  The max kmers allowed by the scheme
+
+    Raises:
+        ValueError if number of created kmers is greater than the max degenerate kmers argument
+    """
     if kmer_number * 2 > max_degenerate_kmers:
         raise ValueError(f'Your current scheme contains "{kmer_number * 2}" '
                          f'kmers which is over the current max degenerate '
@@ -0,0 +1,412 @@
+# -*- coding: utf-8 -*-
+"""
+Continuous subtyping of samples as they arrive in a directory.
+
+The input directory is polled (see `bio_hansel.utils.scan_directory`) for FASTA and FASTQ files. A file is considered
+complete once its size has not changed for a settle period, so files that are still being copied or written by a
+sequencer are not subtyped early. A sample is subtyped once all of its files are complete; since a new file joining a
+sample (e.g. the R2 reads of a pair or another lane) restarts the settle period, read sets are subtyped as a whole.
+
+New samples are subtyped with a scheme loaded once (see `bio_hansel.subtyper.Subtyper`) in a pool of worker processes
+that is kept for the lifetime of the watch, and each result is appended to rolling outputs as soon as it is available.
+Samples already in the output summary are not subtyped again, so watching can be stopped and restarted at any time.
+
+Example:
+    Subtype samples as they are written to a sequencer output directory::
+
+        hansel-watch /data/runs --recursive -s heidelberg -o summary.tsv -O kmer-results.tsv -t 4
+"""
+import argparse
+import logging
+import os
+import queue
+import signal
+import sys
+import time
+from collections import deque
+from typing import Any, List, Optional, Tuple
+
+import pandas as pd
+
+from . import __version__
+from .const import REGEX_INPUT
+from .subtype import Subtype
+from .utils import scan_directory, group_input_files
+
+DEFAULT_POLL_SECONDS = 10.0
+DEFAULT_SETTLE_SECONDS = 30.0
+
+# subtyping Subtyper method, input file path(s) and sample name
+WatchTask = Tuple[str, Any, str]
+
+
+class InputWatcher(object):
+    """Track the FASTA and FASTQ files in a directory across polls to find new samples whose files are complete
+
+    Args:
+        input_directory: Directory to watch
+        recursive: Also watch subdirectories
+        include: Only watch files matching any of these glob patterns
+        exclude: Skip files and directories matching any of these glob patterns
+        scan_threads: Number of directories to list in parallel
+        settle_seconds: Seconds that the size of each file of a sample must be unchanged before it is subtyped
+    """
+
+    def __init__(self,
+                 input_directory: str,
+                 recursive: bool = False,
+                 include: Optional[List[str]] = None,
+                 exclude: Optional[List[str]] = None,
+                 scan_threads: int = 1,
+                 settle_seconds: float = DEFAULT_SETTLE_SECONDS):
+        self.input_directory = input_directory
+        self.recursive = recursive
+        self.include = include
+        self.exclude = exclude
+        self.scan_threads = scan_threads
+        self.settle_seconds = settle_seconds
+        # number of new samples with files that are not yet complete as of the last poll
+        self.n_pending = 0
+        # file path to file size and time when the size last changed
+        self._files = {}  # type: dict
+        # subtyped sample name to its input files
+        self._subtyped = {}  # type: dict
+
+    def skip(self, samples: List[str]) -> None:
+        """Do not subtype these samples (e.g. samples subtyped by a previous watch)"""
+        for sample in samples:
+            self._subtyped.setdefault(sample, set())
+
+    def _is_complete(self, path: str, now: float) -> bool:
+        size, changed = self._files[path]
+        # a file must be seen by at least 2 polls and empty files may not have been written yet
+        return size > 0 and changed < now and now - changed >= self.settle_seconds
+
+    def poll(self, now: Optional[float] = None) -> List[WatchTask]:
+        """Scan the directory for new samples whose files are all complete
+
+        Each sample is only returned once.
+
+        Args:
+            now: Monotonic time of the poll (default: `time.monotonic()`)
+
+        Returns:
+            Subtyping tasks of Subtyper method, input file path(s) and sample name for each new complete sample
+        """
+        now = time.monotonic() if now is None else now
+        files = scan_directory(self.input_directory, self.recursive, self.include, self.exclude, self.scan_threads,
+                               filename_regex=REGEX_INPUT)
+        for path, size in files.items():
+            previous = self._files.get(path)
+            if previous is None or previous[0] != size:
+                self._files[path] = (size, now)
+        for path in [x for x in self._files if x not in files]:
+            # deleted or renamed
+            del self._files[path]
+        input_genomes, reads = group_input_files(files)
+        samples = [('subtype_contigs', [path], genome_name) for path, genome_name in input_genomes]
+        samples += [('subtype_reads', paths, genome_name) for paths, genome_name in reads]
+        tasks = []
+        self.n_pending = 0
+        for method, paths, genome_name in samples:
+            if genome_name in self._subtyped:
+                new_paths = set(paths) - self._subtyped[genome_name]
+                if new_paths and self._subtyped[genome_name]:
+                    logging.warning('New files of already subtyped sample "%s" are not subtyped: %s',
+                                    genome_name, sorted(new_paths))
+                self._subtyped[genome_name].update(new_paths)
+                continue
+            if not all(self._is_complete(path, now) for path in paths):
+                self.n_pending += 1
+                continue
+            self._subtyped[genome_name] = set(paths)
+            tasks.append((method, paths[0] if method == 'subtype_contigs' else paths, genome_name))
+        return tasks
+
+
+def summary_samples(path: str) -> List[str]:
+    """Get the names of the samples in a subtyping summary table
+
+    Args:
+        path: Tab-separated subtyping summary path; may not exist
+
+    Returns:
+        Sample names
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return []
+    return pd.read_csv(path, sep='\t', usecols=['sample'], dtype=str)['sample'].dropna().tolist()
+
+
+# Subtyper of a watch worker process
+_worker_subtyper = None
+
+
+def _init_worker(subtyper) -> None:
+    global _worker_subtyper
+    _worker_subtyper = subtyper
+
+
+def _failed_result(subtyper, task: WatchTask, ex: BaseException) -> Tuple[Subtype, pd.DataFrame]:
+    from .subtyper import failed_subtyping_result
+
+    _, x, genome_name = task
+    logging.error('Could not subtype sample "%s": %s: %s', genome_name, type(ex).__name__, ex)
+    return failed_subtyping_result(sample=genome_name,
+                                   file_path=x,
+                                   scheme=subtyper.scheme_name or subtyper.scheme,
+                                   error=f'{type(ex).__name__}: {ex}',
+                                   scheme_version=subtyper.scheme_version)
+
+
+def _subtype_sample(subtyper, task: WatchTask, timeout: Optional[float]) -> Tuple[Subtype, pd.DataFrame]:
+    """Subtype a sample with a "FAIL" result if it could not be subtyped"""
+    from .subtyper import sample_timeout
+
+    method, x, genome_name = task
+    try:
+        with sample_timeout(timeout):
+            return getattr(subtyper, method)(x, genome_name)
+    except Exception as ex:
+        return _failed_result(subtyper, task, ex)
+
+
+def _run_worker_task(task: WatchTask, timeout: Optional[float]) -> Tuple[Subtype, pd.DataFrame]:
+    return _subtype_sample(_worker_subtyper, task, timeout)
+
+
+def watch_directory(watcher: InputWatcher,
+                    subtyper,
+                    results_writers: List[Any],
+                    n_threads: int = 1,
+                    poll_seconds: float = DEFAULT_POLL_SECONDS,
+                    idle_exit_seconds: Optional[float] = None,
+                    timeout: Optional[float] = None) -> int:
+    """Subtype new samples as they arrive until interrupted
+
+    Args:
+        watcher: Input directory watcher
+        subtyper: `bio_hansel.subtyper.Subtyper` with the scheme loaded
+        results_writers: Writers with an `add(summary, df)` method to write the results of each sample to as results
+            arrive (e.g. `bio_hansel.output.SummaryTsvAppender`)
+        n_threads: Number of worker processes to subtype samples with
+        poll_seconds: Seconds between directory polls
+        idle_exit_seconds: Stop once no samples have arrived or been subtyped for this many seconds (default: never)
+        timeout: Maximum seconds to subtype each sample
+
+    Returns:
+        Number of samples subtyped
+    """
+    from .output import summary_record
+
+    # subtype, detailed results and the time that their sample was found to be complete
+    results = queue.Queue()  # type: queue.Queue
+    # tasks of samples waiting to be subtyped in this process and the time that they were found to be complete
+    waiting = deque()  # type: deque
+    pool = None
+    if n_threads > 1:
+        from multiprocessing import Pool
+        pool = Pool(processes=n_threads, initializer=_init_worker, initargs=(subtyper,))
+    n_running = 0
+    n_samples = 0
+    last_activity = time.monotonic()
+    next_poll = last_activity
+    try:
+        while True:
+            now = time.monotonic()
+            if now >= next_poll:
+                next_poll = now + poll_seconds
+                tasks = watcher.poll(now)
+                for task in tasks:
+                    logging.info('Subtyping new sample "%s"', task[2])
+                    if pool is None:
+                        waiting.append((task, now))
+                    else:
+                        pool.apply_async(_run_worker_task, (task, timeout),
+                                         callback=lambda result, start=now: results.put(result + (start,)),
+                                         error_callback=lambda ex, task=task, start=now: results.put(
+                                             _failed_result(subtyper, task, ex) + (start,)))
+                    n_running += 1
+                if tasks or watcher.n_pending:
+                    last_activity = now
+                if idle_exit_seconds is not None and n_running == 0 and now - last_activity >= idle_exit_seconds:
+                    logging.info('No new samples for %g seconds; stopping', idle_exit_seconds)
+                    break
+            if waiting:
+                # one sample at a time so that the directory is still polled while a backlog is subtyped
+                task, start = waiting.popleft()
+                st, df = _subtype_sample(subtyper, task, timeout)
+            else:
+                try:
+                    st, df, start = results.get(timeout=max(0.0, next_poll - time.monotonic()))
+                except queue.Empty:
+                    continue
+            n_running -= 1
+            n_samples += 1
+            last_activity = time.monotonic()
+            logging.info('Sample "%s" subtype "%s" (QC %s) written %.1f seconds after it was complete',
+                         st.sample, st.subtype, st.qc_status, last_activity - start)
+            summary = summary_record(st)
+            for writer in results_writers:
+                writer.add(summary, df)
+    finally:
+        if pool is not None:
+            # samples being subtyped are not in the outputs so they are subtyped when watching is restarted
+            pool.terminate()
+            pool.join()
+    return n_samples
+
+
+def init_parser():
+    parser = argparse.ArgumentParser(prog='hansel-watch',
+                                     description='Continuously subtype samples as their FASTA and FASTQ files are '
+                                                 'written to a directory, appending results to rolling outputs')
+    parser.add_argument('input_directory', help='Directory to watch for input files')
+    parser.add_argument('-s', '--scheme',
+                        default='heidelberg',
+                        help='Scheme to use for subtyping (built-in: "heidelberg", "enteritidis", "typhimurium", '
+                             '"typhi", "tb_lineage"; OR user-specified: /path/to/user/scheme)')
+    parser.add_argument('--scheme-name', help='Custom user-specified SNP substyping scheme name')
+    parser.add_argument('-o', '--output-summary',
+                        required=True,
+                        help='Rolling subtyping summary output path; results are appended and samples already in an '
+                             'existing summary are not subtyped again')
+    parser.add_argument('-O', '--output-kmer-results', help='Rolling subtyping kmer matching output path')
+    parser.add_argument('--output-summary-jsonl', help='Rolling JSON Lines subtyping summary output path')
+    parser.add_argument('--output-kmer-results-jsonl', help='Rolling JSON Lines kmer matching output path')
+    parser.add_argument('--results-db', help='SQLite results database to add results to (see "hansel --results-db")')
+    parser.add_argument('--force',
+                        action='store_true',
+                        help='Overwrite existing output files rather than appending to them')
+    parser.add_argument('--recursive',
+                        action='store_true',
+                        help='Also watch subdirectories of the input directory')
+    parser.add_argument('--include',
+                        action='append',
+                        metavar='PATTERN',
+                        help='Only subtype files matching this glob pattern (see "hansel --include")')
+    parser.add_argument('--exclude',
+                        action='append',
+                        metavar='PATTERN',
+                        help='Skip files and directories matching this glob pattern (see "hansel --exclude")')
+    parser.add_argument('--scan-threads',
+                        type=int,
+                        default=1,
+                        help='Number of directories to list in parallel when polling (default=1)')
+    parser.add_argument('--poll-interval',
+                        type=float,
+                        default=DEFAULT_POLL_SECONDS,
+                        metavar='SECONDS',
+                        help=f'Seconds between polls of the input directory (default={DEFAULT_POLL_SECONDS:g})')
+    parser.add_argument('--settle',
+                        type=float,
+                        default=DEFAULT_SETTLE_SECONDS,
+                        metavar='SECONDS',
+                        help='Seconds that the size of each file of a sample must be unchanged before the sample is '
+                             f'subtyped (default={DEFAULT_SETTLE_SECONDS:g})')
+    parser.add_argument('--idle-exit',
+                        type=float,
+                        metavar='SECONDS',
+                        help='Stop once no samples have arrived or been subtyped for this many seconds '
+                             '(default: watch until interrupted)')
+    parser.add_argument('--sample-timeout',
+                        type=float,
+                        metavar='SECONDS',
+                        help='Maximum seconds to subtype each sample; samples that take longer are reported with a '
+                             '"FAIL" QC status')
+    for name, opt_type in [('min_kmer_freq', int), ('min_kmer_frac', float), ('max_kmer_freq', int),
+                           ('low_cov_depth_freq', int), ('max_missing_kmers', float), ('min_ambiguous_kmers', int),
+                           ('low_cov_warning', int), ('max_intermediate_kmers', float),
+                           ('max_degenerate_kmers', int)]:
+        parser.add_argument('--' + name.replace('_', '-'), type=opt_type, help='See "hansel --help"')
+    parser.add_argument('-t', '--threads',
+                        type=int,
+                        default=1,
+                        help='Number of worker processes (default=1)')
+    parser.add_argument('-v', '--verbose',
+                        action='count',
+                        default=0,
+                        help='Logging verbosity level (-v == show warnings; -vvv == show debug info)')
+    parser.add_argument('-V', '--version',
+                        action='version',
+                        version='%(prog)s {}'.format(__version__))
+    return parser
+
+
+def _stop(signum, frame):
+    raise KeyboardInterrupt
+
+
+def main():
+    from .main import init_console_logger
+
+    parser = init_parser()
+    args = parser.parse_args()
+    if not os.path.isdir(args.input_directory):
+        parser.error(f'Input directory "{args.input_directory}" does not exist')
+    if args.poll_interval <= 0:
+        parser.error('"--poll-interval" must be greater than 0')
+    if args.settle < 0:
+        parser.error('"--settle" must be at least 0')
+    if args.scan_threads < 1:
+        parser.error('"--scan-threads" must be at least 1')
+    init_console_logger(args.verbose)
+
+    from .output import metadata_lookup, SummaryTsvAppender, KmerResultsTsvAppender, SummaryJsonLinesWriter, \
+        KmerResultsJsonLinesWriter
+    from .results_db import ResultsDatabase
+    from .subtyper import Subtyper
+    from .utils import init_subtyping_params, check_expanded_kmers
+
+    outputs = [args.output_summary, args.output_kmer_results, args.output_summary_jsonl,
+               args.output_kmer_results_jsonl]
+    if args.force:
+        for path in outputs:
+            if path and path != '-' and os.path.exists(path):
+                os.remove(path)
+    subtyper = Subtyper(args.scheme,
+                        subtyping_params=init_subtyping_params(args, args.scheme),
+                        scheme_name=args.scheme_name)
+    check_expanded_kmers(subtyper.bundle.n_expanded_kmers, subtyper.subtyping_params.max_degenerate_kmers)
+    watcher = InputWatcher(args.input_directory,
+                           recursive=args.recursive,
+                           include=args.include,
+                           exclude=args.exclude,
+                           scan_threads=args.scan_threads,
+                           settle_seconds=args.settle)
+    subtyped = summary_samples(args.output_summary)
+    if subtyped:
+        logging.info('Skipping %s samples already in "%s"', len(subtyped), args.output_summary)
+        watcher.skip(subtyped)
+    df_md = subtyper.bundle.metadata_table()
+    results_writers = [SummaryTsvAppender(args.output_summary, df_md)]
+    if args.output_kmer_results:
+        results_writers.append(KmerResultsTsvAppender(args.output_kmer_results))
+    if args.output_summary_jsonl:
+        results_writers.append(SummaryJsonLinesWriter(args.output_summary_jsonl, metadata_lookup(df_md), append=True))
+    if args.output_kmer_results_jsonl:
+        results_writers.append(KmerResultsJsonLinesWriter(args.output_kmer_results_jsonl, append=True))
+    if args.results_db:
+        results_writers.append(ResultsDatabase(args.results_db, samples_per_transaction=1))
+    # stop cleanly, closing the outputs, when the watch is killed (e.g. by a service manager)
+    signal.signal(signal.SIGTERM, _stop)
+    logging.info('Watching "%s" for new samples every %g seconds', args.input_directory, args.poll_interval)
+    try:
+        watch_directory(watcher, subtyper, results_writers,
+                        n_threads=args.threads,
+                        poll_seconds=args.poll_interval,
+                        idle_exit_seconds=args.idle_exit,
+                        timeout=args.sample_timeout)
+    except KeyboardInterrupt:
+        logging.info('Stopped watching "%s"', args.input_directory)
+    except (ValueError, OSError) as ex:
+        logging.error(ex)
+        sys.exit(1)
+    finally:
+        for writer in results_writers:
+            writer.close()
+    logging.info('Subtyped %s new samples', results_writers[0].n_rows)
+
+
+if __name__ == '__main__':
+    main()
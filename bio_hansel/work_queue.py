@@ -0,0 +1,615 @@
+# -*- coding: utf-8 -*-
+"""
+Work queue for subtyping a batch of samples with workers on any number of nodes.
+
+A coordinator serves the samples of a manifest (see `bio_hansel.manifest`) from a `WorkQueue` over TCP using
+`multiprocessing.managers`. Workers connect to the coordinator, lease a sample at a time, subtype it with
+`Subtyper.subtype_reads`/`Subtyper.subtype_contigs` and push the summary and k-mer results back. Workers can join or
+leave at any time so fast nodes keep pulling samples instead of idling once a static shard is done.
+
+Each lease expires unless renewed by the worker's heartbeat, so samples leased by workers that were killed or lost
+their connection are re-queued for other workers. A sample that fails `max_attempts` times is not retried.
+
+Example:
+    Start a coordinator and two workers with 4 processes each::
+
+        hansel-queue coordinator samples.tsv -s heidelberg --host 0.0.0.0 --authkey-file ~/.hansel-queue-key \
+            -o summary.tsv
+        hansel-queue worker coordinator-host --authkey-file ~/.hansel-queue-key -t 4
+        hansel-queue worker coordinator-host --authkey-file ~/.hansel-queue-key -t 4
+
+Workers must connect with the coordinator's shared secret ("authkey"). It is taken from "--authkey", the
+`HANSEL_QUEUE_AUTHKEY` environment variable or "--authkey-file" in that order. A coordinator without an authkey
+generates a random one, logs it and writes it to "--authkey-file" if given.
+
+Input files and custom schemes must be readable at the same paths by the coordinator and all workers (e.g. on a
+shared filesystem).
+"""
+import argparse
+import logging
+import os
+import secrets
+import socket
+import sys
+import threading
+import time
+from collections import deque
+from multiprocessing import AuthenticationError, Process
+from multiprocessing.managers import BaseManager
+from typing import Any, Dict, List, Optional, Tuple
+
+import attr
+import pandas as pd
+
+from . import __version__
+from .const import OUTPUT_FORMATS
+from .subtyping_params import SubtypingParams
+
+DEFAULT_PORT = 8766
+# environment variable of the shared secret of the coordinator
+AUTHKEY_ENV = 'HANSEL_QUEUE_AUTHKEY'
+# seconds a leased sample is reserved for a worker without a heartbeat
+DEFAULT_LEASE_SECONDS = 120.0
+# seconds between checks for new samples by idle workers
+POLL_INTERVAL = 1.0
+
+
+@attr.s
+class WorkItem(object):
+    """Sample to subtype"""
+    task_id = attr.ib()  # type: int
+    sample = attr.ib()  # type: str
+    contigs = attr.ib(default=None)  # type: Optional[str]
+    reads = attr.ib(default=None)  # type: Optional[List[str]]
+    attempts = attr.ib(default=0)  # type: int
+
+
+@attr.s
+class Lease(object):
+    worker = attr.ib()  # type: str
+    expires = attr.ib()  # type: float
+
+
+class WorkQueue(object):
+    """Samples to subtype leased to workers and their results
+
+    All methods are thread-safe since the manager server handles each worker connection in its own thread.
+
+    Args:
+        input_genomes: List of (contig filename, sample name)
+        reads: List of ([reads filepaths], sample name)
+        scheme: Built-in scheme name, scheme bundle path or scheme FASTA path
+        scheme_name: Optional scheme name
+        subtyping_params: Subtyping parameters (default: scheme defaults)
+        lease_seconds: Seconds a leased sample is reserved for a worker without a heartbeat before it is re-queued
+        max_attempts: Maximum number of times a sample is leased after failing or its lease expiring
+    """
+
+    def __init__(self,
+                 input_genomes: List[Tuple[str, str]],
+                 reads: List[Tuple[List[str], str]],
+                 scheme: str,
+                 scheme_name: Optional[str] = None,
+                 subtyping_params: Optional[SubtypingParams] = None,
+                 lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                 max_attempts: int = 3):
+        items = [WorkItem(0, sample, contigs=fasta) for fasta, sample in input_genomes]
+        items += [WorkItem(0, sample, reads=list(fastqs)) for fastqs, sample in reads]
+        for i, item in enumerate(items):
+            item.task_id = i
+        self.items = items
+        self.scheme = scheme
+        self.scheme_name = scheme_name
+        self.subtyping_params = subtyping_params
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.pending = deque(range(len(items)))
+        self.leases = {}  # type: Dict[int, Lease]
+        # task id to summary record and detailed subtyping results
+        self.results = {}  # type: Dict[int, Tuple[Dict[str, Any], pd.DataFrame]]
+        # task id to error message of the last failed attempt
+        self.errors = {}  # type: Dict[int, str]
+        self.failed = set()
+        self.workers = set()
+        self._lock = threading.Lock()
+
+    def config(self) -> Dict[str, Any]:
+        """Scheme and subtyping parameters for workers"""
+        return dict(scheme=self.scheme,
+                    scheme_name=self.scheme_name,
+                    subtyping_params=self.subtyping_params,
+                    lease_seconds=self.lease_seconds)
+
+    def _requeue_expired(self) -> None:
+        now = time.monotonic()
+        for task_id, lease in list(self.leases.items()):
+            if lease.expires < now:
+                del self.leases[task_id]
+                logging.warning('Lease of sample "%s" by worker "%s" expired',
+                                self.items[task_id].sample, lease.worker)
+                self._retry(task_id, f'Lease by worker "{lease.worker}" expired')
+
+    def _retry(self, task_id: int, error: str) -> None:
+        self.errors[task_id] = error
+        if self.items[task_id].attempts >= self.max_attempts:
+            logging.error('Sample "%s" failed %s times; last error: %s',
+                          self.items[task_id].sample, self.items[task_id].attempts, error)
+            self.failed.add(task_id)
+        else:
+            self.pending.append(task_id)
+
+    def lease(self, worker: str) -> Optional[WorkItem]:
+        """Lease the next pending sample to a worker
+
+        Returns:
+            Sample to subtype or None if there are no pending samples (samples may still be re-queued if they fail or
+            their lease expires; see `is_done`)
+        """
+        with self._lock:
+            self.workers.add(worker)
+            self._requeue_expired()
+            while self.pending:
+                task_id = self.pending.popleft()
+                if task_id in self.results or task_id in self.leases:
+                    continue
+                item = self.items[task_id]
+                item.attempts += 1
+                self.leases[task_id] = Lease(worker, time.monotonic() + self.lease_seconds)
+                logging.debug('Leased sample "%s" to worker "%s" (attempt %s)', item.sample, worker, item.attempts)
+                return item
+            return None
+
+    def renew(self, worker: str, task_id: int) -> bool:
+        """Extend the lease of a sample by a worker
+
+        Returns:
+            False if the sample is no longer leased to the worker
+        """
+        with self._lock:
+            lease = self.leases.get(task_id)
+            if lease is None or lease.worker != worker:
+                return False
+            lease.expires = time.monotonic() + self.lease_seconds
+            return True
+
+    def complete(self, worker: str, task_id: int, summary: Dict[str, Any], df: pd.DataFrame) -> bool:
+        """Store the results of a sample
+
+        Results of a sample whose lease expired are still accepted if no other worker completed it first.
+
+        Returns:
+            False if the sample was already completed
+        """
+        with self._lock:
+            # release the lease of any other worker subtyping the re-queued sample
+            self.leases.pop(task_id, None)
+            if task_id in self.results:
+                return False
+            self.results[task_id] = (summary, df)
+            self.failed.discard(task_id)
+            return True
+
+    def fail(self, worker: str, task_id: int, error: str) -> None:
+        """Re-queue a sample a worker could not subtype unless it has been attempted `max_attempts` times"""
+        with self._lock:
+            lease = self.leases.get(task_id)
+            if lease is None or lease.worker != worker or task_id in self.results:
+                return
+            del self.leases[task_id]
+            logging.warning('Worker "%s" failed to subtype sample "%s": %s', worker, self.items[task_id].sample, error)
+            self._retry(task_id, error)
+
+    def is_done(self) -> bool:
+        """Have all samples been completed or failed `max_attempts` times?"""
+        with self._lock:
+            self._requeue_expired()
+            return len(self.results) + len(self.failed) == len(self.items)
+
+    def status(self) -> Dict[str, int]:
+        with self._lock:
+            self._requeue_expired()
+            return dict(samples=len(self.items),
+                        completed=len(self.results),
+                        failed=len(self.failed),
+                        leased=len(self.leases),
+                        pending=len(self.items) - len(self.results) - len(self.failed) - len(self.leases),
+                        workers=len(self.workers))
+
+
+class WorkQueueClient(BaseManager):
+    """Connection of a worker to a coordinator's work queue"""
+
+
+WorkQueueClient.register('get_queue')
+
+
+class Coordinator(object):
+    """Serve a `WorkQueue` to workers over TCP
+
+    Args:
+        queue: Samples to subtype
+        host: Host name or address to listen on
+        port: TCP port to listen on (0 for any free port)
+        authkey: Shared secret workers must connect with (default: random; see `authkey` attribute)
+    """
+
+    def __init__(self, queue: WorkQueue, host: str = '127.0.0.1', port: int = DEFAULT_PORT,
+                 authkey: Optional[str] = None):
+        class WorkQueueServer(BaseManager):
+            pass
+
+        WorkQueueServer.register('get_queue', callable=lambda: queue)
+        self.queue = queue
+        self.authkey = authkey or secrets.token_hex(16)
+        self._server = WorkQueueServer(address=(host, port), authkey=self.authkey.encode()).get_server()
+        self.address = self._server.address
+        # stops the accepting thread and the threads serving worker connections (see `Server.serve_client`)
+        self._server.stop_event = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self) -> None:
+        # `Server.serve_forever` is the main loop of a manager process; it exits the process and resets its stdio
+        # when it stops so connections are accepted in a thread of this process instead
+        self._server.stop_event.clear()
+        self._thread = threading.Thread(target=self._accept, name='work-queue-server', daemon=True)
+        self._thread.start()
+        logging.info('Serving %s samples to workers on %s:%s', len(self.queue.items), *self.address)
+
+    def wait(self, interval: float = 1.0, log_interval: float = 30.0) -> None:
+        """Wait until all samples are completed or have failed, logging the queue status periodically"""
+        last_log = time.monotonic()
+        while not self.queue.is_done():
+            time.sleep(interval)
+            if time.monotonic() - last_log >= log_interval:
+                last_log = time.monotonic()
+                logging.info('Work queue status: %s', self.queue.status())
+
+    def _accept(self) -> None:
+        while not self._server.stop_event.is_set():
+            try:
+                conn = self._server.listener.accept()
+            except AuthenticationError as ex:
+                logging.warning('Rejected worker connection: %s', ex)
+                continue
+            except (OSError, EOFError):
+                continue
+            if self._server.stop_event.is_set():
+                conn.close()
+                return
+            # each worker connection is served in its own thread until the worker disconnects
+            threading.Thread(target=self._server.handle_request, args=(conn,), daemon=True).start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._server.stop_event.set()
+        # wake the accepting thread blocked on the listening socket
+        host, port = self.address[:2]
+        try:
+            socket.create_connection(({'0.0.0.0': '127.0.0.1', '::': '::1'}.get(host, host), port), timeout=1).close()
+        except OSError:
+            pass
+        self._thread.join(timeout=5)
+        self._server.listener.close()
+        self._thread = None
+
+    def results(self) -> List[Tuple[Dict[str, Any], pd.DataFrame]]:
+        """Results of completed and failed samples in input order
+
+        Samples that failed `max_attempts` times have a "FAIL" QC status with the last error as the QC message (see
+        `bio_hansel.subtyper.failed_subtyping_result`).
+        """
+        from .output import summary_record
+        from .subtyper import failed_subtyping_result
+
+        queue = self.queue
+        out = []
+        for i, item in enumerate(queue.items):
+            if i in queue.results:
+                out.append(queue.results[i])
+            elif i in queue.failed:
+                st, df = failed_subtyping_result(sample=item.sample,
+                                                 file_path=item.contigs or item.reads,
+                                                 scheme=queue.scheme_name or queue.scheme,
+                                                 error=queue.errors[i])
+                out.append((summary_record(st), df))
+        return out
+
+
+def _heartbeat(queue, worker: str, task_id: int, interval: float, stop: threading.Event) -> None:
+    while not stop.wait(interval):
+        try:
+            if not queue.renew(worker, task_id):
+                logging.warning('Lease of task %s by worker "%s" was lost', task_id, worker)
+                return
+        except (OSError, EOFError):
+            return
+
+
+def run_worker(address: Tuple[str, int],
+               authkey: str,
+               worker: Optional[str] = None,
+               max_samples: Optional[int] = None,
+               timeout: Optional[float] = None) -> int:
+    """Subtype samples leased from a coordinator until there are none left
+
+    Args:
+        address: Coordinator host and port
+        authkey: Shared secret of the coordinator
+        worker: Worker name (default: "<hostname>:<pid>")
+        max_samples: Stop after subtyping this many samples
+        timeout: Maximum seconds to subtype each sample (see `bio_hansel.subtyper.sample_timeout`)
+
+    Returns:
+        Number of samples subtyped
+    """
+    from .output import summary_record
+    from .subtyper import Subtyper, sample_timeout
+
+    worker = worker or f'{socket.gethostname()}:{os.getpid()}'
+    client = WorkQueueClient(address=tuple(address), authkey=authkey.encode())
+    client.connect()
+    queue = client.get_queue()
+    config = queue.config()
+    subtyper = Subtyper(scheme=config['scheme'],
+                        subtyping_params=config['subtyping_params'],
+                        scheme_name=config['scheme_name'])
+    logging.info('Worker "%s" connected to coordinator %s:%s', worker, *address)
+    n = 0
+    item = None
+    try:
+        while max_samples is None or n < max_samples:
+            item = queue.lease(worker)
+            if item is None:
+                if queue.is_done():
+                    break
+                time.sleep(POLL_INTERVAL)
+                continue
+            stop = threading.Event()
+            heartbeat = threading.Thread(target=_heartbeat,
+                                         args=(queue, worker, item.task_id, config['lease_seconds'] / 3, stop),
+                                         daemon=True)
+            heartbeat.start()
+            try:
+                with sample_timeout(timeout):
+                    if item.contigs:
+                        st, df = subtyper.subtype_contigs(item.contigs, item.sample)
+                    else:
+                        st, df = subtyper.subtype_reads(item.reads, item.sample)
+            except Exception as ex:
+                logging.exception('Worker "%s" failed to subtype sample "%s"', worker, item.sample)
+                queue.fail(worker, item.task_id, f'{type(ex).__name__}: {ex}')
+                continue
+            finally:
+                stop.set()
+                heartbeat.join()
+            queue.complete(worker, item.task_id, summary_record(st), df)
+            n += 1
+    except (OSError, EOFError) as ex:
+        if item is None:
+            # the coordinator stops once all samples are done
+            logging.info('Worker "%s" disconnected from coordinator while waiting for samples', worker)
+        else:
+            logging.warning('Worker "%s" lost connection to coordinator: %s', worker, ex)
+    logging.info('Worker "%s" subtyped %s samples', worker, n)
+    return n
+
+
+def write_results(results: List[Tuple[Dict[str, Any], pd.DataFrame]],
+                  output_summary: Optional[str] = None,
+                  output_kmer_results: Optional[str] = None,
+                  output_format: str = 'tsv') -> None:
+    """Write the summary and k-mer results outputs of completed samples like `hansel -o/-O`"""
+    from .const import SUBTYPE_SUMMARY_COLS
+    from .output import prepare_kmer_results, write_table
+    from .utils import df_field_fillna
+
+    dfsummary = pd.DataFrame([summary for summary, _ in results], columns=SUBTYPE_SUMMARY_COLS)
+    if dfsummary['avg_kmer_coverage'].isnull().all():
+        dfsummary = dfsummary.drop(labels='avg_kmer_coverage', axis=1)
+    dfsummary = df_field_fillna(dfsummary)
+    if output_summary:
+        write_table(dfsummary, output_summary, output_format)
+        logging.info('Wrote subtyping output summary to %s', output_summary)
+    else:
+        print(dfsummary.to_csv(sep='\t', index=False))
+    if output_kmer_results and results:
+        write_table(pd.concat([prepare_kmer_results(df) for _, df in results], sort=False),
+                    output_kmer_results,
+                    output_format)
+        logging.info('Kmer results written to "%s".', output_kmer_results)
+
+
+def read_authkey(authkey: Optional[str] = None, authkey_file: Optional[str] = None) -> Optional[str]:
+    """Get the shared secret of a coordinator
+
+    Args:
+        authkey: Shared secret
+        authkey_file: Path of a file with the shared secret
+
+    Returns:
+        `authkey`, the `HANSEL_QUEUE_AUTHKEY` environment variable or the contents of `authkey_file` if it exists,
+        whichever is found first, otherwise None
+    """
+    if authkey:
+        return authkey
+    if os.environ.get(AUTHKEY_ENV):
+        return os.environ[AUTHKEY_ENV]
+    if authkey_file and os.path.exists(authkey_file):
+        with open(authkey_file) as f:
+            return f.read().strip() or None
+    return None
+
+
+def write_authkey(authkey: str, authkey_file: str) -> None:
+    """Write a shared secret to a file only readable by the user"""
+    fd = os.open(authkey_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with open(fd, 'w') as f:
+        f.write(authkey + '\n')
+
+
+def coordinator_command(args: argparse.Namespace) -> None:
+    from .manifest import read_manifest
+    from .utils import does_file_exist, init_subtyping_params
+
+    does_file_exist(args.output_summary, args.force)
+    does_file_exist(args.output_kmer_results, args.force)
+    input_genomes, reads = read_manifest(args.manifest)
+    queue = WorkQueue(input_genomes, reads,
+                      scheme=args.scheme,
+                      scheme_name=args.scheme_name,
+                      subtyping_params=init_subtyping_params(args, args.scheme),
+                      lease_seconds=args.lease_seconds,
+                      max_attempts=args.max_attempts)
+    authkey = read_authkey(args.authkey, args.authkey_file)
+    with Coordinator(queue, args.host, args.port, authkey) as coordinator:
+        if authkey is None:
+            logging.warning('Workers must connect with the generated authkey "%s"', coordinator.authkey)
+            if args.authkey_file:
+                write_authkey(coordinator.authkey, args.authkey_file)
+                logging.warning('Wrote the authkey to "%s"', args.authkey_file)
+        coordinator.wait(log_interval=args.log_interval)
+        results = coordinator.results()
+    write_results(results, args.output_summary, args.output_kmer_results, args.output_format)
+    if queue.failed:
+        logging.error('%s samples could not be subtyped and are reported with a "FAIL" QC status: %s',
+                      len(queue.failed), ', '.join(queue.items[i].sample for i in sorted(queue.failed)))
+
+
+def _worker_process(address: Tuple[str, int], authkey: str, timeout: Optional[float], verbose: int) -> None:
+    from .main import init_console_logger
+
+    init_console_logger(verbose)
+    run_worker(address, authkey, timeout=timeout)
+
+
+def worker_command(args: argparse.Namespace) -> None:
+    address = (args.host, args.port)
+    authkey = read_authkey(args.authkey, args.authkey_file)
+    if authkey is None:
+        raise ValueError(f'The coordinator\'s authkey must be given with "--authkey", "--authkey-file" or the '
+                         f'{AUTHKEY_ENV} environment variable')
+    if args.threads == 1:
+        run_worker(address, authkey, timeout=args.sample_timeout)
+        return
+    processes = [Process(target=_worker_process, args=(address, authkey, args.sample_timeout, args.verbose))
+                 for _ in range(args.threads)]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+
+
+def init_parser():
+    parser = argparse.ArgumentParser(prog='hansel-queue',
+                                     description='Subtype a batch of samples with workers on any number of nodes '
+                                                 'pulling samples from a coordinator')
+    parser.add_argument('-v', '--verbose',
+                        action='count',
+                        default=0,
+                        help='Logging verbosity level (-v == show warnings; -vvv == show debug info)')
+    parser.add_argument('-V', '--version',
+                        action='version',
+                        version='%(prog)s {}'.format(__version__))
+    subparsers = parser.add_subparsers(dest='command', metavar='COMMAND')
+    subparsers.required = True
+
+    coordinator_parser = subparsers.add_parser('coordinator',
+                                               help='Serve the samples of a manifest to workers and write their '
+                                                    'results once all samples are subtyped')
+    coordinator_parser.add_argument('manifest', help='Manifest of samples to subtype (see "hansel --manifest")')
+    coordinator_parser.add_argument('-s', '--scheme',
+                                    default='heidelberg',
+                                    help='Scheme to use for subtyping (built-in: "heidelberg", "enteritidis", '
+                                         '"typhimurium", "typhi", "tb_lineage"; OR user-specified: '
+                                         '/path/to/user/scheme)')
+    coordinator_parser.add_argument('--scheme-name', help='Custom user-specified SNP substyping scheme name')
+    coordinator_parser.add_argument('-o', '--output-summary', help='Subtyping summary output path')
+    coordinator_parser.add_argument('-O', '--output-kmer-results', help='Subtyping kmer matching output path')
+    coordinator_parser.add_argument('--output-format',
+                                    choices=OUTPUT_FORMATS,
+                                    default='tsv',
+                                    help='Output format for the summary and kmer results (default="tsv")')
+    coordinator_parser.add_argument('--force',
+                                    action='store_true',
+                                    help='Force existing output files to be overwritten')
+    coordinator_parser.add_argument('--host',
+                                    default='127.0.0.1',
+                                    help='Address to listen on for workers (default="127.0.0.1"; e.g. "0.0.0.0" for '
+                                         'workers on other nodes)')
+    coordinator_parser.add_argument('-p', '--port',
+                                    type=int,
+                                    default=DEFAULT_PORT,
+                                    help=f'TCP port to listen on for workers (default={DEFAULT_PORT})')
+    coordinator_parser.add_argument('--authkey',
+                                    help=f'Shared secret workers must connect with (default: ${AUTHKEY_ENV}, the '
+                                         f'contents of "--authkey-file" or a random authkey that is logged)')
+    coordinator_parser.add_argument('--authkey-file',
+                                    help='File with the shared secret; a random authkey is written to the file if it '
+                                         'does not exist')
+    coordinator_parser.add_argument('--lease-seconds',
+                                    type=float,
+                                    default=DEFAULT_LEASE_SECONDS,
+                                    help='Seconds without a worker heartbeat before a leased sample is re-queued '
+                                         f'(default={DEFAULT_LEASE_SECONDS:g})')
+    coordinator_parser.add_argument('--max-attempts',
+                                    type=int,
+                                    default=3,
+                                    help='Maximum number of times a sample is leased to workers (default=3)')
+    coordinator_parser.add_argument('--log-interval',
+                                    type=float,
+                                    default=30.0,
+                                    help='Seconds between work queue status log messages (default=30)')
+    for name, opt_type in [('min_kmer_freq', int), ('min_kmer_frac', float), ('max_kmer_freq', int),
+                           ('low_cov_depth_freq', int), ('max_missing_kmers', float), ('min_ambiguous_kmers', int),
+                           ('low_cov_warning', int), ('max_intermediate_kmers', float),
+                           ('max_degenerate_kmers', int)]:
+        coordinator_parser.add_argument('--' + name.replace('_', '-'), type=opt_type,
+                                        help='See "hansel --help"')
+    coordinator_parser.set_defaults(func=coordinator_command)
+
+    worker_parser = subparsers.add_parser('worker', help='Subtype samples leased from a coordinator')
+    worker_parser.add_argument('host', help='Coordinator host name or address')
+    worker_parser.add_argument('-p', '--port',
+                               type=int,
+                               default=DEFAULT_PORT,
+                               help=f'Coordinator TCP port (default={DEFAULT_PORT})')
+    worker_parser.add_argument('--authkey',
+                               help=f'Shared secret of the coordinator (default: ${AUTHKEY_ENV} or the contents of '
+                                    f'"--authkey-file")')
+    worker_parser.add_argument('--authkey-file', help='File with the shared secret of the coordinator')
+    worker_parser.add_argument('-t', '--threads',
+                               type=int,
+                               default=1,
+                               help='Number of worker processes (default=1)')
+    worker_parser.add_argument('--sample-timeout',
+                               type=float,
+                               metavar='SECONDS',
+                               help='Maximum seconds to subtype each sample; samples that take longer are re-queued '
+                                    'for another attempt')
+    worker_parser.set_defaults(func=worker_command)
+    return parser
+
+
+def main():
+    from .main import init_console_logger
+
+    parser = init_parser()
+    args = parser.parse_args()
+    init_console_logger(args.verbose)
+    try:
+        args.func(args)
+    except (ValueError, OSError) as ex:
+        logging.error(ex)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
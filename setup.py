@@ -37,13 +37,20 @@ setup(
     entry_points={'console_scripts': [
         'hansel=bio_hansel.main:main',
         'biohansel=bio_hansel.main:main',
+        'hansel-server=bio_hansel.server:main',
+        'hansel-scheme=bio_hansel.scheme_tool:main',
+        'hansel-merge=bio_hansel.merge:main',
+        'hansel-queue=bio_hansel.work_queue:main',
+        'hansel-watch=bio_hansel.watch:main',
+        'hansel-stream=bio_hansel.provisional:main',
     ]},
     install_requires=requirements,
+    extras_require={'arrow': ['pyarrow'], 'zstd': ['zstandard']},
     keywords='Salmonella enterica Heidelberg Enteritidis SNP kmer subtyping Aho-Corasick',
     license='Apache Software License 2.0',
     long_description=readme,
     name='bio_hansel',
-    package_data={'bio_hansel': ['data/*/*.fasta', 'data/*/*.tsv',]},
+    package_data={'bio_hansel': ['data/*/*.fasta', 'data/*/*.tsv', 'data/*/*.bundle']},
     packages=find_packages(exclude=['test_*.py', 'tests']),
     test_suite='tests',
     url='https://github.com/phac-nml/biohansel',
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from bio_hansel.bundle import compile_scheme_fasta, compile_builtin_scheme, write_bundle, read_bundle, \
+    read_bundle_header, is_bundle, load_scheme, builtin_bundle_path, BundleError
+from bio_hansel.const import SCHEME_FASTAS
+from bio_hansel.subtype_stats import subtype_counts, kmer_set_digest
+from bio_hansel.subtyper import Subtyper
+from bio_hansel.output import summary_record
+
+scheme_heidelberg_fasta = SCHEME_FASTAS['heidelberg']['file']
+fasta_gz_heidelberg_pass = 'tests/data/SRR1002850_SMALL.fasta.gz'
+
+
+def test_bundle_round_trip(tmp_path):
+    bundle_path = str(tmp_path / 'heidelberg.bundle')
+    bundle = compile_scheme_fasta(scheme_heidelberg_fasta, scheme_version='0.5.0')
+    write_bundle(bundle, bundle_path)
+    assert is_bundle(bundle_path)
+    assert not is_bundle(scheme_heidelberg_fasta)
+    loaded = read_bundle(bundle_path)
+    assert loaded.kmers == bundle.kmers
+    assert loaded.kmer_set == kmer_set_digest(scheme_heidelberg_fasta)
+    assert loaded.subtype_counts == subtype_counts(scheme_heidelberg_fasta)
+    assert loaded.scheme_version == '0.5.0'
+    assert loaded.expanded_kmers == bundle.expanded_kmers
+    for name in ['kmer_refposition', 'kmer_subtype', 'kmer_is_positive', 'expanded_kmer_index']:
+        assert np.array_equal(getattr(loaded, name), getattr(bundle, name))
+    header, _ = loaded.kmers[0]
+    refposition, subtype = header.split('-')
+    assert loaded.subtypes[loaded.kmer_subtype[0]] == subtype
+    assert loaded.kmer_refposition[0] == int(refposition.replace('negative', ''))
+    assert loaded.hierarchy['2.2.1'] == '2.2'
+    assert loaded.hierarchy['2'] is None
+
+
+def test_subtype_with_bundle(tmp_path):
+    bundle_path = str(tmp_path / 'heidelberg.bundle')
+    write_bundle(compile_scheme_fasta(scheme_heidelberg_fasta, scheme_version='0.5.0'), bundle_path)
+    st_bundle, df_bundle = Subtyper(bundle_path).subtype_contigs(fasta_gz_heidelberg_pass, 'test')
+    st, df = Subtyper(scheme_heidelberg_fasta).subtype_contigs(fasta_gz_heidelberg_pass, 'test')
+    assert st_bundle.scheme_version == '0.5.0'
+    st_bundle.scheme_version = None
+    st_bundle.scheme = st.scheme
+    assert summary_record(st_bundle) == summary_record(st)
+    assert df_bundle.shape == df.shape
+
+
+def test_builtin_bundles_up_to_date():
+    for scheme in SCHEME_FASTAS:
+        header = read_bundle_header(builtin_bundle_path(scheme))
+        exp = compile_builtin_scheme(scheme)
+        assert header['source_sha256'] == exp.source_sha256
+        assert header['scheme_version'] == SCHEME_FASTAS[scheme]['version']
+        bundle = load_scheme(scheme)
+        assert bundle.path == builtin_bundle_path(scheme)
+        assert bundle.subtype_counts == exp.subtype_counts
+        assert bundle.metadata == exp.metadata
+
+
+def test_read_invalid_bundle(tmp_path):
+    with pytest.raises(BundleError):
+        read_bundle(scheme_heidelberg_fasta)
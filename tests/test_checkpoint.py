@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+from bio_hansel.checkpoint import Journal, read_journal, read_journal_header, journal_header_mismatches
+from bio_hansel.subtyper import subtype_reads, subtype_contigs
+
+fastq_heidelberg_pass = 'tests/data/SRR5646583_SMALL.fastq'
+fasta_gz_heidelberg_pass = 'tests/data/SRR1002850_SMALL.fasta.gz'
+
+
+def test_journal_round_trip(tmp_path):
+    journal_path = str(tmp_path / 'results.tsv.journal.jsonl')
+    st_reads, df_reads = subtype_reads(reads=fastq_heidelberg_pass, genome_name='reads', scheme='heidelberg')
+    st_contigs, df_contigs = subtype_contigs(fasta_path=fasta_gz_heidelberg_pass,
+                                             genome_name='contigs',
+                                             scheme='heidelberg')
+    with Journal(journal_path) as journal:
+        journal.record(st_reads, df_reads)
+        journal.record(st_contigs, df_contigs)
+    completed = read_journal(journal_path)
+    assert set(completed.keys()) == {'reads', 'contigs'}
+    summary, df = completed['reads']
+    assert summary['subtype'] == st_reads.subtype
+    assert summary['qc_status'] == st_reads.qc_status
+    assert 'scheme_subtype_counts' not in summary
+    assert df.shape == df_reads.shape
+    assert sorted(df.kmername) == sorted(df_reads.kmername)
+
+
+def test_journal_incomplete_record(tmp_path):
+    journal_path = str(tmp_path / 'results.tsv.journal.jsonl')
+    st, df = subtype_reads(reads=fastq_heidelberg_pass, genome_name='reads', scheme='heidelberg')
+    with Journal(journal_path, include_kmers=False) as journal:
+        journal.record(st, df)
+    with open(journal_path, 'a') as f:
+        f.write('{"sample": "killed-mid-write", "summ')
+    assert set(read_journal(journal_path).keys()) == {'reads'}
+    # appending to a journal with an incomplete record starts a new line
+    st.sample = 'resumed'
+    with Journal(journal_path, include_kmers=False) as journal:
+        journal.record(st, df)
+    completed = read_journal(journal_path)
+    assert set(completed.keys()) == {'reads', 'resumed'}
+    assert completed['resumed'][1] is None
+
+
+def test_journal_header(tmp_path):
+    journal_path = str(tmp_path / 'results.tsv.journal.jsonl')
+    header = dict(scheme='heidelberg', scheme_version='0.5.0', kmer_set='abc')
+    st, df = subtype_reads(reads=fastq_heidelberg_pass, genome_name='reads', scheme='heidelberg')
+    with Journal(journal_path, include_kmers=False, header=header) as journal:
+        journal.record(st, df)
+    # the header is only written to a new journal
+    with Journal(journal_path, include_kmers=True, header=header) as journal:
+        st.sample = 'resumed'
+        journal.record(st, df)
+    assert read_journal_header(journal_path) == dict(header, include_kmers=False)
+    assert set(read_journal(journal_path).keys()) == {'reads', 'resumed'}
+    assert journal_header_mismatches(read_journal_header(journal_path), header) == []
+    assert journal_header_mismatches(read_journal_header(journal_path), dict(header, kmer_set='def')) == [
+        'kmer_set "abc" != "def"']
+    assert read_journal_header(str(tmp_path / 'missing.jsonl')) is None
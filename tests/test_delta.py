@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import os
+
+from bio_hansel.const import SCHEME_FASTAS
+from bio_hansel.delta import scheme_delta, read_kmer_results, delta_subtype_reads, delta_subtype_contigs
+from bio_hansel.parsers import parse_fasta
+from bio_hansel.subtype_stats import kmer_set_digest
+from bio_hansel.subtyper import subtype_reads, subtype_contigs
+from . import check_subtype_attrs
+
+genome_name = 'test'
+fastq_heidelberg_pass = 'tests/data/SRR5646583_SMALL.fastq'
+fasta_gz_heidelberg_pass = 'tests/data/SRR1002850_SMALL.fasta.gz'
+scheme_heidelberg_fasta = SCHEME_FASTAS['heidelberg']['file']
+
+
+def write_old_scheme(path):
+    """Write an "old" version of the Heidelberg scheme missing some k-mers and with one k-mer changed"""
+    kmers = list(parse_fasta(scheme_heidelberg_fasta))
+    with open(path, 'w') as f:
+        for i, (header, seq) in enumerate(kmers):
+            if i % 10 == 0:
+                continue
+            if i == 1:
+                seq = 'A' * len(seq)
+            f.write(f'>{header}\n{seq}\n')
+    return kmers
+
+
+def test_kmer_set_digest(tmp_path):
+    old_scheme = str(tmp_path / 'old.fasta')
+    write_old_scheme(old_scheme)
+    assert kmer_set_digest(scheme_heidelberg_fasta) == kmer_set_digest(scheme_heidelberg_fasta)
+    assert kmer_set_digest(old_scheme) != kmer_set_digest(scheme_heidelberg_fasta)
+    # a scheme edited in place is digested again
+    old_digest = kmer_set_digest(old_scheme)
+    with open(old_scheme, 'a') as f:
+        f.write('>99999-2.2\nACGTACGTACGTACGTACGTACGTACGTACGTA\n')
+    stat = os.stat(old_scheme)
+    os.utime(old_scheme, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert kmer_set_digest(old_scheme) != old_digest
+
+
+def test_scheme_delta(tmp_path):
+    old_scheme = str(tmp_path / 'old.fasta')
+    kmers = write_old_scheme(old_scheme)
+    delta = scheme_delta(old_scheme, scheme_heidelberg_fasta)
+    exp_changed = {h for i, (h, s) in enumerate(kmers) if i % 10 == 0 or i == 1}
+    assert set(delta.changed_kmers.keys()) == exp_changed
+    assert delta.stale_kmers == {kmers[1][0]}
+    assert delta.old_kmer_set == kmer_set_digest(old_scheme)
+    assert delta.new_kmer_set == kmer_set_digest(scheme_heidelberg_fasta)
+
+
+def test_delta_subtype_reads(tmp_path):
+    old_scheme = str(tmp_path / 'old.fasta')
+    write_old_scheme(old_scheme)
+    _, df_old = subtype_reads(reads=fastq_heidelberg_pass, genome_name=genome_name, scheme=old_scheme)
+    kmer_results = str(tmp_path / 'kmer-results.tsv')
+    df_old.to_csv(kmer_results, sep='\t', index=None)
+
+    delta = scheme_delta(old_scheme, scheme_heidelberg_fasta)
+    previous = read_kmer_results(kmer_results, delta.old_kmer_set)
+    assert genome_name in previous
+    st_delta, df_delta = delta_subtype_reads(reads=fastq_heidelberg_pass,
+                                             genome_name=genome_name,
+                                             scheme='heidelberg',
+                                             delta=delta,
+                                             df_previous=previous[genome_name])
+    st, df = subtype_reads(reads=fastq_heidelberg_pass, genome_name=genome_name, scheme='heidelberg')
+    check_subtype_attrs(st_delta, st)
+    assert st_delta.kmer_set == st.kmer_set
+    assert st_delta.avg_kmer_coverage == st.avg_kmer_coverage
+    assert sorted(zip(df_delta.kmername, df_delta.freq)) == sorted(zip(df.kmername, df.freq))
+
+
+def test_delta_subtype_contigs(tmp_path):
+    old_scheme = str(tmp_path / 'old.fasta')
+    write_old_scheme(old_scheme)
+    _, df_old = subtype_contigs(fasta_path=fasta_gz_heidelberg_pass, genome_name=genome_name, scheme=old_scheme)
+    kmer_results = str(tmp_path / 'kmer-results.tsv')
+    df_old.to_csv(kmer_results, sep='\t', index=None)
+
+    delta = scheme_delta(old_scheme, scheme_heidelberg_fasta)
+    previous = read_kmer_results(kmer_results, delta.old_kmer_set)
+    st_delta, df_delta = delta_subtype_contigs(fasta_path=fasta_gz_heidelberg_pass,
+                                               genome_name=genome_name,
+                                               scheme='heidelberg',
+                                               delta=delta,
+                                               df_previous=previous[genome_name])
+    st, df = subtype_contigs(fasta_path=fasta_gz_heidelberg_pass, genome_name=genome_name, scheme='heidelberg')
+    check_subtype_attrs(st_delta, st)
+    assert sorted(df_delta.kmername) == sorted(df.kmername)
+
+
+def test_read_kmer_results_other_kmer_set(tmp_path):
+    _, df = subtype_reads(reads=fastq_heidelberg_pass, genome_name=genome_name, scheme='heidelberg')
+    kmer_results = str(tmp_path / 'kmer-results.tsv')
+    df.to_csv(kmer_results, sep='\t', index=None)
+    assert read_kmer_results(kmer_results, 'not-the-kmer-set') == {}
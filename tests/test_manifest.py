@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pandas as pd
+import pytest
+
+from bio_hansel.manifest import read_manifest, manifest_samples, assign_shards, shard_inputs, parse_shard
+from bio_hansel.merge import merge_tables, read_table
+
+fastq = os.path.abspath('tests/data/SRR5646583_SMALL.fastq')
+fasta = os.path.abspath('tests/data/SRR1002850_SMALL.fasta.gz')
+
+
+def test_read_manifest(tmpdir):
+    manifest = tmpdir.join('manifest.tsv')
+    manifest.write('sample\tfiles\n'
+                   '# comment\n'
+                   f'reads\t{fastq}\t{fastq}\n'
+                   '\n'
+                   f'contigs\t{fasta}\n'
+                   f'missing\tmissing.fasta\n')
+    input_genomes, reads = read_manifest(str(manifest))
+    assert input_genomes == [(fasta, 'contigs')]
+    assert reads == [([fastq, fastq], 'reads')]
+    assert manifest_samples(str(manifest)) == ['contigs', 'missing', 'reads']
+    manifest.write(f'a\t{fasta}\t{fastq}\n')
+    with pytest.raises(ValueError):
+        read_manifest(str(manifest))
+    manifest.write(f'a\t{fasta}\na\t{fasta}\n')
+    with pytest.raises(ValueError):
+        read_manifest(str(manifest))
+
+
+def test_shards_are_balanced_and_deterministic():
+    sample_sizes = [(f's{i}', size) for i, size in enumerate([100, 10, 60, 40, 50, 50, 1, 0])]
+    shards = assign_shards(sample_sizes, 3)
+    assert shards == assign_shards(sample_sizes, 3)
+    totals = [sum(size for (_, size), x in zip(sample_sizes, shards) if x == shard) for shard in range(3)]
+    assert sorted(totals) == [100, 101, 110]
+    input_genomes = [(fasta, 'contigs')]
+    reads = [([fastq], 'reads1'), ([fastq], 'reads2')]
+    selected = [shard_inputs(input_genomes, reads, i, 2) for i in [1, 2]]
+    assert sorted(x for genomes, _ in selected for x in genomes) == input_genomes
+    assert sorted(x for _, shard_reads in selected for x in shard_reads) == reads
+    assert parse_shard('2/8') == (2, 8)
+    for shard in ['0/2', '3/2', '1']:
+        with pytest.raises(Exception):
+            parse_shard(shard)
+
+
+def test_merge_tables(tmpdir):
+    shard1 = tmpdir.join('summary-1.tsv')
+    shard1.write('sample\tsubtype\tavg_kmer_coverage\nb\t2.2\t10.500\n')
+    shard2 = tmpdir.join('summary-2.tsv')
+    shard2.write('sample\tsubtype\na\t2.10\nc\t#N/A\n')
+    dfs = [read_table(str(shard1)), read_table(str(shard2))]
+    df = merge_tables(dfs, sample_order={'a': 0, 'b': 1})
+    assert df.to_dict('records') == [dict(sample='a', subtype='2.10', avg_kmer_coverage=''),
+                                     dict(sample='b', subtype='2.2', avg_kmer_coverage='10.500'),
+                                     dict(sample='c', subtype='#N/A', avg_kmer_coverage='')]
+    with pytest.raises(ValueError):
+        merge_tables(dfs + [pd.DataFrame(dict(sample=['a']))])
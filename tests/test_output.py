@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import pytest
+
+from bio_hansel.output import KmerResultsWriter, SummaryJsonLinesWriter, KmerResultsJsonLinesWriter, write_table, \
+    summary_record, metadata_lookup
+from bio_hansel.subtyper import subtype_reads, subtype_contigs
+
+fastq_heidelberg_pass = 'tests/data/SRR5646583_SMALL.fastq'
+fasta_gz_heidelberg_pass = 'tests/data/SRR1002850_SMALL.fasta.gz'
+
+
+@pytest.fixture(scope='module')
+def results():
+    return [subtype_reads(reads=fastq_heidelberg_pass, genome_name='reads', scheme='heidelberg'),
+            subtype_contigs(fasta_path=fasta_gz_heidelberg_pass, genome_name='contigs', scheme='heidelberg'),
+            subtype_reads(reads=fastq_heidelberg_pass, genome_name='reads2', scheme='heidelberg')]
+
+
+def read_columnar(path, output_format):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    if output_format == 'parquet':
+        return pq.read_table(path)
+    return pa.ipc.open_file(path).read_all()
+
+
+@pytest.mark.parametrize('output_format', ['parquet', 'arrow'])
+def test_kmer_results_writer(tmp_path, results, output_format):
+    pytest.importorskip('pyarrow')
+    import pyarrow as pa
+    path = str(tmp_path / f'kmer-results.{output_format}')
+    with KmerResultsWriter(path, output_format, samples_per_batch=2) as writer:
+        for st, df in results:
+            writer.add(summary_record(st), df)
+    table = read_columnar(path, output_format)
+    assert table.num_rows == sum(df.shape[0] for _, df in results)
+    for column in ['sample', 'scheme', 'subtype', 'qc_status']:
+        assert pa.types.is_dictionary(table.schema.field(column).type)
+    df = table.to_pandas()
+    assert set(df['sample']) == {'reads', 'contigs', 'reads2'}
+    assert df[df['sample'] == 'reads']['freq'].notnull().all()
+    assert df[df['sample'] == 'contigs']['match_index'].notnull().all()
+    if output_format == 'parquet':
+        import pyarrow.parquet as pq
+        assert pq.ParquetFile(path).metadata.num_row_groups == 2
+
+
+@pytest.mark.parametrize('output_format', ['parquet', 'arrow'])
+def test_write_summary_table(tmp_path, results, output_format):
+    pytest.importorskip('pyarrow')
+    path = str(tmp_path / f'summary.{output_format}')
+    dfsummary = pd.DataFrame([summary_record(st) for st, _ in results])
+    write_table(dfsummary, path, output_format)
+    df = read_columnar(path, output_format).to_pandas()
+    assert df.shape[0] == 3
+    assert list(df['subtype'].astype(str)) == [st.subtype for st, _ in results]
+
+
+def test_jsonl_writers(tmp_path, results):
+    import json
+    summary_path = str(tmp_path / 'summary.jsonl')
+    kmers_path = str(tmp_path / 'kmer-results.jsonl')
+    df_md = pd.DataFrame(dict(subtype=[st.subtype for st, _ in results], lineage=['a', 'b', 'c']))
+    with SummaryJsonLinesWriter(summary_path, metadata_lookup(df_md)) as summary_writer, \
+            KmerResultsJsonLinesWriter(kmers_path) as kmers_writer:
+        for st, df in results:
+            summary = summary_record(st)
+            summary_writer.add(summary, df)
+            kmers_writer.add(summary, df)
+            # records are available to readers as soon as each sample is added
+            with open(summary_path) as f:
+                assert json.loads(f.readlines()[-1])['sample'] == st.sample
+    with open(summary_path) as f:
+        summaries = [json.loads(line) for line in f]
+    assert [x['sample'] for x in summaries] == ['reads', 'contigs', 'reads2']
+    assert summaries[0]['subtype'] == results[0][0].subtype
+    assert summaries[0]['lineage'] == 'a'
+    assert 'scheme_subtype_counts' not in summaries[0]
+    with open(kmers_path) as f:
+        kmers = [json.loads(line) for line in f]
+    assert len(kmers) == sum(df.shape[0] for _, df in results)
+    assert 'qc_message' not in kmers[0]
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import bz2
+import gzip
+import lzma
+import os
+import shutil
+import subprocess
+import threading
+
+import pytest
+
+from bio_hansel.const import REGEX_FASTA, REGEX_FASTQ
+from bio_hansel.parsers import parse_fastq, parse_fasta, compression_format
+from bio_hansel.utils import genome_name_from_fasta_path
+
+fastq = 'tests/data/SRR5646583_SMALL.fastq'
+fasta = 'tests/data/fail-qc-missing-levels.fasta'
+
+
+def compress(path: str, out: str, compression: str) -> str:
+    with open(path, 'rb') as f:
+        data = f.read()
+    if compression == 'zstd':
+        subprocess.run(['zstd', '-q', '-o', out, path], check=True)
+    else:
+        with {'gzip': gzip, 'bzip2': bz2, 'xz': lzma}[compression].open(out, 'wb') as fout:
+            fout.write(data)
+    return out
+
+
+@pytest.mark.parametrize('compression,ext', [('gzip', 'gz'), ('bzip2', 'bz2'), ('xz', 'xz'), ('zstd', 'zst')])
+def test_compressed_inputs(tmpdir, compression, ext):
+    if compression == 'zstd' and shutil.which('zstd') is None:
+        pytest.skip('"zstd" command is not installed')
+    path = compress(fastq, str(tmpdir.join(f'reads.fastq.{ext}')), compression)
+    with open(path, 'rb') as f:
+        assert compression_format(f.read(8)) == compression
+    assert list(parse_fastq(path)) == list(parse_fastq(fastq))
+    # the format is detected by its magic bytes rather than the filename extension
+    mislabelled = str(tmpdir.join('reads.fastq'))
+    os.rename(path, mislabelled)
+    assert list(parse_fastq(mislabelled)) == list(parse_fastq(fastq))
+    path = compress(fasta, str(tmpdir.join(f'contigs.fasta.{ext}')), compression)
+    assert list(parse_fasta(path)) == list(parse_fasta(fasta))
+    assert REGEX_FASTQ.match(f'reads_1.fastq.{ext}') and REGEX_FASTA.match(f'contigs.fna.{ext}')
+    assert genome_name_from_fasta_path(f'/path/contigs.fasta.{ext}') == 'contigs'
+
+
+def test_compressed_named_pipe(tmpdir):
+    path = compress(fastq, str(tmpdir.join('reads.fastq.xz')), 'xz')
+    fifo = str(tmpdir.join('fifo'))
+    os.mkfifo(fifo)
+
+    def write_fifo():
+        with open(path, 'rb') as fin, open(fifo, 'wb') as fout:
+            shutil.copyfileobj(fin, fout)
+
+    writer = threading.Thread(target=write_fifo)
+    writer.start()
+    assert list(parse_fastq(fifo)) == list(parse_fastq(fastq))
+    writer.join()
+
+
+def test_not_compressed_with_compressed_extension(tmpdir):
+    path = tmpdir.join('reads.fastq.bz2')
+    path.write('not compressed')
+    assert compression_format(b'not compressed') is None
+    with pytest.raises(OSError, match='Could not decompress'):
+        list(parse_fastq(str(path)))
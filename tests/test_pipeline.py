@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import glob
+import os
+import shlex
+import threading
+import time
+
+import pytest
+
+from bio_hansel import parsers
+from bio_hansel.parsers import parse_fastq
+from bio_hansel.pipeline import pipelined, prefetch_files
+from bio_hansel.subtyper import subtyping_tasks, run_subtyping_task
+
+fastq = 'tests/data/SRR5646583_SMALL.fastq'
+fasta_gz = 'tests/data/SRR1002850_SMALL.fasta.gz'
+
+
+def reader_threads():
+    return {x for x in threading.enumerate() if x.name == 'pipeline-reader'}
+
+
+def processes_with_arg(arg):
+    out = []
+    for path in glob.glob('/proc/[0-9]*/cmdline'):
+        try:
+            with open(path, 'rb') as f:
+                if arg.encode() in f.read().split(b'\0'):
+                    out.append(path)
+        except OSError:
+            pass
+    return out
+
+
+def test_pipelined_preserves_records_and_order():
+    assert list(pipelined(range(2503), batch_size=100, max_batches=2)) == list(range(2503))
+    assert list(pipelined([])) == []
+    assert list(pipelined(parse_fastq(fastq), batch_size=7)) == list(parse_fastq(fastq))
+
+
+def test_pipelined_reraises_reader_errors_after_earlier_records():
+    def records():
+        yield from range(5)
+        raise ValueError('bad record')
+
+    out = []
+    with pytest.raises(ValueError, match='bad record'):
+        for x in pipelined(records(), batch_size=2):
+            out.append(x)
+    assert out == [0, 1, 2, 3]
+
+
+def test_pipelined_stops_reader_when_closed_early():
+    closed = threading.Event()
+
+    def records():
+        try:
+            i = 0
+            while True:
+                yield i
+                i += 1
+        finally:
+            closed.set()
+
+    readers = reader_threads()
+    it = pipelined(records(), batch_size=10, max_batches=1)
+    assert [next(it) for _ in range(15)] == list(range(15))
+    it.close()
+    assert closed.wait(5)
+    assert reader_threads() == readers
+
+
+def test_sample_timeout_stops_blocked_fifo_reader(tmpdir):
+    fifo = str(tmpdir.join('never-written.fastq'))
+    os.mkfifo(fifo)
+    readers = reader_threads()
+    tasks = subtyping_tasks(input_genomes=[], reads=[([fifo], 'hung')], scheme='heidelberg')
+    st, _ = run_subtyping_task(tasks[0], timeout=0.5, retries=1, isolate_errors=True)
+    assert 'SampleTimeout' in st.qc_message
+    assert reader_threads() == readers
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc'), reason='requires /proc to list processes')
+def test_sample_timeout_kills_hung_decompression(tmpdir, monkeypatch):
+    # the decompression command hangs opening a named pipe that is never written
+    fifo = str(tmpdir.join('never-written'))
+    os.mkfifo(fifo)
+    monkeypatch.setattr(parsers, 'COMPRESSION_FORMATS',
+                        [(magic, name, f'cat {shlex.quote(fifo)} && {command}')
+                         for magic, name, command in parsers.COMPRESSION_FORMATS])
+    readers = reader_threads()
+    tasks = subtyping_tasks(input_genomes=[(fasta_gz, 'hung')], reads=[], scheme='heidelberg')
+    start = time.monotonic()
+    st, _ = run_subtyping_task(tasks[0], timeout=0.5, retries=1, isolate_errors=True)
+    assert time.monotonic() - start < 5
+    assert 'SampleTimeout' in st.qc_message
+    assert reader_threads() == readers
+    assert processes_with_arg(fifo) == []
+
+
+def test_prefetch_files_ignores_missing_and_special_files(tmpdir):
+    fifo = str(tmpdir.join('fifo'))
+    os.mkfifo(fifo)
+    prefetch_files([fastq, str(tmpdir.join('missing.fastq')), fifo])
+    prefetch_files(fastq)
+    prefetch_files(None)
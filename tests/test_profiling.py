@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import time
+
+from bio_hansel.const import RESOURCE_SUMMARY_COLS
+from bio_hansel.profiling import profile_sample, stage, timed_iter, is_profiling, profile_report, profile_summary, \
+    Profile, resource_record, chrome_trace, write_chrome_trace
+from bio_hansel.subtyper import subtyping_tasks, iter_profiled_subtyping_results
+
+fastq = 'tests/data/SRR5646583_SMALL.fastq'
+fasta = 'tests/data/SRR1002850_SMALL.fasta.gz'
+
+
+def test_stage_times_are_exclusive():
+    with stage('ignored'):
+        assert not is_profiling()
+    with profile_sample('a') as profile:
+        assert is_profiling()
+        with stage('outer'):
+            time.sleep(0.02)
+            with stage('inner'):
+                time.sleep(0.05)
+            for _ in timed_iter(range(3), 'items'):
+                pass
+    assert not is_profiling()
+    assert 'ignored' not in profile.stages
+    assert profile.stages['inner'].wall >= 0.05
+    assert 0.02 <= profile.stages['outer'].wall < 0.05
+    assert profile.stages['items'].calls == 3
+    assert profile.wall >= sum(x.wall for x in profile.stages.values())
+
+
+def test_profiled_subtyping_results():
+    tasks = subtyping_tasks(input_genomes=[(fasta, 'contigs')], reads=[([fastq], 'reads')], scheme='heidelberg')
+    for n_threads in [1, 2]:
+        results = list(iter_profiled_subtyping_results(tasks, n_threads))
+        profiles = {profile.name: profile for _, _, profile in results}
+        assert set(profiles) == {'contigs', 'reads'}
+        for profile in profiles.values():
+            assert {'parse', 'match', 'process_results', 'qc'} <= set(profile.stages)
+            assert profile.wall > 0
+        assert profiles['reads'].stages['parse'].calls > 0
+        assert 'kmer_fraction' in profiles['reads'].stages
+    run_profile = Profile('run')
+    run_profile.lap('subtyping')
+    report = profile_report(run_profile.finish(), [profile for _, _, profile in results])
+    assert {x['stage'] for x in report['stages']} >= {'parse', 'match', 'other'}
+    assert [x['name'] for x in report['samples']] == [x.name for _, _, x in results]
+    assert 'match' in profile_summary(report)
+
+
+def test_resource_accounting():
+    tasks = subtyping_tasks(input_genomes=[(fasta, 'contigs')], reads=[([fastq], 'reads')], scheme='heidelberg')
+    results = {st.sample: (st, profile)
+               for st, _, profile in iter_profiled_subtyping_results(tasks, n_threads=2, time_stages=False)}
+    for sample, (st, profile) in results.items():
+        assert dict(profile.stages) == {}
+        record = resource_record(profile)
+        assert list(record) == RESOURCE_SUMMARY_COLS
+        assert record['input_bytes'] == os.path.getsize(fasta if sample == 'contigs' else fastq)
+        assert record['n_kmer_hits'] > 0
+        assert record['elapsed_seconds'] > 0
+        assert record['peak_rss_mb'] > 0
+    assert resource_record(results['reads'][1])['n_sequences'] == 5000
+    assert resource_record(results['contigs'][1])['n_sequences'] > 0
+
+
+def test_chrome_trace(tmp_path):
+    tasks = subtyping_tasks(input_genomes=[(fasta, 'contigs')], reads=[([fastq], 'reads')], scheme='heidelberg')
+    run_profile = Profile('run', spans=[])
+    profiles = [profile for _, _, profile in iter_profiled_subtyping_results(tasks, n_threads=2, record_spans=True)]
+    run_profile.lap('subtyping')
+    trace = chrome_trace(run_profile.finish(), profiles)
+    path = str(tmp_path / 'trace.json')
+    write_chrome_trace(path, trace)
+    with open(path) as f:
+        events = json.load(f)['traceEvents']
+    spans = [x for x in events if x['ph'] == 'X']
+    samples = {x['name']: x for x in spans if x['cat'] == 'sample'}
+    assert set(samples) == {'contigs', 'reads'}
+    workers = {x['tid'] for x in events if x['name'] == 'thread_name'} - {run_profile.pid}
+    assert {x['tid'] for x in samples.values()} <= workers
+    for sample in samples.values():
+        stages = [x for x in spans if x['cat'] == 'stage' and x['tid'] == sample['tid']
+                  and sample['ts'] <= x['ts'] <= sample['ts'] + sample['dur']]
+        assert 'match' in {x['name'] for x in stages}
+    assert [x['name'] for x in spans if x['cat'] == 'stage' and x['tid'] == run_profile.pid] == ['subtyping']
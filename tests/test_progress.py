@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from bio_hansel.progress import ProgressState, ProgressMonitor, init_progress_worker, progress_iter, sample_progress, \
+    progress_message
+from bio_hansel.subtyper import subtyping_tasks, iter_subtyping_results, run_subtyping_task
+
+fastq = 'tests/data/SRR5646583_SMALL.fastq'
+fasta = 'tests/data/SRR1002850_SMALL.fasta.gz'
+
+
+class ListQueue(list):
+    def put(self, x):
+        self.append(x)
+
+
+def test_progress_iter_reports_parsed_records():
+    records = [('r1', 'ACGT'), ('r2', 'AC')]
+    assert progress_iter(records) is records
+    queue = ListQueue()
+    init_progress_worker(queue)
+    try:
+        with sample_progress('sample'):
+            assert list(progress_iter(iter(records))) == records
+    finally:
+        init_progress_worker(None)
+    assert [x[1:] for x in queue] == [('start', 'sample'), ('parsed', 2, 6), ('finish', 'sample')]
+    state = ProgressState(2, total_bytes=100, sample_bytes={'sample': 25})
+    for event in queue[:2]:
+        state.handle(event)
+    snapshot = state.snapshot()
+    assert snapshot['done_samples'] == 0
+    assert snapshot['eta'] is None
+    assert snapshot['workers'] == [(queue[0][0], 'sample', 2)]
+    assert 'running: sample' in progress_message(snapshot)
+    state.handle(queue[2])
+    snapshot = state.snapshot()
+    assert snapshot['done_samples'] == 1
+    # ETA from input bytes: 25 of 100 bytes done
+    assert abs(snapshot['eta'] - 3 * snapshot['elapsed']) < 1e-6
+    assert snapshot['workers'][0][1] is None
+
+
+def test_retried_samples_finish_once():
+    calls = []
+
+    def flaky(path, sample):
+        calls.append(path)
+        if len(calls) < 3:
+            raise ValueError('transient error')
+        return sample, None
+
+    def missing(path, sample):
+        calls.append(path)
+        raise FileNotFoundError(path)
+
+    queue = ListQueue()
+    init_progress_worker(queue)
+    try:
+        assert run_subtyping_task((flaky, ('flaky.fasta', 'flaky')), retries=2) == ('flaky', None)
+        # missing input files are not retried
+        with pytest.raises(FileNotFoundError):
+            run_subtyping_task((missing, ('missing.fasta', 'missing')), retries=2)
+    finally:
+        init_progress_worker(None)
+    assert calls == ['flaky.fasta'] * 3 + ['missing.fasta']
+    assert [x[1:] for x in queue] == [('start', 'flaky'), ('finish', 'flaky'),
+                                      ('start', 'missing'), ('finish', 'missing')]
+    state = ProgressState(2)
+    for event in queue:
+        state.handle(event)
+    assert state.snapshot()['done_samples'] == 2
+
+
+def test_progress_monitor(capsys):
+    tasks = subtyping_tasks(input_genomes=[(fasta, 'contigs')], reads=[([fastq], 'reads')], scheme='heidelberg')
+    for n_threads in [1, 2]:
+        with ProgressMonitor(len(tasks), mode='log', interval=60) as monitor:
+            results = list(iter_subtyping_results(tasks, n_threads, progress_queue=monitor.queue))
+        assert len(results) == 2
+        snapshot = monitor.state.snapshot()
+        assert snapshot['done_samples'] == 2
+        assert snapshot['reads_per_second'] > 0
+        assert '2/2 samples (100.0%)' in capsys.readouterr().err
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from bio_hansel.parsers import parse_fastq
+from bio_hansel.provisional import iter_provisional_calls, call_record
+from bio_hansel.qc.const import QC
+from bio_hansel.simulate import simulate_sample
+from bio_hansel.subtyper import Subtyper
+
+
+@pytest.fixture(scope='module')
+def simulated_reads(tmp_path_factory):
+    outputs = simulate_sample('heidelberg', '2.2.1.1.1', str(tmp_path_factory.mktemp('reads')),
+                              sample='sim',
+                              coverage=100,
+                              error_rate=0.002,
+                              seed=1)
+    return outputs['reads'][0]
+
+
+def test_provisional_calls_finalize_once_stable(simulated_reads):
+    subtyper = Subtyper('heidelberg')
+    calls = list(iter_provisional_calls(subtyper, simulated_reads, 'sim', interval_reads=1000, interval_seconds=None,
+                                        stable_calls=3))
+    assert [x.is_final for x in calls] == [False] * (len(calls) - 1) + [True]
+    assert [x.n_reads for x in calls] == [1000 * (i + 1) for i in range(len(calls))]
+    final = calls[-1]
+    assert final.is_stable
+    assert final.st.subtype == '2.2.1.1.1' and final.st.qc_status == QC.PASS
+    assert [x.st.subtype for x in calls[-3:]] == ['2.2.1.1.1'] * 3
+    # the call is made before all of the reads are read
+    assert final.n_reads < sum(1 for _ in parse_fastq(simulated_reads))
+    # early calls from too few reads fail QC
+    assert calls[0].st.qc_status != QC.PASS
+    record = call_record(final)
+    assert record['subtype'] == '2.2.1.1.1' and record['n_reads'] == final.n_reads and record['is_final']
+
+
+def test_provisional_calls_without_stable_call_subtype_all_reads(simulated_reads):
+    subtyper = Subtyper('heidelberg')
+    calls = list(iter_provisional_calls(subtyper, simulated_reads, 'sim', interval_reads=5000, interval_seconds=None,
+                                        stable_calls=1000))
+    final = calls[-1]
+    assert final.is_final and not final.is_stable
+    assert final.n_reads == sum(1 for _ in parse_fastq(simulated_reads))
+    st, df = subtyper.subtype_reads(simulated_reads, 'sim')
+    assert (final.st.subtype, final.st.qc_status, final.st.avg_kmer_coverage) == (st.subtype, st.qc_status,
+                                                                                  st.avg_kmer_coverage)
+    assert final.df.shape == df.shape
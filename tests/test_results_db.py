@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+
+from bio_hansel.output import summary_record
+from bio_hansel.results_db import ResultsDatabase, read_summary
+from bio_hansel.subtyper import subtype_reads, subtype_contigs
+
+fastq_heidelberg_pass = 'tests/data/SRR5646583_SMALL.fastq'
+fasta_gz_heidelberg_pass = 'tests/data/SRR1002850_SMALL.fasta.gz'
+
+
+def test_results_db_upsert(tmp_path):
+    db_path = str(tmp_path / 'results.sqlite')
+    st_reads, df_reads = subtype_reads(reads=fastq_heidelberg_pass, genome_name='reads', scheme='heidelberg')
+    st_contigs, df_contigs = subtype_contigs(fasta_path=fasta_gz_heidelberg_pass,
+                                             genome_name='contigs',
+                                             scheme='heidelberg')
+    with ResultsDatabase(db_path, samples_per_transaction=1) as db:
+        db.add(summary_record(st_reads), df_reads)
+        db.add(summary_record(st_contigs), df_contigs)
+    # re-running a sample replaces its previous results
+    with ResultsDatabase(db_path) as db:
+        db.add(summary_record(st_reads), df_reads)
+
+    df = read_summary(db_path)
+    assert sorted(df['sample']) == ['contigs', 'reads']
+    df = read_summary(db_path, sample='reads')
+    assert df['subtype'].tolist() == [st_reads.subtype]
+    assert df['qc_status'].tolist() == [st_reads.qc_status]
+    assert read_summary(db_path, subtype='not-a-subtype').shape[0] == 0
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute('SELECT run_id, n_samples FROM runs').fetchall() == [(1, 2), (2, 1)]
+        assert conn.execute('SELECT run_id FROM summary WHERE sample = "reads"').fetchall() == [(2,)]
+        n_kmer_hits = conn.execute('SELECT COUNT(*) FROM kmer_hits WHERE sample = "reads"').fetchone()[0]
+        assert n_kmer_hits == df_reads.shape[0]
+        indexes = {name for name, in conn.execute('SELECT name FROM sqlite_master WHERE type = "index"')}
+    assert {'summary_subtype', 'summary_scheme_version', 'kmer_hits_sample'} <= indexes
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+import random
+from timeit import default_timer as timer
+
+from bio_hansel.bundle import compile_scheme, load_scheme
+from bio_hansel.const import SCHEME_FASTAS
+from bio_hansel.parsers import parse_fasta
+from bio_hansel.scheme_stats import validate_scheme, profile_scheme, ERROR, WARNING
+from bio_hansel.subtype_stats import subtype_counts_from_kmers
+
+
+def synthetic_scheme_kmers(n_subtypes, k=33, seed=42):
+    """Scheme k-mers for a hierarchy of `n_subtypes` subtypes with one positive and one negative k-mer each"""
+    rng = random.Random(seed)
+    subtypes = ['1']
+    i = 0
+    while len(subtypes) < n_subtypes:
+        subtypes += [f'{subtypes[i]}.{j}' for j in range(1, 5)]
+        i += 1
+    kmers = []
+    for refposition, subtype in enumerate(subtypes[:n_subtypes], start=1):
+        seq = ''.join(rng.choice('ACGT') for _ in range(k))
+        kmers.append((f'{refposition}-{subtype}', seq))
+        kmers.append((f'negative{refposition}-{subtype}', seq[:k // 2] + ('A' if seq[k // 2] != 'A' else 'C')
+                      + seq[k // 2 + 1:]))
+    return kmers
+
+
+def naive_negative_kmer_counts(kmers):
+    neg = {}
+    for h, _ in kmers:
+        if h.startswith('negative'):
+            st = h.split('-')[1]
+            neg[st] = neg.get(st, 0) + 1
+    out = {}
+    for h, _ in kmers:
+        if h.startswith('negative'):
+            continue
+        st = h.split('-')[1]
+        parents = {'.'.join(st.split('.')[:i + 1]) for i in range(st.count('.') + 1)}
+        out[st] = sum(n for x, n in neg.items() if x not in parents)
+    return out
+
+
+def test_subtype_counts_negative_kmer_counts():
+    for scheme in ['heidelberg', 'typhi']:
+        kmers = list(parse_fasta(SCHEME_FASTAS[scheme]['file']))
+        counts = subtype_counts_from_kmers(kmers)
+        expected = naive_negative_kmer_counts(kmers)
+        assert {k: v.negative_kmer_count for k, v in counts.items()} == expected
+
+
+def test_compile_large_scheme():
+    kmers = synthetic_scheme_kmers(20000)
+    start = timer()
+    bundle = compile_scheme(kmers, scheme='synthetic')
+    assert timer() - start < 30
+    assert len(bundle.subtype_counts) == 20000
+    assert bundle.subtype_counts['1.1.1'].positive_kmer_count == 3
+    start = timer()
+    assert [x for x in validate_scheme(kmers) if x.level == ERROR] == []
+    summary, subtypes = profile_scheme(bundle)
+    assert timer() - start < 30
+    assert summary['n_subtypes'] == 20000
+    assert summary['n_refpositions'] == 20000
+    assert len(subtypes) == 20000
+
+
+def test_validate_scheme_issues():
+    kmers = synthetic_scheme_kmers(10)
+    assert validate_scheme(kmers) == []
+    bad = kmers + [('1-1', 'ACGT'),
+                   ('x-1', 'ACGT'),
+                   ('100-1.a', 'ACGT'),
+                   ('101-1', 'ACGZ'),
+                   ('102-1.9.9', 'ACGTAC'),
+                   ('negative103-1.2', 'TTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTN'),
+                   ('negative104-1.3', 'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA')]
+    issues = validate_scheme(bad, max_degenerate_kmers=10)
+    errors = {x.message.split(' (n=')[0]: x.kmers for x in issues if x.level == ERROR}
+    warnings = {x.message.split(' (n=')[0]: x.kmers for x in issues if x.level == WARNING}
+    assert errors['Duplicate k-mer headers'] == ['1-1']
+    assert any('x-1' in v for v in errors.values())
+    assert any('100-1.a' in v for v in errors.values())
+    assert any('101-1' in v for v in errors.values())
+    colliding = [v for k, v in errors.items() if k.startswith('K-mers with identical')][0]
+    assert colliding == ['negative103-1.2', 'negative104-1.3']
+    assert any('more than the maximum of 10' in x.message for x in issues)
+    assert any(x.message.startswith('K-mers are not all the same length') for x in issues)
+    assert warnings['Refpositions without both positive and negative k-mers'] == ['101', '102', '103', '104']
+    assert warnings['Subtypes without positive k-mers for their parent subtype'] == ['1.9.9']
+
+
+def test_validate_scheme_contained_kmers():
+    kmers = synthetic_scheme_kmers(10)
+    seq = dict(kmers)['2-1.1']
+    # a shorter k-mer within another k-mer and one within the reverse complement of a degenerate k-mer
+    contained = kmers + [('20-1.1.1', seq[5:25]),
+                         ('negative20-1.1.1', 'CCCCCCCCCCCCCCCCCCCC'),
+                         ('21-1.1.2', 'GGGGGGGGGGGGGGGGGGGGGGGGGGGGGGGGN')]
+    issues = validate_scheme(contained)
+    errors = {x.message.split(' (n=')[0]: x.kmers for x in issues if x.level == ERROR}
+    assert [v for k, v in errors.items() if k.startswith('K-mers with (non-degenerate) sequences contained')] == \
+        [['20-1.1.1', 'negative20-1.1.1']]
+    # k-mers of the same length are only reported as colliding
+    assert [x for x in validate_scheme(kmers + [('20-1.1.1', seq)]) if 'contained' in x.message] == []
+
+
+def test_profile_builtin_scheme():
+    summary, subtypes = profile_scheme(load_scheme('heidelberg'))
+    assert summary['n_kmers'] == summary['n_positive_kmers'] + summary['n_negative_kmers']
+    assert summary['n_subtypes'] == len(subtypes)
+    st = {x['subtype']: x for x in subtypes}
+    assert st['2']['depth'] == 1
+    assert st['2.2']['parent'] == '2'
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+import gc
+import shutil
+import threading
+import weakref
+
+import pytest
+
+from bio_hansel.const import SCHEME_FASTAS
+from bio_hansel.output import summary_record, summary_output_record
+from bio_hansel.server import SubtypingService, SubtypingHTTPServer, SubtypingUnixServer, SchemeCache, \
+    ServiceBusy, request_subtyping
+from bio_hansel.subtyper import subtype_reads, subtype_contigs
+
+fastq_heidelberg_pass = 'tests/data/SRR5646583_SMALL.fastq'
+fasta_gz_heidelberg_pass = 'tests/data/SRR1002850_SMALL.fasta.gz'
+
+
+@pytest.fixture(scope='module')
+def service():
+    with SubtypingService(n_workers=1, max_concurrent=2, preload=['heidelberg']) as service:
+        yield service
+
+
+def serve(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def test_subtype_over_http(service):
+    server = serve(SubtypingHTTPServer(0, service))
+    port = server.server_address[1]
+    try:
+        out = request_subtyping({'sample': 'reads', 'reads': [fastq_heidelberg_pass]}, port=port)
+        st, df = subtype_reads(reads=[fastq_heidelberg_pass], genome_name='reads', scheme='heidelberg')
+        exp_summary = summary_output_record(summary_record(st))
+        assert {k: out['summary'][k] for k in exp_summary} == exp_summary
+        assert sorted(x['kmername'] for x in out['kmer_results']) == sorted(df.kmername)
+
+        out = request_subtyping({'sample': 'contigs', 'contigs': fasta_gz_heidelberg_pass, 'kmer_results': False},
+                                port=port)
+        st, _ = subtype_contigs(fasta_path=fasta_gz_heidelberg_pass, genome_name='contigs', scheme='heidelberg')
+        assert out['summary']['subtype'] == st.subtype
+        assert out['summary']['qc_status'] == st.qc_status
+        assert 'kmer_results' not in out
+
+        with pytest.raises(RuntimeError, match='400'):
+            request_subtyping({'sample': 'missing', 'contigs': 'does-not-exist.fasta'}, port=port)
+        with pytest.raises(RuntimeError, match='400'):
+            request_subtyping({'sample': 'x', 'contigs': fasta_gz_heidelberg_pass,
+                               'subtyping_params': {'not_a_param': 1}}, port=port)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_subtype_over_unix_socket(service, tmp_path):
+    socket_path = str(tmp_path / 'hansel.sock')
+    server = serve(SubtypingUnixServer(socket_path, service))
+    try:
+        out = request_subtyping({'sample': 'contigs', 'contigs': fasta_gz_heidelberg_pass}, socket_path=socket_path)
+        assert out['summary']['sample'] == 'contigs'
+        assert out['summary']['qc_status'] == 'PASS'
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_service_concurrency_limit(service):
+    for _ in range(service.max_concurrent):
+        service._slots.acquire()
+    try:
+        with pytest.raises(ServiceBusy):
+            service.subtype({'sample': 'contigs', 'contigs': fasta_gz_heidelberg_pass})
+    finally:
+        for _ in range(service.max_concurrent):
+            service._slots.release()
+
+
+def test_scheme_cache_lru(tmp_path):
+    cache = SchemeCache(max_custom_schemes=1)
+    schemes = []
+    for i in range(2):
+        scheme = str(tmp_path / f'scheme{i}.fasta')
+        shutil.copy(SCHEME_FASTAS['heidelberg']['file'], scheme)
+        schemes.append(scheme)
+    loaded = cache.get(schemes[0])
+    assert cache.get(schemes[0]) is loaded
+    bundle = weakref.ref(loaded.subtyper.bundle)
+    del loaded
+    cache.get(schemes[1])
+    assert len(cache.custom) == 1
+    # the unloaded scheme is released rather than kept by another cache
+    gc.collect()
+    assert bundle() is None
+    assert cache.get(schemes[0]) is not cache.get(schemes[1])
+    assert cache.get('heidelberg') is cache.get('heidelberg')
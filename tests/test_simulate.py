@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from bio_hansel.const import SCHEME_FASTAS
+from bio_hansel.parsers import parse_fasta, parse_fastq
+from bio_hansel.qc.const import QC
+from bio_hansel.simulate import simulate_genome, simulate_reads, simulate_contigs, simulate_sample
+from bio_hansel.subtyper import Subtyper
+
+
+def test_simulate_genome():
+    kmers = list(parse_fasta(SCHEME_FASTAS['heidelberg']['file']))
+    genome = simulate_genome(kmers, '2.2.1.1.1', seed=1)
+    assert genome == simulate_genome(kmers, '2.2.1.1.1', seed=1)
+    assert dict(kmers)['21097-2.2.1.1.1'] in genome
+    assert dict(kmers)['negative21097-2.2.1.1.1'] not in genome
+    assert len(simulate_genome(kmers, '2.2.1.1.1', genome_size=100000, seed=1)) == 100000
+    with pytest.raises(ValueError):
+        simulate_genome(kmers, '99.1', seed=1)
+
+
+def test_simulate_reads_and_contigs():
+    genome = 'ACGT' * 1000
+    reads = list(simulate_reads(genome, coverage=10, read_length=100, seed=1))
+    assert len(reads) == 400
+    assert all(len(x) == 100 for x, in reads)
+    pairs = list(simulate_reads(genome, coverage=10, read_length=100, paired=True, seed=1))
+    assert len(pairs) == 200
+    assert all(len(x) == 2 for x in pairs)
+    contigs = simulate_contigs(genome, n_contigs=3)
+    assert ''.join(contigs) == genome
+    with_errors = ''.join(simulate_contigs(genome, n_contigs=1, error_rate=0.1, seed=1))
+    n_diff = sum(a != b for a, b in zip(genome, with_errors))
+    assert 200 < n_diff < 600
+
+
+@pytest.mark.parametrize('scheme,subtype', [('heidelberg', '2.2.1.1.1'),
+                                            ('enteritidis', '2.1.5.4.2'),
+                                            ('typhi', '2.3.2.1')])
+def test_subtype_simulated_sample(tmp_path, scheme, subtype):
+    outputs = simulate_sample(scheme, subtype, str(tmp_path),
+                              sample='sim',
+                              coverage=40,
+                              error_rate=0.002,
+                              paired=True,
+                              n_contigs=5,
+                              compress=True,
+                              seed=1)
+    assert len(outputs['reads']) == 2
+    assert sum(1 for _ in parse_fastq(outputs['reads'][0])) > 0
+    subtyper = Subtyper(scheme)
+    for st, _ in [subtyper.subtype_reads(outputs['reads'], 'sim'),
+                  subtyper.subtype_contigs(outputs['contigs'][0], 'sim')]:
+        assert st.subtype == subtype
+        assert st.qc_status == QC.PASS
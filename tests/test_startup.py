@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+import os
+import subprocess
+import sys
+
+from bio_hansel.const import SCHEME_FASTAS
+
+
+def imported_modules(code: str):
+    out = subprocess.run([sys.executable, '-c', f'{code}; import sys; print(" ".join(sys.modules))'],
+                         check=True,
+                         stdout=subprocess.PIPE,
+                         universal_newlines=True).stdout
+    return set(out.split())
+
+
+def test_cli_imports_are_deferred():
+    modules = imported_modules('import bio_hansel.main')
+    assert not {'pandas', 'numpy', 'rich', 'pkg_resources', 'ahocorasick'} & modules
+
+
+def test_subtyper_does_not_import_pkg_resources():
+    modules = imported_modules('import bio_hansel.subtyper')
+    assert not {'pkg_resources', 'rich'} & modules
+
+
+def test_builtin_scheme_files_exist():
+    for scheme in SCHEME_FASTAS.values():
+        assert os.path.isfile(scheme['file'])
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+from bio_hansel.main import stream_inputs
+from bio_hansel.output import summary_record
+from bio_hansel.subtyper import Subtyper, subtype_reads, subtype_contigs, subtyping_tasks, iter_subtyping_results, \
+    run_subtyping_task, is_failed_sample
+from bio_hansel.subtyping_params import SubtypingParams
+from bio_hansel.utils import group_fastqs
+
+fastq_heidelberg_pass = 'tests/data/SRR5646583_SMALL.fastq'
+fasta_gz_heidelberg_pass = 'tests/data/SRR1002850_SMALL.fasta.gz'
+fasta_gz_heidelberg_fail = 'tests/data/SRR6126859.fasta.gz'
+fasta_missing_levels = 'tests/data/fail-qc-missing-levels.fasta'
+
+
+def assert_same_results(a, b):
+    st_a, df_a = a
+    st_b, df_b = b
+    # scheme summary info is the same but set ordering may differ between worker processes
+    assert summary_record(st_a) == summary_record(st_b)
+    pd.testing.assert_frame_equal(df_a.reset_index(drop=True), df_b.reset_index(drop=True))
+
+
+def test_subtyper_expected_results():
+    subtyper = Subtyper('heidelberg')
+    # subtype, QC status, k-mers matching all, positive and subtype k-mers and k-mer results rows of each input
+    expected_reads = ('2.2.1.1.1.1', 'PASS', 202, 20, 2, 203)
+    expected_contigs = {fasta_gz_heidelberg_pass: ('2.2.2.2.1.4', 'PASS', 202, 17, 3, 202),
+                        fasta_gz_heidelberg_fail: ('1', 'FAIL', 150, 2, 2, 150)}
+
+    def summary(result):
+        st, df = result
+        return (st.subtype, st.qc_status, st.n_kmers_matching_all, st.n_kmers_matching_positive,
+                st.n_kmers_matching_subtype, df.shape[0])
+
+    for result in [subtyper.subtype_reads([fastq_heidelberg_pass], 'reads'),
+                   subtype_reads(reads=[fastq_heidelberg_pass], genome_name='reads', scheme='heidelberg')]:
+        assert summary(result) == expected_reads
+        st, df = result
+        assert df['freq'].sum() == 4327
+        assert abs(st.avg_kmer_coverage - 21.315) < 0.001
+    for fasta, expected in expected_contigs.items():
+        for result in [subtyper.subtype_contigs(fasta, 'contigs'),
+                       subtype_contigs(fasta_path=fasta, genome_name='contigs', scheme='heidelberg')]:
+            assert summary(result) == expected
+    st, _ = subtyper.subtype_contigs(fasta_gz_heidelberg_fail, 'contigs')
+    assert st.qc_message == 'FAIL: 25.74% missing kmers for subtype "1"; more than 5.00% missing kmer threshold'
+
+
+def test_subtyper_batch():
+    subtyper = Subtyper('heidelberg', scheme_name='hd')
+    input_genomes = [(fasta_gz_heidelberg_fail, 'fail'), (fasta_gz_heidelberg_pass, 'pass')]
+    reads = [([fastq_heidelberg_pass], 'reads')]
+    serial = subtyper.subtype_samples(input_genomes, reads)
+    parallel = subtyper.subtype_samples(input_genomes, reads, n_threads=2)
+    assert [st.sample for st, _ in parallel] == ['fail', 'pass', 'reads']
+    for a, b in zip(serial, parallel):
+        assert_same_results(a, b)
+    exp = subtype_contigs(fasta_path=fasta_gz_heidelberg_pass, genome_name='pass', scheme='heidelberg',
+                          scheme_name='hd')
+    assert_same_results(serial[1], exp)
+    assert {st.sample for st, _ in subtyper.iter_subtype_samples(input_genomes, n_threads=2)} == {'fail', 'pass'}
+
+
+def test_subtyper_threads():
+    subtyper = Subtyper('heidelberg')
+    with ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(lambda i: subtyper.subtype_contigs(fasta_gz_heidelberg_pass, f'contigs{i}'),
+                                    range(8)))
+    exp_st, _ = subtyper.subtype_contigs(fasta_gz_heidelberg_pass, 'contigs')
+    assert all(st.subtype == exp_st.subtype and st.qc_status == exp_st.qc_status for st, _ in results)
+
+
+def test_subtyper_with_options():
+    subtyper = Subtyper('heidelberg')
+    params = SubtypingParams(min_kmer_freq=1000)
+    strict = subtyper.with_options(subtyping_params=params, scheme_name='hd')
+    assert strict.automaton is subtyper.automaton
+    assert subtyper.scheme_name is None
+    assert_same_results(strict.subtype_reads(fastq_heidelberg_pass, 'reads'),
+                        subtype_reads(reads=fastq_heidelberg_pass, genome_name='reads', scheme='heidelberg',
+                                      scheme_name='hd', subtyping_params=params))
+
+
+def test_failed_samples_are_isolated(tmpdir):
+    corrupt = tmpdir.join('corrupt.fasta.gz')
+    corrupt.write('not gzipped')
+    missing = str(tmpdir.join('missing.fastq'))
+    tasks = subtyping_tasks(input_genomes=[(fasta_gz_heidelberg_pass, 'contigs'), (str(corrupt), 'corrupt')],
+                            reads=[([missing], 'missing')],
+                            scheme='heidelberg',
+                            scheme_name='heidelberg-custom')
+    with pytest.raises(OSError):
+        list(iter_subtyping_results(tasks))
+    for n_threads in [1, 2]:
+        results = {st.sample: (st, df) for st, df in iter_subtyping_results(tasks, n_threads, retries=1,
+                                                                            isolate_errors=True,
+                                                                            max_tasks_per_worker=1)}
+        assert results['contigs'][0].qc_status == 'PASS'
+        assert not is_failed_sample(results['contigs'][0])
+        for sample in ['corrupt', 'missing']:
+            st, df = results[sample]
+            assert is_failed_sample(st)
+            assert st.qc_status == 'FAIL'
+            assert st.scheme == 'heidelberg-custom'
+            assert df.shape[0] == 1 and df['qc_status'].iloc[0] == 'FAIL'
+        assert 'Could not decompress' in results['corrupt'][0].qc_message
+        assert results['missing'][0].file_path == [missing]
+
+
+def test_sample_timeout(tmpdir):
+    fifo = str(tmpdir.join('never-written.fastq'))
+    os.mkfifo(fifo)
+    tasks = subtyping_tasks(input_genomes=[], reads=[([fifo], 'hung')], scheme='heidelberg')
+    start = time.monotonic()
+    st, _ = run_subtyping_task(tasks[0], timeout=0.5, retries=1, isolate_errors=True)
+    assert 1.0 <= time.monotonic() - start < 5
+    assert 'SampleTimeout' in st.qc_message
+
+
+def test_stream_inputs(tmpdir, monkeypatch):
+    fifo = str(tmpdir.join('reads'))
+    os.mkfifo(fifo)
+
+    def write_fifo():
+        with open(fifo, 'w') as fout, open(fastq_heidelberg_pass) as fin:
+            shutil.copyfileobj(fin, fout)
+
+    writer = threading.Thread(target=write_fifo)
+    writer.start()
+    input_genomes, reads = stream_inputs([['-', 'fasta', 'stdin'], [fifo, 'fastq', 'fifo']])
+    assert input_genomes == [('-', 'stdin')] and reads == [([fifo], 'fifo')]
+    tasks = subtyping_tasks(input_genomes + [(fasta_missing_levels, 'contigs')],
+                            reads + [([fastq_heidelberg_pass], 'reads')],
+                            scheme='heidelberg')
+    with open(fasta_missing_levels) as stdin:
+        monkeypatch.setattr('sys.stdin', stdin)
+        # standard input is read by this process while worker processes subtype the other samples
+        results = {st.sample: (st, df) for st, df in iter_subtyping_results(tasks, n_threads=2)}
+    writer.join()
+    for stream, sample in [('stdin', 'contigs'), ('fifo', 'reads')]:
+        st, df = results[stream]
+        exp_st, exp_df = results[sample]
+        assert (st.subtype, st.qc_status, st.qc_message) == (exp_st.subtype, exp_st.qc_status, exp_st.qc_message)
+        assert st.is_fastq_input() == exp_st.is_fastq_input()
+        pd.testing.assert_frame_equal(df.drop(columns=['sample', 'file_path']).reset_index(drop=True),
+                                      exp_df.drop(columns=['sample', 'file_path']).reset_index(drop=True))
+    for streams in [[['-', 'fastq', 'a'], ['-', 'fastq', 'b']],
+                    [['-', 'sam', 'a']],
+                    [[str(tmpdir.join('missing')), 'fastq', 'a']],
+                    [[fifo, 'fasta', 'a'], [fifo, 'fastq', 'a']]]:
+        with pytest.raises(ValueError):
+            stream_inputs(streams)
+
+
+def test_multi_lane_fastqs_are_one_sample(tmpdir):
+    with open(fastq_heidelberg_pass) as f:
+        lines = f.readlines()
+    n = len(lines) // 8 * 4
+    fastqs = []
+    for lane, (start, end) in enumerate([(0, n), (n, len(lines))], start=1):
+        for read in ['R1', 'R2']:
+            path = tmpdir.join(f'reads_S3_L00{lane}_{read}_001.fastq')
+            path.write(''.join(lines[start:end]) if read == 'R1' else '')
+            fastqs.append(str(path))
+    fastqs.append(str(tmpdir.join('reads_S3_L001_I1_001.fastq')))
+    grouped = group_fastqs(fastqs[::-1] + [str(tmpdir.join('other_1.fq')), str(tmpdir.join('other_2.fq'))])
+    assert grouped == [(fastqs[:4], 'reads'),
+                       ([str(tmpdir.join('other_1.fq')), str(tmpdir.join('other_2.fq'))], 'other')]
+    st, df = subtype_reads(reads=fastqs[:4], genome_name='reads', scheme='heidelberg')
+    exp_st, exp_df = subtype_reads(reads=[fastq_heidelberg_pass], genome_name='reads', scheme='heidelberg')
+    assert (st.subtype, st.avg_kmer_coverage, st.qc_status) == (exp_st.subtype, exp_st.avg_kmer_coverage,
+                                                                exp_st.qc_status)
+    pd.testing.assert_frame_equal(df.drop(columns='file_path'), exp_df.drop(columns='file_path'))
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+from bio_hansel.profiling import input_bytes
+from bio_hansel.utils import scan_directory, collect_inputs_from_dir, collect_fasta_from_dir, collect_fastq_from_dir
+
+
+@pytest.fixture
+def input_tree(tmpdir):
+    files = {'top.fasta': 'ACGT',
+             'top_1.fastq': '@r\nACGT\n+\nIIII\n',
+             'top_2.fastq': '',
+             'notes.txt': 'not an input',
+             'run1/Sample1/Sample1_S1_L001_R1_001.fastq.gz': 'x' * 10,
+             'run1/Sample1/Sample1_S1_L001_R2_001.fastq.gz': 'x' * 20,
+             'run1/Sample1/Sample1_S1_L001_I1_001.fastq.gz': '',
+             'run2/Sample1/Sample1_S1_L002_R1_001.fastq.gz': 'x' * 30,
+             'run2/Undetermined/Undetermined_S0_L001_R1_001.fastq.gz': '',
+             'run2/assemblies/genome.fna.gz': 'x' * 5, }
+    for path, content in files.items():
+        p = tmpdir.join(*path.split('/'))
+        p.dirpath().ensure(dir=True)
+        p.write(content)
+    os.symlink(str(tmpdir.join('run1')), str(tmpdir.join('run1-link')))
+    return str(tmpdir)
+
+
+def test_scan_directory(input_tree):
+    top = scan_directory(input_tree)
+    assert sorted(os.path.relpath(x, input_tree) for x in top) == ['notes.txt', 'top.fasta', 'top_1.fastq',
+                                                                   'top_2.fastq']
+    assert top[os.path.join(input_tree, 'top.fasta')] == 4
+    for n_threads in [1, 4]:
+        found = scan_directory(input_tree, recursive=True, include=['*.gz'], exclude=['Undetermined', 'run1/*/*_I1_*'],
+                               n_threads=n_threads)
+        # symbolic links to directories are not followed
+        assert [os.path.relpath(x, input_tree) for x in found] == ['run1/Sample1/Sample1_S1_L001_R1_001.fastq.gz',
+                                                                   'run1/Sample1/Sample1_S1_L001_R2_001.fastq.gz',
+                                                                   'run2/Sample1/Sample1_S1_L002_R1_001.fastq.gz',
+                                                                   'run2/assemblies/genome.fna.gz']
+        assert list(found.values()) == [10, 20, 30, 5]
+
+
+def test_collect_inputs_from_dir(input_tree):
+    input_genomes, reads, file_sizes = collect_inputs_from_dir(input_tree, recursive=True, exclude=['Undetermined*'])
+    assert input_genomes == [(os.path.join(input_tree, 'run2', 'assemblies', 'genome.fna.gz'), 'genome'),
+                             (os.path.join(input_tree, 'top.fasta'), 'top')]
+    assert [(len(paths), genome_name) for paths, genome_name in reads] == [(3, 'Sample1'), (2, 'top')]
+    assert input_bytes(reads[0][0], file_sizes) == 60
+    # flat directory collection is unchanged
+    assert collect_fasta_from_dir(input_tree) == [(os.path.join(input_tree, 'top.fasta'), 'top')]
+    assert collect_fastq_from_dir(input_tree) == [([os.path.join(input_tree, 'top_1.fastq'),
+                                                    os.path.join(input_tree, 'top_2.fastq')], 'top')]
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import shutil
+
+import pandas as pd
+
+from bio_hansel.output import SummaryTsvAppender, KmerResultsTsvAppender
+from bio_hansel.subtyper import Subtyper
+from bio_hansel.watch import InputWatcher, watch_directory, summary_samples
+
+fasta = 'tests/data/fail-qc-missing-levels.fasta'
+
+
+def test_input_watcher_waits_for_complete_samples(tmpdir):
+    watcher = InputWatcher(str(tmpdir), settle_seconds=30)
+    r1 = tmpdir.join('sample_S1_L001_R1_001.fastq')
+    r1.write('@r\nACGT\n')
+    tmpdir.join('notes.txt').write('not an input')
+    assert watcher.poll(now=0) == []
+    assert watcher.n_pending == 1
+    # still being written
+    r1.write('+\nIIII\n', mode='a')
+    assert watcher.poll(now=20) == []
+    # the R2 reads arriving restarts the settle period of the sample
+    r2 = tmpdir.join('sample_S1_L001_R2_001.fastq')
+    r2.write('@r\nACGT\n+\nIIII\n')
+    assert watcher.poll(now=55) == []
+    tasks = watcher.poll(now=90)
+    assert tasks == [('subtype_reads', [str(r1), str(r2)], 'sample')]
+    assert watcher.n_pending == 0
+    # samples are only subtyped once
+    tmpdir.join('sample_S1_L002_R1_001.fastq').write('@r\nACGT\n+\nIIII\n')
+    assert watcher.poll(now=200) == []
+    assert watcher.poll(now=300) == []
+    # empty files may not have been written yet
+    tmpdir.join('contigs.fasta').write('')
+    watcher.skip(['skipped'])
+    tmpdir.join('skipped.fasta').write('>1\nACGT\n')
+    assert watcher.poll(now=400) == [] and watcher.poll(now=500) == []
+    assert watcher.n_pending == 1
+
+
+def test_watch_directory_appends_to_rolling_outputs(tmpdir):
+    indir = tmpdir.mkdir('in')
+    summary_path = str(tmpdir.join('summary.tsv'))
+    kmer_path = str(tmpdir.join('kmers.tsv'))
+    shutil.copyfile(fasta, str(indir.join('a.fasta')))
+    subtyper = Subtyper('heidelberg')
+
+    def watch(n_threads):
+        watcher = InputWatcher(str(indir), settle_seconds=0)
+        watcher.skip(summary_samples(summary_path))
+        writers = [SummaryTsvAppender(summary_path), KmerResultsTsvAppender(kmer_path)]
+        try:
+            return watch_directory(watcher, subtyper, writers, n_threads=n_threads, poll_seconds=0.05,
+                                   idle_exit_seconds=0.2)
+        finally:
+            for writer in writers:
+                writer.close()
+
+    assert summary_samples(summary_path) == []
+    assert watch(1) == 1
+    # samples already in the rolling summary are not subtyped again
+    shutil.copyfile(fasta, str(indir.join('b.fasta')))
+    indir.join('c.fasta').write('not a fasta file')
+    assert watch(2) == 2
+    df = pd.read_csv(summary_path, sep='\t')
+    assert sorted(df['sample']) == ['a', 'b', 'c']
+    expected, _ = subtyper.subtype_contigs(fasta, 'a')
+    assert set(df[df['sample'] != 'c']['subtype']) == {expected.subtype}
+    assert df[df['sample'] == 'c']['qc_status'].tolist() == ['FAIL']
+    dfkmers = pd.read_csv(kmer_path, sep='\t')
+    assert set(dfkmers['sample']) == {'a', 'b', 'c'}
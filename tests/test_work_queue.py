@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import os
+import stat
+import sys
+import threading
+import time
+from multiprocessing import Process
+from multiprocessing import AuthenticationError
+
+import pytest
+
+from bio_hansel.work_queue import WorkQueue, WorkQueueClient, Coordinator, run_worker, read_authkey, write_authkey, \
+    AUTHKEY_ENV
+from bio_hansel.subtyper import subtype_reads, subtype_contigs
+
+fastq = 'tests/data/SRR5646583_SMALL.fastq'
+fasta = 'tests/data/SRR1002850_SMALL.fasta.gz'
+
+
+def test_leases_are_requeued():
+    queue = WorkQueue([(fasta, 'contigs')], [([fastq], 'reads')], scheme='heidelberg', lease_seconds=0.2,
+                      max_attempts=2)
+    contigs = queue.lease('a')
+    assert contigs.sample == 'contigs' and contigs.contigs == fasta
+    reads = queue.lease('b')
+    assert reads.sample == 'reads' and reads.reads == [fastq]
+    assert queue.lease('c') is None
+    assert queue.renew('a', contigs.task_id)
+    assert not queue.renew('b', contigs.task_id)
+    queue.fail('b', reads.task_id, 'error')
+    assert queue.status()['pending'] == 1
+    assert queue.lease('c').task_id == reads.task_id
+    # the lease of "c" expires and "reads" has been attempted the maximum number of times
+    time.sleep(0.3)
+    assert queue.lease('d').task_id == contigs.task_id
+    assert queue.status() == dict(samples=2, completed=0, failed=1, leased=1, pending=0, workers=4)
+    assert not queue.is_done()
+    assert queue.complete('d', contigs.task_id, {'sample': 'contigs'}, None)
+    # a late result from an expired lease is not accepted twice
+    assert not queue.complete('a', contigs.task_id, {'sample': 'contigs'}, None)
+    assert queue.is_done()
+
+
+@pytest.mark.parametrize('n_workers', [1, 2])
+def test_coordinator_and_workers(n_workers):
+    queue = WorkQueue([(fasta, 'contigs')], [([fastq], 'reads1'), ([fastq], 'reads2')], scheme='heidelberg',
+                      lease_seconds=1.0)
+    # a worker that died while subtyping; its sample is re-queued once its lease expires
+    lost = queue.lease('lost')
+    stdout, stderr = sys.stdout, sys.stderr
+    with Coordinator(queue, port=0) as coordinator:
+        workers = [Process(target=run_worker, args=(coordinator.address, coordinator.authkey))
+                   for _ in range(n_workers)]
+        for p in workers:
+            p.start()
+        coordinator.wait(interval=0.1)
+        results = coordinator.results()
+        for p in workers:
+            p.join()
+    # the server stops cleanly without resetting the stdio of the coordinator process
+    assert 'work-queue-server' not in [x.name for x in threading.enumerate()]
+    assert (sys.stdout, sys.stderr) == (stdout, stderr)
+    assert [summary['sample'] for summary, _ in results] == ['contigs', 'reads1', 'reads2']
+    assert queue.items[lost.task_id].attempts == 2
+    st, df = subtype_contigs(fasta_path=fasta, genome_name='contigs', scheme='heidelberg')
+    assert results[0][0]['subtype'] == st.subtype
+    assert sorted(results[0][1].kmername) == sorted(df.kmername)
+    st, df = subtype_reads(reads=[fastq], genome_name='reads1', scheme='heidelberg')
+    assert results[1][0]['subtype'] == st.subtype
+    assert results[1][0]['qc_status'] == st.qc_status
+
+
+def test_failed_samples_are_reported(tmpdir):
+    missing = str(tmpdir.join('missing.fasta'))
+    queue = WorkQueue([(missing, 'missing'), (fasta, 'contigs')], [], scheme='heidelberg', max_attempts=2)
+    with Coordinator(queue, port=0) as coordinator:
+        worker = Process(target=run_worker, args=(coordinator.address, coordinator.authkey))
+        worker.start()
+        coordinator.wait(interval=0.1)
+        results = coordinator.results()
+        worker.join()
+    assert queue.items[0].attempts == 2
+    assert [(x['sample'], x['qc_status']) for x, _ in results] == [('missing', 'FAIL'), ('contigs', 'PASS')]
+    assert 'does not exist' in results[0][0]['qc_message']
+
+
+def test_authkey(tmpdir, monkeypatch):
+    monkeypatch.delenv(AUTHKEY_ENV, raising=False)
+    path = str(tmpdir.join('authkey'))
+    assert read_authkey(None, path) is None
+    queue = WorkQueue([(fasta, 'contigs')], [], scheme='heidelberg')
+    with Coordinator(queue, port=0) as coordinator, Coordinator(queue, port=0) as other:
+        # coordinators generate a random authkey
+        assert len(coordinator.authkey) == 32 and coordinator.authkey != other.authkey
+        with pytest.raises(AuthenticationError):
+            run_worker(coordinator.address, other.authkey)
+        # the coordinator still accepts workers with its authkey after rejecting a connection
+        client = WorkQueueClient(address=coordinator.address, authkey=coordinator.authkey.encode())
+        client.connect()
+        assert client.get_queue().status()['samples'] == 1
+    write_authkey(coordinator.authkey, path)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert read_authkey(None, path) == coordinator.authkey
+    monkeypatch.setenv(AUTHKEY_ENV, 'env')
+    assert read_authkey(None, path) == 'env'
+    assert read_authkey('arg', path) == 'arg'